@@ -7,12 +7,15 @@ import sys
 from utils.file_handler import FileHandler
 from utils.password_utils import PasswordUtils
 from auth.session import SessionManager
+from utils.metrics import AUTH_ATTEMPTS
+from utils.audit_log import AuditLogger
 
 class LoginManager:
     """Manages user login operations"""
     
     def __init__(self):
         self.session_manager = SessionManager()
+        self.audit_logger = AuditLogger()
     
     def login(self):
         """Handle user login process"""
@@ -69,6 +72,8 @@ class LoginManager:
             users_data = FileHandler.load_users()
             
             if username not in users_data:
+                AUTH_ATTEMPTS.labels('unknown_user').inc()
+                self.audit_logger.log('login', username, outcome='failure', reason='unknown_user')
                 return False
             
             user_data = users_data[username]
@@ -76,10 +81,16 @@ class LoginManager:
             
             if PasswordUtils.verify_password(password, stored_hash):
                 self.session_manager.create_session(username, user_data)
+                AUTH_ATTEMPTS.labels('success').inc()
+                self.audit_logger.log('login', username)
                 return True
             
+            AUTH_ATTEMPTS.labels('failure').inc()
+            self.audit_logger.log('login', username, outcome='failure', reason='bad_password')
             return False
             
         except Exception as e:
+            AUTH_ATTEMPTS.labels('error').inc()
+            self.audit_logger.log('login', username, outcome='error', reason=str(e))
             print(f"❌ Authentication error: {e}")
             return False
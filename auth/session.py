@@ -19,7 +19,8 @@ class SessionManager:
             'username': username,
             'name': user_data['name'],
             'balance': user_data['balance'],
-            'account_status': user_data.get('account_status', 'active')
+            'account_status': user_data.get('account_status', 'active'),
+            'currency': user_data.get('currency', 'USD')
         }
     
     def get_current_user(self):
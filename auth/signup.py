@@ -4,12 +4,29 @@ Signup Manager - Handles new user registration
 
 import getpass
 import re
-from utils.file_handler import FileHandler
+from utils.file_handler import FileHandler, exclusive_write
 from utils.password_utils import PasswordUtils
+from utils.metrics import BANKING_OPERATIONS
+from utils.audit_log import AuditLogger
+from utils.change_feed import ChangeFeed
+from banking.recipient_index import RecipientIndex
+from banking.vault import ClosedAccountVault
+from banking.currency import FXRateTable
+from banking.account_table import AccountTable
+from banking.sub_accounts import SubAccountManager
 
 class SignupManager:
     """Manages user registration operations"""
     
+    # Compiled once at import; bulk import validates every row with these
+    USERNAME_PATTERN = re.compile(r"^[a-zA-Z0-9_]+$")
+    # Longest username whose sub-account ledger names still fit the account table
+    USERNAME_MAX_LENGTH = AccountTable.NAME_BYTES - len(SubAccountManager.SEPARATOR) - SubAccountManager.ID_MAX_LENGTH
+    NAME_PATTERN = re.compile(r"^[a-zA-Z\s]+$")
+    LETTER_PATTERN = re.compile(r"[A-Za-z]")
+    DIGIT_PATTERN = re.compile(r"\d")
+    MIN_DEPOSIT = 10  # Minimum opening deposit in dollars, converted for other currencies
+    
     def signup(self):
         """Handle user registration process"""
         print("\n📝 CREATE NEW ACCOUNT")
@@ -25,7 +42,7 @@ class SignupManager:
             if self._create_account(user_data):
                 print("✅ Account created successfully!")
                 print(f"Welcome to Secure Bank, {user_data['name']}!")
-                print(f"Your initial balance: ${user_data['balance']:.2f}")
+                print(f"Your initial balance: {FXRateTable.format(user_data['balance'], user_data['currency'])}")
                 return True
             else:
                 print("❌ Failed to create account. Please try again.")
@@ -82,15 +99,22 @@ class SignupManager:
                 continue
             break
         
+        # Account currency, offered when the rate file lists more than one
+        currency = FXRateTable.DEFAULT_CURRENCY
+        currencies = FXRateTable().current().currencies()
+        while len(currencies) > 1:
+            currency = input(f"Account currency ({', '.join(currencies)}) [{FXRateTable.DEFAULT_CURRENCY}]: "
+                             ).strip().upper() or FXRateTable.DEFAULT_CURRENCY
+            if self._report(self.currency_error(currency)):
+                break
+        
         # Initial deposit
         while True:
             try:
-                deposit = float(input("Initial deposit amount ($): "))
-                if deposit < 0:
-                    print("❌ Initial deposit cannot be negative.")
-                    continue
-                if deposit < 10:
-                    print("❌ Minimum initial deposit is $10.00.")
+                deposit = float(input(f"Initial deposit amount ({currency}): "))
+                error = self.deposit_error(deposit, currency)
+                if error:
+                    print(f"❌ {error}")
                     continue
                 break
             except ValueError:
@@ -101,54 +125,98 @@ class SignupManager:
             'username': username,
             'name': name,
             'password': password,
-            'balance': deposit
+            'balance': deposit,
+            'currency': currency
         }
     
     def _validate_username(self, username):
         """Validate username format"""
-        if len(username) < 3:
-            print("❌ Username must be at least 3 characters long.")
-            return False
-        if not re.match("^[a-zA-Z0-9_]+$", username):
-            print("❌ Username can only contain letters, numbers, and underscores.")
-            return False
-        return True
+        return self._report(self.username_error(username))
     
     def _validate_name(self, name):
         """Validate full name"""
-        if len(name.strip()) < 2:
-            print("❌ Name must be at least 2 characters long.")
-            return False
-        if not re.match("^[a-zA-Z\s]+$", name):
-            print("❌ Name can only contain letters and spaces.")
-            return False
-        return True
+        return self._report(self.name_error(name))
     
     def _validate_password(self, password):
         """Validate password strength"""
-        if len(password) < 6:
-            print("❌ Password must be at least 6 characters long.")
-            return False
-        if not re.search(r"[A-Za-z]", password):
-            print("❌ Password must contain at least one letter.")
-            return False
-        if not re.search(r"\d", password):
-            print("❌ Password must contain at least one number.")
+        return self._report(self.password_error(password))
+    
+    @staticmethod
+    def _report(error):
+        """Print a validation error; True when there is none"""
+        if error:
+            print(f"❌ {error}")
             return False
         return True
     
+    @classmethod
+    def username_error(cls, username):
+        """Why a username is invalid, or None (shared with bulk import)"""
+        if len(username) < 3:
+            return "Username must be at least 3 characters long."
+        if len(username) > cls.USERNAME_MAX_LENGTH:
+            return f"Username must be at most {cls.USERNAME_MAX_LENGTH} characters long."
+        if not cls.USERNAME_PATTERN.match(username):
+            return "Username can only contain letters, numbers, and underscores."
+        return None
+    
+    @classmethod
+    def name_error(cls, name):
+        """Why a full name is invalid, or None"""
+        if len(name.strip()) < 2:
+            return "Name must be at least 2 characters long."
+        if not cls.NAME_PATTERN.match(name):
+            return "Name can only contain letters and spaces."
+        return None
+    
+    @classmethod
+    def password_error(cls, password):
+        """Why a password is too weak, or None"""
+        if len(password) < 6:
+            return "Password must be at least 6 characters long."
+        if not cls.LETTER_PATTERN.search(password):
+            return "Password must contain at least one letter."
+        if not cls.DIGIT_PATTERN.search(password):
+            return "Password must contain at least one number."
+        return None
+    
+    @staticmethod
+    def currency_error(currency):
+        """Why an account cannot be opened in a currency, or None"""
+        currencies = FXRateTable().current().currencies()
+        if currency not in currencies:
+            return f"Currency must be one of: {', '.join(currencies)}."
+        return None
+    
+    @classmethod
+    def deposit_error(cls, deposit, currency=None):
+        """Why an initial deposit in currency is not allowed, or None"""
+        if deposit < 0:
+            return "Initial deposit cannot be negative."
+        minimum = FXRateTable().threshold(cls.MIN_DEPOSIT, currency)
+        if deposit < minimum:
+            return f"Minimum initial deposit is {FXRateTable.format(minimum, currency)}."
+        return None
+    
     def _username_exists(self, username):
         """Check if username already exists"""
         try:
             users_data = FileHandler.load_users()
-            return username in users_data
+            # Compacted accounts keep their usernames through the vault's tombstones
+            return username in users_data or ClosedAccountVault.is_reserved(username)
         except:
             return False
     
+    @exclusive_write
     def _create_account(self, user_data):
         """Create new user account"""
         try:
             users_data = FileHandler.load_users()
+            if user_data['username'] in users_data:
+                # Taken by another signup since the name was checked
+                BANKING_OPERATIONS.labels('signup', 'rejected').inc()
+                print("❌ Username already exists. Please choose another.")
+                return False
             
             # Hash password
             password_hash = PasswordUtils.hash_password(user_data['password'])
@@ -158,14 +226,12 @@ class SignupManager:
                 'name': user_data['name'],
                 'password_hash': password_hash,
                 'balance': user_data['balance'],
+                'currency': user_data['currency'],
                 'account_status': 'active',
                 'created_at': FileHandler.get_current_timestamp(),
                 'transactions': []
             }
             
-            # Save to file
-            FileHandler.save_users(users_data)
-            
             # Log initial deposit transaction
             if user_data['balance'] > 0:
                 transaction = {
@@ -176,10 +242,22 @@ class SignupManager:
                     'balance_after': user_data['balance']
                 }
                 users_data[user_data['username']]['transactions'].append(transaction)
-                FileHandler.save_users(users_data)
             
+            # Save to file (record and initial deposit commit together)
+            if not FileHandler.save_users(users_data):
+                BANKING_OPERATIONS.labels('signup', 'error').inc()
+                return False
+            
+            BANKING_OPERATIONS.labels('signup', 'success').inc()
+            ChangeFeed().publish('signup', [user_data['username']], balance_after=user_data['balance'],
+                                 timestamp=users_data[user_data['username']]['created_at'])
+            RecipientIndex().add(user_data['username'], user_data['name'])
+            AuditLogger().log('signup', user_data['username'], amount=user_data['balance'],
+                              balance_before=0, balance_after=user_data['balance'])
             return True
             
         except Exception as e:
+            BANKING_OPERATIONS.labels('signup', 'error').inc()
+            AuditLogger().log('signup', user_data['username'], outcome='error', reason=str(e))
             print(f"❌ Error creating account: {e}")
             return False
@@ -3,15 +3,29 @@ Account Manager - Handles basic account operations
 """
 
 import getpass
-from utils.file_handler import FileHandler
+import time
+from utils.file_handler import FileHandler, exclusive_write
 from utils.password_utils import PasswordUtils
 from auth.session import SessionManager
+from utils.metrics import BANKING_AMOUNT, BANKING_OPERATIONS, BANKING_SECONDS
+from utils.audit_log import AuditLogger
+from utils.change_feed import ChangeFeed
+from banking.limits import LimitManager
+from banking.account_table import AccountTable
+from banking.holds import HoldManager
+from banking.currency import FXRateTable
+from banking.recipient_index import RecipientIndex
 
 class AccountManager:
     """Manages basic account operations"""
     
+    MAX_DEPOSIT = 10000  # Per-transaction deposit limit (dollars, converted for other currencies)
+    MAX_WITHDRAWAL = 5000  # Per-transaction withdrawal limit (dollars, converted for other currencies)
+    
     def __init__(self):
         self.session_manager = SessionManager()
+        self.audit_logger = AuditLogger()
+        self.limit_manager = LimitManager()
     
     def check_balance(self):
         """Display current account balance"""
@@ -21,14 +35,21 @@ class AccountManager:
                 print("❌ Please log in first.")
                 return
             
-            # Get fresh balance from file
-            users_data = FileHandler.load_users()
+            # Fresh balance from the account table; users.json is parsed only if the table is behind
             username = current_user['username']
-            balance = users_data[username]['balance']
+            record = AccountTable.lookup(username)
+            if record is None:
+                user_data = AccountTable.load_users()[username]
+                record = {'balance': user_data['balance'], 'held': user_data.get('held_total', 0.0)}
+            balance = record['balance']
+            currency = current_user.get('currency')
             
             print(f"\n💰 ACCOUNT BALANCE")
             print("-" * 25)
-            print(f"Current Balance: ${balance:.2f}")
+            print(f"Current Balance: {FXRateTable.format(balance, currency)}")
+            if record['held']:
+                print(f"On Hold: {FXRateTable.format(record['held'], currency)}")
+                print(f"Available: {FXRateTable.format(balance - record['held'], currency)}")
             print("-" * 25)
             
             # Update session balance
@@ -48,14 +69,24 @@ class AccountManager:
             print(f"\n💵 DEPOSIT MONEY")
             print("-" * 20)
             
+            users_data = FileHandler.load_users()
+            user_data = users_data[current_user['username']]
+            
+            currency = FXRateTable.currency_of(user_data)
+            max_deposit = FXRateTable().threshold(self.MAX_DEPOSIT, currency)
             while True:
                 try:
-                    amount = float(input("Enter deposit amount ($): "))
+                    amount = float(input(f"Enter deposit amount ({currency}): "))
                     if amount <= 0:
                         print("❌ Deposit amount must be positive.")
                         continue
-                    if amount > 10000:
-                        print("❌ Maximum deposit limit is $10,000 per transaction.")
+                    if amount > max_deposit:
+                        print(f"❌ Maximum deposit limit is "
+                              f"{FXRateTable.format(max_deposit, currency)} per transaction.")
+                        continue
+                    allowed, message = self.limit_manager.check(user_data, 'deposit', amount)
+                    if not allowed:
+                        print(f"❌ {message}")
                         continue
                     break
                 except ValueError:
@@ -64,7 +95,7 @@ class AccountManager:
             
             # Process deposit
             if self._process_deposit(current_user['username'], amount):
-                print(f"✅ Successfully deposited ${amount:.2f}")
+                print(f"✅ Successfully deposited {FXRateTable.format(amount, current_user.get('currency'))}")
                 self.check_balance()
             else:
                 print("❌ Deposit failed. Please try again.")
@@ -86,21 +117,27 @@ class AccountManager:
             # Get current balance
             users_data = FileHandler.load_users()
             username = current_user['username']
-            current_balance = users_data[username]['balance']
+            current_balance = HoldManager.available_balance(users_data[username])
             
-            print(f"Available Balance: ${current_balance:.2f}")
+            print(f"Available Balance: {FXRateTable.format(current_balance, current_user.get('currency'))}")
             
+            max_withdrawal = FXRateTable().threshold(self.MAX_WITHDRAWAL, current_user.get('currency'))
             while True:
                 try:
-                    amount = float(input("Enter withdrawal amount ($): "))
+                    amount = float(input(f"Enter withdrawal amount ({current_user.get('currency', 'USD')}): "))
                     if amount <= 0:
                         print("❌ Withdrawal amount must be positive.")
                         continue
                     if amount > current_balance:
                         print("❌ Insufficient funds.")
                         continue
-                    if amount > 5000:
-                        print("❌ Maximum withdrawal limit is $5,000 per transaction.")
+                    if amount > max_withdrawal:
+                        print(f"❌ Maximum withdrawal limit is "
+                              f"{FXRateTable.format(max_withdrawal, current_user.get('currency'))} per transaction.")
+                        continue
+                    allowed, message = self.limit_manager.check(users_data[username], 'withdrawal', amount)
+                    if not allowed:
+                        print(f"❌ {message}")
                         continue
                     break
                 except ValueError:
@@ -109,7 +146,7 @@ class AccountManager:
             
             # Process withdrawal
             if self._process_withdrawal(username, amount):
-                print(f"✅ Successfully withdrew ${amount:.2f}")
+                print(f"✅ Successfully withdrew {FXRateTable.format(amount, current_user.get('currency'))}")
                 self.check_balance()
             else:
                 print("❌ Withdrawal failed. Please try again.")
@@ -140,6 +177,8 @@ class AccountManager:
             stored_hash = users_data[username]['password_hash']
             
             if not PasswordUtils.verify_password(current_password, stored_hash):
+                BANKING_OPERATIONS.labels('password_change', 'rejected').inc()
+                self.audit_logger.log('password_change', username, outcome='failure', reason='bad_password')
                 print("❌ Current password is incorrect.")
                 return
             
@@ -166,14 +205,26 @@ class AccountManager:
                     continue
                 break
             
-            # Update password
+            # Update password (reloaded under the writer lock, so changes made during the prompts are kept)
             new_hash = PasswordUtils.hash_password(new_password)
-            users_data[username]['password_hash'] = new_hash
-            FileHandler.save_users(users_data)
+            with FileHandler.writer_lock():
+                users_data = FileHandler.load_users()
+                users_data[username]['password_hash'] = new_hash
+                saved = FileHandler.save_users(users_data)
+            if not saved:
+                BANKING_OPERATIONS.labels('password_change', 'error').inc()
+                print("❌ Password was not changed. Please try again.")
+                return
+            ChangeFeed().publish('password_change', [username])
+            BANKING_OPERATIONS.labels('password_change', 'success').inc()
+            self.audit_logger.log('password_change', username)
             
             print("✅ Password changed successfully!")
             
         except Exception as e:
+            BANKING_OPERATIONS.labels('password_change', 'error').inc()
+            self.audit_logger.log('password_change', current_user['username'] if current_user else None,
+                                  outcome='error', reason=str(e))
             print(f"❌ Error changing password: {e}")
     
     def close_account(self):
@@ -201,24 +252,40 @@ class AccountManager:
             stored_hash = users_data[username]['password_hash']
             
             if not PasswordUtils.verify_password(password, stored_hash):
+                BANKING_OPERATIONS.labels('account_closure', 'rejected').inc()
+                self.audit_logger.log('account_closure', username, outcome='failure', reason='bad_password')
                 print("❌ Password verification failed.")
                 return False
             
-            # Close account
-            users_data[username]['account_status'] = 'closed'
-            users_data[username]['closed_at'] = FileHandler.get_current_timestamp()
-            
-            # Add closure transaction
-            transaction = {
-                'type': 'account_closure',
-                'amount': 0,
-                'description': 'Account closed by user',
-                'timestamp': FileHandler.get_current_timestamp(),
-                'balance_after': users_data[username]['balance']
-            }
-            users_data[username]['transactions'].append(transaction)
-            
-            FileHandler.save_users(users_data)
+            with FileHandler.writer_lock():
+                users_data = FileHandler.load_users()
+                
+                # Close account
+                users_data[username]['account_status'] = 'closed'
+                users_data[username]['closed_at'] = FileHandler.get_current_timestamp()
+                for record in users_data[username].get('sub_accounts', {}).values():
+                    record['account_status'] = 'closed'
+                
+                # Add closure transaction
+                transaction = {
+                    'type': 'account_closure',
+                    'amount': 0,
+                    'description': 'Account closed by user',
+                    'timestamp': FileHandler.get_current_timestamp(),
+                    'balance_after': users_data[username]['balance']
+                }
+                users_data[username]['transactions'].append(transaction)
+                saved = FileHandler.save_users(users_data)
+            if not saved:
+                BANKING_OPERATIONS.labels('account_closure', 'error').inc()
+                return False
+            ChangeFeed().publish('account_closure', [username], balance_after=users_data[username]['balance'],
+                                 timestamp=transaction['timestamp'])
+            BANKING_OPERATIONS.labels('account_closure', 'success').inc()
+            RecipientIndex().remove(username)
+            self.audit_logger.log('account_closure', username, amount=0,
+                                  balance_before=users_data[username]['balance'],
+                                  balance_after=users_data[username]['balance'])
             
             print("✅ Account closed successfully.")
             print("Thank you for banking with us!")
@@ -228,15 +295,29 @@ class AccountManager:
             return True
             
         except Exception as e:
+            BANKING_OPERATIONS.labels('account_closure', 'error').inc()
+            self.audit_logger.log('account_closure', current_user['username'] if current_user else None,
+                                  outcome='error', reason=str(e))
             print(f"❌ Error closing account: {e}")
             return False
     
+    @exclusive_write
     def _process_deposit(self, username, amount):
         """Process deposit transaction"""
+        started = time.perf_counter()
         try:
             users_data = FileHandler.load_users()
             
+            # Enforce rolling daily/monthly limits
+            allowed, message = self.limit_manager.check(users_data[username], 'deposit', amount)
+            if not allowed:
+                BANKING_OPERATIONS.labels('deposit', 'limit_exceeded').inc()
+                self.audit_logger.log('deposit', username, amount=amount, outcome='failure', reason='limit_exceeded')
+                print(f"❌ {message}")
+                return False
+            
             # Update balance
+            balance_before = users_data[username]['balance']
             users_data[username]['balance'] += amount
             new_balance = users_data[username]['balance']
             
@@ -249,25 +330,56 @@ class AccountManager:
                 'balance_after': new_balance
             }
             users_data[username]['transactions'].append(transaction)
+            self.limit_manager.record(users_data[username], 'deposit', amount)
             
             # Save changes
-            FileHandler.save_users(users_data)
+            if not FileHandler.save_users(users_data, changed=[username]):
+                BANKING_OPERATIONS.labels('deposit', 'error').inc()
+                return False
+            ChangeFeed().publish('deposit', [username], amount=amount, balance_after=new_balance,
+                                 timestamp=transaction['timestamp'])
             
             # Update session
             self.session_manager.update_session_balance(new_balance)
             
+            BANKING_OPERATIONS.labels('deposit', 'success').inc()
+            BANKING_AMOUNT.labels('deposit').inc(amount)
+            BANKING_SECONDS.labels('deposit').observe(time.perf_counter() - started)
+            self.audit_logger.log('deposit', username, amount=amount,
+                                  balance_before=balance_before, balance_after=new_balance)
             return True
             
         except Exception as e:
+            BANKING_OPERATIONS.labels('deposit', 'error').inc()
+            self.audit_logger.log('deposit', username, amount=amount, outcome='error', reason=str(e))
             print(f"❌ Deposit processing error: {e}")
             return False
     
+    @exclusive_write
     def _process_withdrawal(self, username, amount):
         """Process withdrawal transaction"""
+        started = time.perf_counter()
         try:
             users_data = FileHandler.load_users()
             
+            # Holds placed since the prompt may have reduced what is available
+            if amount > HoldManager.available_balance(users_data[username]):
+                BANKING_OPERATIONS.labels('withdrawal', 'insufficient_funds').inc()
+                self.audit_logger.log('withdrawal', username, amount=amount, outcome='failure',
+                                      reason='insufficient_funds')
+                print("❌ Insufficient available funds.")
+                return False
+            
+            # Enforce rolling daily/monthly limits
+            allowed, message = self.limit_manager.check(users_data[username], 'withdrawal', amount)
+            if not allowed:
+                BANKING_OPERATIONS.labels('withdrawal', 'limit_exceeded').inc()
+                self.audit_logger.log('withdrawal', username, amount=amount, outcome='failure', reason='limit_exceeded')
+                print(f"❌ {message}")
+                return False
+            
             # Update balance
+            balance_before = users_data[username]['balance']
             users_data[username]['balance'] -= amount
             new_balance = users_data[username]['balance']
             
@@ -280,15 +392,27 @@ class AccountManager:
                 'balance_after': new_balance
             }
             users_data[username]['transactions'].append(transaction)
+            self.limit_manager.record(users_data[username], 'withdrawal', amount)
             
             # Save changes
-            FileHandler.save_users(users_data)
+            if not FileHandler.save_users(users_data, changed=[username]):
+                BANKING_OPERATIONS.labels('withdrawal', 'error').inc()
+                return False
+            ChangeFeed().publish('withdrawal', [username], amount=amount, balance_after=new_balance,
+                                 timestamp=transaction['timestamp'])
             
             # Update session
             self.session_manager.update_session_balance(new_balance)
             
+            BANKING_OPERATIONS.labels('withdrawal', 'success').inc()
+            BANKING_AMOUNT.labels('withdrawal').inc(amount)
+            BANKING_SECONDS.labels('withdrawal').observe(time.perf_counter() - started)
+            self.audit_logger.log('withdrawal', username, amount=amount,
+                                  balance_before=balance_before, balance_after=new_balance)
             return True
             
         except Exception as e:
+            BANKING_OPERATIONS.labels('withdrawal', 'error').inc()
+            self.audit_logger.log('withdrawal', username, amount=amount, outcome='error', reason=str(e))
             print(f"❌ Withdrawal processing error: {e}")
             return False
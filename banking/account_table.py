@@ -0,0 +1,252 @@
+"""
+Account Table - Memory-mapped fixed-width balance records with a username hash index
+"""
+
+import mmap
+import os
+import struct
+import zlib
+from contextlib import contextmanager
+from utils.file_handler import FileHandler
+from utils.metrics import metrics
+from banking.sub_accounts import SubAccountManager
+
+try:
+    import fcntl
+except ImportError:  # No cross-process locking (e.g. Windows); a single writer process is assumed
+    fcntl = None
+
+TABLE_LOOKUPS = metrics.counter(
+    'securebank_account_table_lookups_total', "Account table reads by outcome", ('outcome',))
+TABLE_REBUILDS = metrics.counter(
+    'securebank_account_table_rebuilds_total', "Full rewrites of the account table")
+
+class AccountTable:
+    """Balances, statuses and ledger positions for every account in one mmap-able file
+
+    Layout: a 64-byte header, an open-addressing index of uint32 record numbers
+    (crc32 of the name, linear probing, at most half full), then fixed-width
+    records. The header carries the identity (inode, mtime, size) of the users.json
+    version the table matches; readers trust the table only while that is still
+    the current file, and fall back to users.json otherwise. Every save_users()
+    brings the table up to date, rewriting changed records in place.
+    """
+    
+    TABLE_FILE = "accounts.tbl"
+    LOCK_FILE = "accounts.tbl.lock"
+    MAGIC = b"SBAT"
+    FORMAT = 2
+    HEADER = struct.Struct("<4sHxxQQQQQ16x")       # magic, format, count, index slots, source identity
+    RECORD = struct.Struct("<48sqQQqB7x")          # name, balance cents, version, ledger offset, held cents, status
+    SLOT = struct.Struct("<I")                     # record number + 1, 0 when empty
+    NAME_BYTES = 48
+    MIN_SLOTS = 1024
+    STATUS_CODES = {'active': 1, 'closed': 2}
+    STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+    INVALID = (0, 0, 0)                            # Identity written while records are being changed
+    
+    @classmethod
+    def path(cls):
+        """Table file inside the current data directory"""
+        return os.path.join(FileHandler.DATA_DIR, cls.TABLE_FILE)
+    
+    @classmethod
+    def lookup(cls, name):
+        """Record for a ledger name as a dict, or None when the table is missing, stale or lacks it"""
+        try:
+            with open(cls.path(), 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as table:
+                    current = FileHandler.file_identity(FileHandler.USERS_FILE)
+                    if cls._header(table)[4] != current:
+                        TABLE_LOOKUPS.labels('stale').inc()
+                        return None
+                    record = cls._find(table, name)
+                    # A writer may have started changing records since the header was read
+                    if cls._header(table)[4] != current:
+                        TABLE_LOOKUPS.labels('stale').inc()
+                        return None
+        except (OSError, ValueError):
+            TABLE_LOOKUPS.labels('missing').inc()
+            return None
+        if record is None:
+            TABLE_LOOKUPS.labels('not_found').inc()
+            return None
+        TABLE_LOOKUPS.labels('hit').inc()
+        _, values = record
+        return {
+            'balance': values[1] / 100,
+            'version': values[2],
+            'ledger_offset': values[3],
+            'held': values[4] / 100,
+            'account_status': cls.STATUS_NAMES.get(values[5], 'unknown')
+        }
+    
+    @classmethod
+    def balance(cls, name):
+        """Balance for a ledger name from the table, or None if it has to come from users.json"""
+        record = cls.lookup(name)
+        return record['balance'] if record else None
+    
+    @classmethod
+    def sync(cls, users_data, replaced, committed, changed=None, load_all=None):
+        """Save listener: bring the table from version `replaced` to `committed` of users.json
+
+        When the table matched the replaced version, only changed records are
+        rewritten in place (just the names in `changed` when the caller says what
+        it touched). Otherwise, or when the table is full, it is rebuilt; callers
+        passing only the changed accounts supply load_all() for that.
+        """
+        with cls._locked():
+            if not cls._update(users_data, replaced, committed, changed):
+                cls.rebuild(load_all() if load_all else users_data, committed)
+    
+    @classmethod
+    def load_users(cls):
+        """Load users.json, rebuilding the table from it if it has fallen behind"""
+        exists = os.path.exists(FileHandler.USERS_FILE)
+        before = FileHandler.file_identity(FileHandler.USERS_FILE) if exists else None
+        users_data = FileHandler.load_users()
+        if before and before == FileHandler.file_identity(FileHandler.USERS_FILE):
+            with cls._locked():
+                cls.rebuild(users_data, before)
+        return users_data
+    
+    @classmethod
+    @contextmanager
+    def _locked(cls):
+        """Serialise table writers across processes"""
+        with open(os.path.join(FileHandler.DATA_DIR, cls.LOCK_FILE), 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    @classmethod
+    def _update(cls, users_data, replaced, committed, changed):
+        """In-place update; returns False when a rebuild is needed instead"""
+        try:
+            with open(cls.path(), 'r+b') as f, mmap.mmap(f.fileno(), 0) as table:
+                return cls._update_mapped(table, users_data, replaced, committed, changed)
+        except (OSError, ValueError):
+            return False
+    
+    @classmethod
+    def _update_mapped(cls, table, users_data, replaced, committed, changed):
+        """Apply changed records to an open table"""
+        _, _, count, slots, identity = cls._header(table)
+        if identity != replaced:
+            return False
+        capacity = (len(table) - cls.HEADER.size - slots * cls.SLOT.size) // cls.RECORD.size
+        if changed is None:
+            ledgers = SubAccountManager.ledgers(users_data)
+        else:
+            ledgers = []
+            for name in changed:
+                username, _, account_id = name.partition(SubAccountManager.SEPARATOR)
+                record = SubAccountManager.get_account(users_data.get(username, {}),
+                                                       account_id or SubAccountManager.PRIMARY)
+                if record is not None:
+                    ledgers.append((name, record))
+        if changed is None and len(ledgers) < count:
+            return False  # Accounts were removed
+        
+        cls._write_header(table, count, slots, cls.INVALID)
+        for name, record in ledgers:
+            values = cls._values(name, record)
+            found = cls._find(table, name)
+            if found is None:
+                if count >= capacity:
+                    return False  # Left INVALID; the rebuild replaces the file
+                cls._insert(table, slots, count, name)
+                cls._write_record(table, slots, count, values, 1)
+                count += 1
+                continue
+            number, stored = found
+            if stored[1:2] + stored[3:] != values[1:2] + values[3:]:
+                cls._write_record(table, slots, number, values, stored[2] + 1)
+        cls._write_header(table, count, slots, committed)
+        return True
+    
+    @classmethod
+    def rebuild(cls, users_data, committed):
+        """Write a fresh table for users_data, sized for growth, and swap it in"""
+        ledgers = SubAccountManager.ledgers(users_data)
+        slots = cls.MIN_SLOTS
+        while slots < len(ledgers) * 4:  # Index at most half full once records double
+            slots *= 2
+        capacity = slots // 2
+        size = cls.HEADER.size + slots * cls.SLOT.size + capacity * cls.RECORD.size
+        temp_file = f"{cls.path()}.{os.getpid()}.tmp"
+        with open(temp_file, 'w+b') as f:
+            f.truncate(size)
+            with mmap.mmap(f.fileno(), size) as table:
+                for number, (name, record) in enumerate(ledgers):
+                    cls._insert(table, slots, number, name)
+                    cls._write_record(table, slots, number, cls._values(name, record), 1)
+                cls._write_header(table, len(ledgers), slots, committed)
+        os.replace(temp_file, cls.path())
+        TABLE_REBUILDS.inc()
+    
+    @classmethod
+    def _values(cls, name, record):
+        """Fields stored for one ledger"""
+        encoded = name.encode('utf-8')
+        if len(encoded) > cls.NAME_BYTES:
+            raise ValueError(f"Account name '{name}' is too long for the account table")
+        ledger_offset = len(record.get('transactions', [])) + record.get('archived', {}).get('count', 0)
+        return (encoded, round(record.get('balance', 0) * 100), 0, ledger_offset,
+                round(record.get('held_total', 0) * 100),
+                cls.STATUS_CODES.get(record.get('account_status', 'active'), 0))
+    
+    @classmethod
+    def _header(cls, table):
+        """(magic, format, count, index slots, source identity)"""
+        magic, version, count, slots, ino, mtime_ns, size = cls.HEADER.unpack_from(table, 0)
+        if magic != cls.MAGIC or version != cls.FORMAT:
+            raise ValueError("Not an account table")
+        return magic, version, count, slots, (ino, mtime_ns, size)
+    
+    @classmethod
+    def _write_header(cls, table, count, slots, identity):
+        """Store the record count, index size and source identity"""
+        cls.HEADER.pack_into(table, 0, cls.MAGIC, cls.FORMAT, count, slots, *identity)
+    
+    @classmethod
+    def _record_offset(cls, slots, number):
+        """Byte offset of record `number`"""
+        return cls.HEADER.size + slots * cls.SLOT.size + number * cls.RECORD.size
+    
+    @classmethod
+    def _write_record(cls, table, slots, number, values, version):
+        """Overwrite one record in place"""
+        name, balance_cents, _, ledger_offset, held_cents, status = values
+        cls.RECORD.pack_into(table, cls._record_offset(slots, number),
+                             name, balance_cents, version, ledger_offset, held_cents, status)
+    
+    @classmethod
+    def _find(cls, table, name):
+        """(record number, stored fields) for a name, or None"""
+        slots = cls._header(table)[3]
+        encoded = name.encode('utf-8')
+        position = zlib.crc32(encoded) & (slots - 1)
+        while True:
+            entry = cls.SLOT.unpack_from(table, cls.HEADER.size + position * cls.SLOT.size)[0]
+            if entry == 0:
+                return None
+            stored = cls.RECORD.unpack_from(table, cls._record_offset(slots, entry - 1))
+            if stored[0].rstrip(b"\0") == encoded:
+                return entry - 1, stored
+            position = (position + 1) & (slots - 1)
+    
+    @classmethod
+    def _insert(cls, table, slots, number, name):
+        """Point the first free index slot on name's probe sequence at record `number`"""
+        position = zlib.crc32(name.encode('utf-8')) & (slots - 1)
+        while cls.SLOT.unpack_from(table, cls.HEADER.size + position * cls.SLOT.size)[0]:
+            position = (position + 1) & (slots - 1)
+        cls.SLOT.pack_into(table, cls.HEADER.size + position * cls.SLOT.size, number + 1)
+
+FileHandler.add_save_listener(AccountTable.sync)
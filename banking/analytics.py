@@ -0,0 +1,321 @@
+"""
+Analytics Engine - Bank-wide aggregates over columnar transaction data
+"""
+
+import csv
+import json
+import os
+import time
+from array import array
+from datetime import datetime, timedelta
+from utils.file_handler import FileHandler
+from banking.currency import FXRateTable
+from banking.sub_accounts import SubAccountManager
+from banking.archive import TransactionArchive
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the pure-Python path gives identical results, just slower
+    np = None
+
+class AnalyticsEngine:
+    """Loads balances and transactions into column arrays and computes bank-wide reports"""
+    
+    TYPE_CODES = {
+        'deposit': 0,
+        'withdrawal': 1,
+        'transfer_in': 2,
+        'transfer_out': 3,
+        'account_closure': 4,
+        'interest': 5,
+        'fee': 6
+    }
+    TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+    OTHER_TYPE = 9
+    PERCENTILES = (1, 5, 10, 25, 50, 75, 90, 95, 99)
+    BALANCE_BUCKETS = (0, 10, 100, 1000, 5000, 10000, 50000, 100000)
+    
+    def __init__(self, users_data=None, use_numpy=True):
+        self.use_numpy = use_numpy and np is not None
+        self.users_data = users_data
+        self.usernames = []
+        self.statuses = []
+        self.balances = array('d')
+        self.account_currency = array('h')
+        self.currencies = []
+        self.report_currency = None
+        self.rate_version = None
+        self.created = array('q')
+        self.tx_account = array('l')
+        self.tx_type = array('b')
+        self.tx_amount = array('d')
+        self.tx_epoch = array('q')
+        self._day_cache = {}
+    
+    def load(self):
+        """Flatten every ledger (sub-accounts included) and its full history, archived months too, into column arrays"""
+        users_data = self.users_data if self.users_data is not None else FileHandler.load_users()
+        type_codes = self.TYPE_CODES
+        other = self.OTHER_TYPE
+        to_epoch = self._to_epoch
+        currency_codes = {}
+        archive = TransactionArchive()
+        
+        for account_id, (username, user_data) in enumerate(SubAccountManager.ledgers(users_data)):
+            self.usernames.append(username)
+            self.statuses.append(user_data.get('account_status', 'active'))
+            self.balances.append(user_data.get('balance', 0.0))
+            currency = FXRateTable.currency_of(user_data)
+            if currency not in currency_codes:
+                currency_codes[currency] = len(self.currencies)
+                self.currencies.append(currency)
+            self.account_currency.append(currency_codes[currency])
+            self.created.append(to_epoch(user_data.get('created_at')))
+            for transaction in archive.transactions(username, user_data):
+                self.tx_account.append(account_id)
+                self.tx_type.append(type_codes.get(transaction.get('type'), other))
+                self.tx_amount.append(transaction.get('amount', 0.0))
+                self.tx_epoch.append(to_epoch(transaction.get('timestamp')))
+        return self
+    
+    def normalize(self, currency, rate_table=None):
+        """Convert every balance and amount to one currency in place, with one version of the rates
+
+        Rates are looked up once per currency held, then applied to whole columns:
+        a gather and a multiply with NumPy, one pass over the arrays without it.
+        """
+        table = rate_table or FXRateTable().current()
+        factors = [table.cross(held, currency) for held in self.currencies]
+        self.report_currency = currency
+        self.rate_version = table.version
+        if all(factor == 1.0 for factor in factors):
+            return self
+        if self.use_numpy:
+            factors = np.array(factors)
+            account_factors = factors[np.frombuffer(self.account_currency, dtype=np.int16)]
+            np.frombuffer(self.balances, dtype=np.float64)[:] *= account_factors
+            if self.tx_amount:
+                np.frombuffer(self.tx_amount, dtype=np.float64)[:] *= \
+                    account_factors[np.frombuffer(self.tx_account, dtype=np.dtype('l'))]
+        else:
+            account_currency = self.account_currency
+            for account_id in range(len(self.balances)):
+                self.balances[account_id] *= factors[account_currency[account_id]]
+            for position, account_id in enumerate(self.tx_account):
+                self.tx_amount[position] *= factors[account_currency[account_id]]
+        return self
+    
+    def _to_epoch(self, timestamp):
+        """Convert 'YYYY-MM-DD HH:MM:SS' to epoch seconds, caching the date part"""
+        if not timestamp:
+            return 0
+        day = timestamp[:10]
+        base = self._day_cache.get(day)
+        if base is None:
+            base = int(datetime.strptime(day, "%Y-%m-%d").timestamp())
+            self._day_cache[day] = base
+        try:
+            return base + int(timestamp[11:13]) * 3600 + int(timestamp[14:16]) * 60 + int(timestamp[17:19])
+        except ValueError:
+            return base
+    
+    def daily_series(self):
+        """Per-day totals and counts for each transaction type"""
+        if not self.tx_epoch:
+            return []
+        if self.use_numpy:
+            epoch = np.frombuffer(self.tx_epoch, dtype=np.int64)
+            codes = np.frombuffer(self.tx_type, dtype=np.int8).astype(np.int64)
+            amounts = np.frombuffer(self.tx_amount, dtype=np.float64)
+            base_day = self._midnight(int(epoch.min()))
+            days = (epoch - base_day) // 86400
+            width = self.OTHER_TYPE + 1
+            keys = days * width + codes
+            unique_keys, inverse = np.unique(keys, return_inverse=True)
+            totals = np.bincount(inverse, weights=amounts)
+            counts = np.bincount(inverse)
+            grouped = {}
+            for key, total, count in zip(unique_keys.tolist(), totals.tolist(), counts.tolist()):
+                day, code = divmod(key, width)
+                grouped.setdefault(day, {})[code] = (total, count)
+        else:
+            base_day = self._midnight(min(self.tx_epoch))
+            grouped = {}
+            for epoch, code, amount in zip(self.tx_epoch, self.tx_type, self.tx_amount):
+                day = (epoch - base_day) // 86400
+                bucket = grouped.setdefault(day, {})
+                total, count = bucket.get(code, (0.0, 0))
+                bucket[code] = (total + amount, count + 1)
+        
+        rows = []
+        for day in sorted(grouped):
+            date = datetime.fromtimestamp(base_day) + timedelta(days=day)
+            row = {'date': date.strftime("%Y-%m-%d")}
+            for code, name in self.TYPE_NAMES.items():
+                total, count = grouped[day].get(code, (0.0, 0))
+                row[f"{name}_total"] = round(total, 2)
+                row[f"{name}_count"] = count
+            rows.append(row)
+        return rows
+    
+    def balance_distribution(self):
+        """Percentiles and bucket counts of active account balances"""
+        active = [i for i, status in enumerate(self.statuses) if status == 'active']
+        if not active:
+            return {'accounts': 0, 'total': 0.0, 'percentiles': {}, 'buckets': {}}
+        
+        if self.use_numpy:
+            balances = np.frombuffer(self.balances, dtype=np.float64)[np.array(active)]
+            values = np.percentile(balances, self.PERCENTILES).tolist()
+            edges = np.array(self.BALANCE_BUCKETS[1:])
+            bucket_counts = np.bincount(np.searchsorted(edges, balances, side='right'),
+                                        minlength=len(self.BALANCE_BUCKETS)).tolist()
+            total = float(balances.sum())
+            mean = float(balances.mean())
+        else:
+            balances = sorted(self.balances[i] for i in active)
+            values = [self._percentile(balances, p) for p in self.PERCENTILES]
+            bucket_counts = [0] * len(self.BALANCE_BUCKETS)
+            for balance in balances:
+                index = 0
+                while index + 1 < len(self.BALANCE_BUCKETS) and balance >= self.BALANCE_BUCKETS[index + 1]:
+                    index += 1
+                bucket_counts[index] += 1
+            total = sum(balances)
+            mean = total / len(balances)
+        
+        labels = []
+        for index, lower in enumerate(self.BALANCE_BUCKETS):
+            if index + 1 < len(self.BALANCE_BUCKETS):
+                labels.append(f"{lower}-{self.BALANCE_BUCKETS[index + 1]}")
+            else:
+                labels.append(f"{lower}+")
+        return {
+            'accounts': len(active),
+            'total': round(total, 2),
+            'mean': round(mean, 2),
+            'percentiles': {f"p{p}": round(v, 2) for p, v in zip(self.PERCENTILES, values)},
+            'buckets': dict(zip(labels, bucket_counts))
+        }
+    
+    def dormant_accounts(self, days=180, as_of=None):
+        """Active accounts with no transactions in the last `days` days"""
+        as_of = as_of or time.time()
+        cutoff = as_of - days * 86400
+        count = len(self.usernames)
+        
+        if self.use_numpy:
+            last = np.frombuffer(self.created, dtype=np.int64).copy()
+            if self.tx_epoch:
+                accounts = np.frombuffer(self.tx_account, dtype=np.dtype('l')).astype(np.int64)
+                np.maximum.at(last, accounts, np.frombuffer(self.tx_epoch, dtype=np.int64))
+            last_activity = last.tolist()
+        else:
+            last_activity = list(self.created)
+            for account, epoch in zip(self.tx_account, self.tx_epoch):
+                if epoch > last_activity[account]:
+                    last_activity[account] = epoch
+        
+        rows = []
+        for account_id in range(count):
+            if self.statuses[account_id] != 'active' or last_activity[account_id] >= cutoff:
+                continue
+            last_seen = last_activity[account_id]
+            rows.append({
+                'username': self.usernames[account_id],
+                'balance': round(self.balances[account_id], 2),
+                'last_activity': datetime.fromtimestamp(last_seen).strftime("%Y-%m-%d %H:%M:%S") if last_seen else 'N/A',
+                'days_inactive': int((as_of - last_seen) // 86400) if last_seen else None
+            })
+        return rows
+    
+    def summary(self):
+        """Bank-wide totals by transaction type"""
+        totals = {}
+        if self.use_numpy and self.tx_type:
+            codes = np.frombuffer(self.tx_type, dtype=np.int8).astype(np.int64)
+            amounts = np.frombuffer(self.tx_amount, dtype=np.float64)
+            sums = np.bincount(codes, weights=amounts, minlength=self.OTHER_TYPE + 1).tolist()
+            counts = np.bincount(codes, minlength=self.OTHER_TYPE + 1).tolist()
+        else:
+            sums = [0.0] * (self.OTHER_TYPE + 1)
+            counts = [0] * (self.OTHER_TYPE + 1)
+            for code, amount in zip(self.tx_type, self.tx_amount):
+                sums[code] += amount
+                counts[code] += 1
+        for code, name in self.TYPE_NAMES.items():
+            totals[name] = {'total': round(sums[code], 2), 'count': counts[code]}
+        return {
+            'currency': self.report_currency or (self.currencies[0] if len(self.currencies) == 1 else 'mixed'),
+            'rate_version': self.rate_version,
+            'accounts': len(self.usernames),
+            'active_accounts': sum(1 for status in self.statuses if status == 'active'),
+            'transactions': len(self.tx_type),
+            'by_type': totals
+        }
+    
+    def write_reports(self, output_dir, report_format='csv', dormant_days=180, as_of=None):
+        """Compute every report and write it to output_dir; returns the written paths"""
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        
+        reports = {
+            'summary': self.summary(),
+            'daily_series': self.daily_series(),
+            'balance_distribution': self.balance_distribution(),
+            'dormant_accounts': self.dormant_accounts(dormant_days, as_of)
+        }
+        
+        paths = []
+        if report_format == 'json':
+            path = os.path.join(output_dir, "analytics.json")
+            with open(path, 'w') as f:
+                json.dump(reports, f, indent=2)
+            paths.append(path)
+            return paths
+        
+        for name in ('daily_series', 'dormant_accounts'):
+            path = os.path.join(output_dir, f"{name}.csv")
+            self._write_csv(path, reports[name])
+            paths.append(path)
+        
+        distribution = reports['balance_distribution']
+        rows = [{'metric': key, 'value': value} for key, value in distribution['percentiles'].items()]
+        rows += [{'metric': f"bucket {key}", 'value': value} for key, value in distribution['buckets'].items()]
+        rows += [{'metric': key, 'value': distribution[key]} for key in ('accounts', 'total', 'mean') if key in distribution]
+        path = os.path.join(output_dir, "balance_distribution.csv")
+        self._write_csv(path, rows)
+        paths.append(path)
+        
+        currency = reports['summary']['currency']
+        rows = [{'type': name, 'total': stats['total'], 'count': stats['count'], 'currency': currency}
+                for name, stats in reports['summary']['by_type'].items()]
+        path = os.path.join(output_dir, "summary.csv")
+        self._write_csv(path, rows)
+        paths.append(path)
+        return paths
+    
+    @staticmethod
+    def _write_csv(path, rows):
+        """Write a list of dicts as CSV"""
+        with open(path, 'w', newline='') as f:
+            if not rows:
+                return
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    
+    @staticmethod
+    def _midnight(epoch):
+        """Epoch seconds of local midnight on the day containing epoch"""
+        return int(datetime.fromtimestamp(epoch).replace(hour=0, minute=0, second=0).timestamp())
+    
+    @staticmethod
+    def _percentile(ordered, percent):
+        """Linear-interpolated percentile of a sorted list (matches numpy's default)"""
+        if len(ordered) == 1:
+            return ordered[0]
+        position = (len(ordered) - 1) * percent / 100
+        lower = int(position)
+        upper = min(lower + 1, len(ordered) - 1)
+        return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
@@ -0,0 +1,244 @@
+"""
+Transaction Archive - Moves old transactions into compressed per-account, per-month segments
+"""
+
+import json
+import os
+import re
+import time
+import zlib
+from datetime import datetime, timedelta
+from utils.file_handler import FileHandler
+from utils.metrics import metrics
+
+ARCHIVED_TRANSACTIONS = metrics.counter(
+    'securebank_archived_transactions_total', "Transactions moved to cold storage")
+SEGMENT_READS = metrics.counter(
+    'securebank_archive_segment_reads_total', "Archive segments read back")
+
+class TransactionArchive:
+    """Cold tier for transaction history: immutable zlib segments plus a small index per account"""
+    
+    ARCHIVE_DIR = "archive"
+    INDEX_FILE = "index.json"
+    SEGMENT_SUFFIX = ".seg"
+    COMPRESSION_LEVEL = 6
+    DEFAULT_RETENTION_DAYS = 365
+    
+    CREDIT_TYPES = ('deposit', 'transfer_in', 'interest')
+    DEBIT_TYPES = ('withdrawal', 'transfer_out', 'fee')
+    
+    @staticmethod
+    def validate_month(month):
+        """Months are written as YYYY-MM"""
+        if not re.match(r"^\d{4}-(0[1-9]|1[0-2])$", month or ''):
+            raise ValueError(f"Invalid month '{month}'. Use YYYY-MM.")
+        return month
+    
+    @classmethod
+    def cutoff_for(cls, older_than_days=None, now=None):
+        """First month kept hot: everything in earlier months is eligible for archiving"""
+        days = cls.DEFAULT_RETENTION_DAYS if older_than_days is None else older_than_days
+        cutoff = datetime.fromtimestamp(now or time.time()) - timedelta(days=days)
+        return cutoff.strftime("%Y-%m")
+    
+    def run(self, before_month, chunk_size=None, dry_run=False):
+        """Archive every transaction dated before before_month (YYYY-MM); returns a summary
+
+        Each chunk of chunk_size accounts (all of them without it) is reloaded,
+        trimmed and saved under the writer lock, so live transactions are kept.
+        """
+        started = time.perf_counter()
+        users_file = FileHandler.USERS_FILE
+        size_before = os.path.getsize(users_file) if os.path.exists(users_file) else 0
+        summary = {
+            'before': before_month,
+            'accounts_archived': 0,
+            'transactions_archived': 0,
+            'segments_written': 0,
+            'segment_bytes': 0,
+            'hot_bytes_before': size_before,
+            'hot_bytes_after': size_before,
+            'dry_run': dry_run
+        }
+        
+        if dry_run:
+            for username, user_data in FileHandler.load_users().items():
+                self._archive_account(username, user_data, before_month, summary, dry_run)
+        else:
+            for users_data, chunk in FileHandler.locked_chunks(FileHandler.load_users(), chunk_size):
+                archived_before = summary['transactions_archived']
+                for username in chunk:
+                    # Re-find the split on the fresh record: it may have gained transactions since
+                    if username in users_data:
+                        self._archive_account(username, users_data[username], before_month, summary, dry_run)
+                if summary['transactions_archived'] > archived_before:
+                    if not FileHandler.save_users(users_data):
+                        raise IOError("Failed to save the trimmed hot store")
+                    ARCHIVED_TRANSACTIONS.inc(summary['transactions_archived'] - archived_before)
+            summary['hot_bytes_after'] = os.path.getsize(users_file) if os.path.exists(users_file) else 0
+        summary['seconds'] = round(time.perf_counter() - started, 3)
+        return summary
+    
+    def _archive_account(self, username, user_data, before_month, summary, dry_run):
+        """Move one account's transactions dated before before_month into segments"""
+        transactions = user_data.get('transactions', [])
+        # Transactions are appended in time order, so the archivable ones are a prefix
+        split = 0
+        while split < len(transactions) and transactions[split].get('timestamp', '')[:7] < before_month:
+            split += 1
+        if split == 0:
+            return
+        
+        old = transactions[:split]
+        summary['accounts_archived'] += 1
+        summary['transactions_archived'] += split
+        if dry_run:
+            return
+        
+        written, nbytes = self._write_segments(username, user_data, old)
+        summary['segments_written'] += written
+        summary['segment_bytes'] += nbytes
+        
+        archived = user_data.setdefault('archived', {
+            'through': None, 'count': 0, 'balance_forward': 0.0, 'credits': 0.0, 'debits': 0.0})
+        archived['through'] = old[-1]['timestamp'][:7]
+        archived['count'] += split
+        archived['balance_forward'] = old[-1].get('balance_after', archived['balance_forward'])
+        archived['credits'] = round(archived['credits'] + sum(
+            t['amount'] for t in old if t['type'] in self.CREDIT_TYPES), 2)
+        archived['debits'] = round(archived['debits'] + sum(
+            t['amount'] for t in old if t['type'] in self.DEBIT_TYPES), 2)
+        self._extend_checkpoints(archived, old)
+        user_data['transactions'] = transactions[split:]
+    
+    @staticmethod
+    def _extend_checkpoints(archived, transactions):
+        """Record each archived month's closing balance as parallel month/balance lists"""
+        months = archived.setdefault('checkpoint_months', [])
+        balances = archived.setdefault('checkpoint_balances', [])
+        for transaction in transactions:
+            month = transaction['timestamp'][:7]
+            if months and months[-1] == month:
+                balances[-1] = transaction['balance_after']
+            elif not months or month > months[-1]:
+                months.append(month)
+                balances.append(transaction['balance_after'])
+    
+    def _write_segments(self, username, user_data, transactions):
+        """Write one immutable segment per month and update the account's index"""
+        directory = self._account_dir(username)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        index = self._load_index(username, user_data)
+        committed = {segment['file'] for segment in index}
+        
+        # One segment per run of same-month entries, so reading segments in index order
+        # reproduces the original ledger order exactly
+        runs = []
+        for transaction in transactions:
+            month = transaction['timestamp'][:7]
+            if not runs or runs[-1][0] != month:
+                runs.append((month, []))
+            runs[-1][1].append(transaction)
+        
+        written = 0
+        nbytes = 0
+        for month, entries in runs:
+            # A month that already has a segment gets a numbered follow-on part
+            part = 0
+            filename = f"{month}{self.SEGMENT_SUFFIX}"
+            while filename in committed:
+                part += 1
+                filename = f"{month}.{part}{self.SEGMENT_SUFFIX}"
+            committed.add(filename)
+            payload = zlib.compress(json.dumps(entries, separators=(',', ':')).encode('utf-8'),
+                                    self.COMPRESSION_LEVEL)
+            # Files not in the index are leftovers of an interrupted run and are safe to overwrite
+            self._write_atomic(os.path.join(directory, filename), payload)
+            index.append({
+                'file': filename,
+                'month': month,
+                'count': len(entries),
+                'first': entries[0]['timestamp'],
+                'last': entries[-1]['timestamp'],
+                'bytes': len(payload),
+                'crc32': zlib.crc32(payload)
+            })
+            written += 1
+            nbytes += len(payload)
+        
+        self._write_atomic(os.path.join(directory, self.INDEX_FILE),
+                           json.dumps(index, indent=2).encode('utf-8'))
+        return written, nbytes
+    
+    def transactions(self, username, user_data, start=None, end=None):
+        """Full history (archived then hot) with timestamps in [start, end]; dates as YYYY-MM-DD"""
+        hot = user_data.get('transactions', [])
+        selected = []
+        if user_data.get('archived'):
+            start_month = start[:7] if start else None
+            end_month = end[:7] if end else None
+            for segment in self._load_index(username, user_data):
+                if start_month and segment['month'] < start_month:
+                    continue
+                if end_month and segment['month'] > end_month:
+                    continue
+                selected.extend(self.read_segment(username, segment))
+        selected.extend(hot)
+        if not start and not end:
+            return selected
+        low = start or ''
+        high = (end + " 23:59:59") if end and len(end) == 10 else (end or '9999')
+        return [t for t in selected if low <= t['timestamp'] <= high]
+    
+    def recent(self, username, user_data, count):
+        """The last `count` transactions, reaching into the newest segments only when the hot tier is short"""
+        hot = user_data.get('transactions', [])
+        if len(hot) >= count or not user_data.get('archived'):
+            return hot[-count:]
+        older = []
+        for segment in reversed(self._load_index(username, user_data)):
+            older = self.read_segment(username, segment) + older
+            if len(older) + len(hot) >= count:
+                break
+        return (older + hot)[-count:]
+    
+    def read_segment(self, username, segment):
+        """Decompress one segment, verifying its checksum"""
+        with open(os.path.join(self._account_dir(username), segment['file']), 'rb') as f:
+            payload = f.read()
+        if zlib.crc32(payload) != segment['crc32']:
+            raise IOError(f"Archive segment {username}/{segment['file']} is corrupt")
+        SEGMENT_READS.inc()
+        return json.loads(zlib.decompress(payload).decode('utf-8'))
+    
+    def _load_index(self, username, user_data):
+        """Segments committed for an account, in ledger order (as counted by the hot record)"""
+        path = os.path.join(self._account_dir(username), self.INDEX_FILE)
+        if not user_data.get('archived') or not os.path.exists(path):
+            return []
+        with open(path, 'r') as f:
+            index = json.load(f)
+        # Entries past the committed count belong to a run that never finished
+        committed = []
+        remaining = user_data['archived']['count']
+        for segment in index:
+            if remaining <= 0:
+                break
+            committed.append(segment)
+            remaining -= segment['count']
+        return committed
+    
+    @classmethod
+    def _account_dir(cls, username):
+        """Directory holding an account's segments"""
+        return os.path.join(FileHandler.DATA_DIR, cls.ARCHIVE_DIR, username)
+    
+    @staticmethod
+    def _write_atomic(path, payload):
+        """Write bytes via a temporary file and rename"""
+        temp_file = path + '.tmp'
+        with open(temp_file, 'wb') as f:
+            f.write(payload)
+        os.replace(temp_file, path)
@@ -0,0 +1,133 @@
+"""
+Balance History - Point-in-time balances from monthly checkpoints and bisection over the ledger
+"""
+
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from utils.file_handler import FileHandler
+from banking.archive import TransactionArchive
+from banking.sub_accounts import SubAccountManager
+from banking.currency import FXRateTable
+from utils.snapshot import SnapshotManager
+
+class LedgerTimestamps:
+    """Timestamps of a list of ledger entries as a read-only sequence
+
+    bisect only gained key= in Python 3.10; bisecting this view instead finds
+    the same position in O(log n) on older interpreters, without copying the
+    timestamps out first.
+    """
+    
+    def __init__(self, entries):
+        self.entries = entries
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def __getitem__(self, index):
+        return self.entries[index]['timestamp']
+
+class BalanceHistory:
+    """Answers "what was the balance at time X" without scanning an account's history"""
+    
+    def __init__(self):
+        self.archive = TransactionArchive()
+    
+    @staticmethod
+    def normalize(when):
+        """Accept YYYY-MM-DD (end of that day) or a full timestamp"""
+        for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+            try:
+                parsed = datetime.strptime(when, fmt)
+            except (TypeError, ValueError):
+                continue
+            return parsed.strftime("%Y-%m-%d 23:59:59" if fmt == "%Y-%m-%d" else "%Y-%m-%d %H:%M:%S")
+        raise ValueError(f"Invalid date '{when}'. Use YYYY-MM-DD or YYYY-MM-DD HH:MM:SS.")
+    
+    def balance_as_of(self, username, user_data, when):
+        """Balance at the end of `when`; returns (balance, source)
+
+        The ledger is appended in time order, so the hot transactions are bisected directly.
+        Older dates use the archived months' closing-balance checkpoints and, only when the
+        date falls inside an archived month with activity, that month's segment.
+        """
+        hot = user_data.get('transactions', [])
+        archived = user_data.get('archived')
+        if hot and (not archived or hot[0]['timestamp'] <= when):
+            position = bisect_right(LedgerTimestamps(hot), when)
+            if position:
+                return hot[position - 1]['balance_after'], 'ledger'
+        if not archived:
+            return 0.0, 'before_first_transaction'
+        
+        months, balances = self._checkpoints(username, user_data)
+        month = when[:7]
+        index = bisect_left(months, month)
+        if index == len(months):
+            return archived['balance_forward'], 'checkpoint'
+        opening = balances[index - 1] if index else 0.0
+        if months[index] != month:
+            return opening, 'checkpoint'
+        
+        # The index's first/last timestamps settle most dates without decompressing anything
+        segments = [segment for segment in self.archive._load_index(username, user_data)
+                    if segment['month'] == month]
+        if when >= segments[-1]['last']:
+            return balances[index], 'checkpoint'
+        if when < segments[0]['first']:
+            return opening, 'checkpoint'
+        entries = []
+        for segment in segments:
+            entries.extend(self.archive.read_segment(username, segment))
+        position = bisect_right(LedgerTimestamps(entries), when)
+        if position:
+            return entries[position - 1]['balance_after'], 'segment'
+        return opening, 'checkpoint'
+    
+    def _checkpoints(self, username, user_data):
+        """Archived months and their closing balances, rebuilt in memory for archives that predate them"""
+        archived = user_data['archived']
+        if 'checkpoint_months' not in archived:
+            TransactionArchive._extend_checkpoints(archived, self.archive.transactions(username, {
+                'archived': archived, 'transactions': []}))
+        return archived['checkpoint_months'], archived['checkpoint_balances']
+    
+    def account_as_of(self, username, when):
+        """Single-account query against storage"""
+        when = self.normalize(when)
+        users_data = FileHandler.load_users()
+        if username not in users_data:
+            raise ValueError(f"Account '{username}' not found.")
+        balance, source = self.balance_as_of(username, users_data[username], when)
+        return {'username': username, 'as_of': when, 'balance': round(balance, 2),
+                'currency': FXRateTable.currency_of(users_data[username]), 'source': source}
+    
+    def bank_as_of(self, when, users_data=None):
+        """Every account's balance at `when` (sub-accounts as user:account) plus one bank total per currency"""
+        started = time.perf_counter()
+        when = self.normalize(when)
+        if users_data is None:
+            with SnapshotManager().open() as snapshot:
+                return self.bank_as_of(when, snapshot.users())
+        balances = {}
+        currencies = {}
+        totals = {}
+        sources = {}
+        for username, user_data in SubAccountManager.ledgers(users_data):
+            if user_data.get('created_at', '') > when:
+                continue
+            balance, source = self.balance_as_of(username, user_data, when)
+            balances[username] = round(balance, 2)
+            currency = currencies[username] = FXRateTable.currency_of(user_data)
+            totals[currency] = totals.get(currency, 0.0) + balances[username]
+            sources[source] = sources.get(source, 0) + 1
+        return {
+            'as_of': when,
+            'accounts': len(balances),
+            'totals': {currency: round(total, 2) for currency, total in totals.items()},
+            'currencies': currencies,
+            'sources': sources,
+            'balances': balances,
+            'seconds': round(time.perf_counter() - started, 4)
+        }
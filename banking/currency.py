@@ -0,0 +1,163 @@
+"""
+Currency - Versioned FX rate table loaded from a local rate file, with cached cross rates and hot reload
+"""
+
+import json
+import os
+import threading
+import time
+import zlib
+from functools import lru_cache
+from utils.file_handler import FileHandler
+from utils.metrics import metrics
+
+FX_RELOADS = metrics.counter(
+    'securebank_fx_reloads_total', "FX rate file loads by outcome", ('outcome',))
+FX_CONVERSIONS = metrics.counter(
+    'securebank_fx_conversions_total', "Amounts converted between currencies")
+
+class RateTable:
+    """One immutable version of the rates: units of each currency per one unit of the base"""
+    
+    CROSS_CACHE_SIZE = 256
+    
+    def __init__(self, version, base, rates, loaded_at=None):
+        self.version = version
+        self.base = base
+        self.rates = dict(rates)
+        self.loaded_at = loaded_at or time.time()
+        # Cached per version, so a reload can never serve a cross rate from the old table
+        self.cross = lru_cache(maxsize=self.CROSS_CACHE_SIZE)(self._cross)
+    
+    def currencies(self):
+        """Currency codes this version can convert"""
+        return sorted(self.rates)
+    
+    def _cross(self, source, target):
+        """Rate taking an amount in source to target, through the base currency"""
+        if source == target:
+            return 1.0
+        try:
+            return self.rates[target] / self.rates[source]
+        except KeyError as e:
+            raise ValueError(f"No FX rate for {e.args[0]} in rate version {self.version}")
+    
+    def convert(self, amount, source, target):
+        """(converted amount rounded to cents, rate applied)"""
+        rate = self.cross(source, target)
+        return round(amount * rate, 2), rate
+
+class FXRateTable:
+    """Holds the current RateTable and swaps in a new one when the rate file changes
+
+    The rate file (data/fx_rates.json) looks like
+    {"version": "2024-06-01", "base": "USD", "rates": {"USD": 1, "EUR": 0.92}}.
+    Readers take current() once and use that version throughout, so a reload
+    half-way through a transfer cannot mix rates. Reloads build the new table
+    off to the side and replace the reference in one assignment.
+    """
+    
+    _instance = None
+    RATES_FILE = "fx_rates.json"
+    DEFAULT_CURRENCY = "USD"     # Accounts opened before currencies existed hold dollars
+    RELOAD_CHECK_SECONDS = 1.0   # The rate file is stat'ed at most this often
+    SYMBOLS = {'USD': "$", 'EUR': "€", 'GBP': "£", 'JPY': "¥", 'INR': "₹", 'PKR': "Rs "}
+    
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(FXRateTable, cls).__new__(cls)
+            cls._instance.lock = threading.Lock()
+            cls._instance.table = None
+            cls._instance.identity = None
+            cls._instance.checked_at = 0.0
+        return cls._instance
+    
+    @classmethod
+    def path(cls):
+        """Rate file inside the current data directory"""
+        return os.path.join(FileHandler.DATA_DIR, cls.RATES_FILE)
+    
+    def current(self):
+        """The latest RateTable, reloading first if the rate file has changed"""
+        now = time.monotonic()
+        if self.table is None or now - self.checked_at >= self.RELOAD_CHECK_SECONDS:
+            self.reload()
+        return self.table
+    
+    def reload(self, force=False):
+        """Load the rate file if it changed; a bad file keeps the previous version in service"""
+        with self.lock:
+            self.checked_at = time.monotonic()
+            path = self.path()
+            try:
+                identity = (path,) + FileHandler.file_identity(path)
+            except OSError:
+                identity = (path,)
+            if identity == self.identity and self.table is not None and not force:
+                return self.table
+            if len(identity) == 1:
+                # No rate file: every account can only deal in its own currency
+                self.table = RateTable("base", self.DEFAULT_CURRENCY, {self.DEFAULT_CURRENCY: 1.0})
+                self.identity = identity
+                return self.table
+            try:
+                self.table = self._parse(path)
+                self.identity = identity
+                FX_RELOADS.labels('success').inc()
+            except (OSError, KeyError, ValueError, TypeError, AttributeError) as e:
+                FX_RELOADS.labels('error').inc()
+                print(f"⚠️  FX rate file not loaded ({e}); keeping rate version "
+                      f"{self.table.version if self.table else 'none'}")
+                if self.table is None:
+                    self.table = RateTable("base", self.DEFAULT_CURRENCY, {self.DEFAULT_CURRENCY: 1.0})
+            return self.table
+    
+    @classmethod
+    def _parse(cls, path):
+        """Build and validate a RateTable from the rate file"""
+        with open(path, 'rb') as f:
+            content = f.read()
+        data = json.loads(content)
+        base = data.get('base', cls.DEFAULT_CURRENCY).upper()
+        rates = {code.upper(): float(rate) for code, rate in data['rates'].items()}
+        rates.setdefault(base, 1.0)
+        if abs(rates[base] - 1.0) > 1e-9:
+            raise ValueError(f"base currency {base} must have rate 1")
+        if any(rate <= 0 for rate in rates.values()):
+            raise ValueError("rates must be positive")
+        version = str(data.get('version') or f"crc-{zlib.crc32(content):08x}")
+        return RateTable(version, base, rates)
+    
+    @classmethod
+    def currency_of(cls, record):
+        """Currency an account (or sub-account) holds"""
+        return record.get('currency', cls.DEFAULT_CURRENCY)
+    
+    def threshold(self, amount, currency):
+        """A bank-wide amount (limit, fee or minimum) set in DEFAULT_CURRENCY, expressed in currency
+
+        None (no limit) stays None. A currency the rate file cannot convert keeps the amount as set.
+        """
+        if amount is None or not currency or currency == self.DEFAULT_CURRENCY:
+            return amount
+        try:
+            return self.current().convert(amount, self.DEFAULT_CURRENCY, currency)[0]
+        except ValueError:
+            return amount
+    
+    def convert(self, amount, source, target):
+        """(converted amount, rate, rate version), all from one version of the table"""
+        table = self.current()
+        converted, rate = table.convert(amount, source, target)
+        if source != target:
+            FX_CONVERSIONS.inc()
+        return converted, rate, table.version
+    
+    @classmethod
+    def format(cls, amount, currency=None):
+        """Amount with its currency symbol, or code for currencies without one"""
+        currency = currency or cls.DEFAULT_CURRENCY
+        symbol = cls.SYMBOLS.get(currency)
+        if symbol:
+            return f"{symbol}{amount:,.2f}"
+        return f"{amount:,.2f} {currency}"
@@ -0,0 +1,132 @@
+"""
+Fraud Screener - Velocity and anomaly scoring for transfers using bounded per-account state
+"""
+
+import math
+import time
+from datetime import datetime
+from utils.metrics import metrics
+
+FRAUD_DECISIONS = metrics.counter(
+    'securebank_fraud_decisions_total', "Transfer screening decisions", ('action',))
+FRAUD_SECONDS = metrics.histogram(
+    'securebank_fraud_screening_seconds', "Time spent scoring a transfer",
+    buckets=(0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.001))
+
+class FraudScreener:
+    """Scores transfers against each sender's recent behaviour in constant time"""
+    
+    RECENT_SIZE = 20             # Ring buffer of recent transfers per account
+    MAX_COUNTERPARTIES = 500     # Known recipients remembered per account
+    VELOCITY_WINDOW = 3600       # Seconds considered for transfer velocity
+    VELOCITY_LIMIT = 5           # Transfers per window that count as fully "fast"
+    MIN_HISTORY = 5              # Transfers needed before amount outliers are scored
+    
+    WEIGHTS = {'velocity': 0.35, 'new_recipient': 0.35, 'amount': 0.30}
+    FLAG_SCORE = 0.5
+    DECLINE_SCORE = 0.7          # Refused outright; the customer can retry once the pattern cools down
+    
+    def assess(self, user_data, recipient, amount, now=None):
+        """Score a proposed transfer; returns a dict with score, action and reasons"""
+        started = time.perf_counter()
+        now = time.time() if now is None else now
+        state = self._state(user_data)
+        
+        # Velocity and fan-out: ring-buffer transfers inside the window
+        in_window = 0
+        new_count = 0
+        for entry in state['recent']:
+            if now - entry[0] <= self.VELOCITY_WINDOW:
+                in_window += 1
+                if entry[3]:
+                    new_count += 1
+        velocity = min(1.0, (in_window + 1) / (self.VELOCITY_LIMIT + 1))
+        
+        # New-recipient ratio inside the window, including this transfer
+        is_new = recipient not in state['counterparties']
+        if is_new:
+            new_count += 1
+        new_ratio = new_count / (in_window + 1)
+        new_recipient = new_ratio if is_new else new_ratio / 2
+        
+        # Amount outlier against the running mean/variance of past transfers
+        zscore = 0.0
+        stats = state['amount_stats']
+        if stats['count'] >= self.MIN_HISTORY:
+            std = math.sqrt(stats['m2'] / (stats['count'] - 1))
+            if std > 0:
+                zscore = (amount - stats['mean']) / std
+            elif amount > stats['mean']:
+                zscore = 10.0
+        amount_score = min(1.0, max(0.0, (zscore - 2) / 4))
+        
+        score = (self.WEIGHTS['velocity'] * velocity
+                 + self.WEIGHTS['new_recipient'] * new_recipient
+                 + self.WEIGHTS['amount'] * amount_score)
+        
+        reasons = []
+        if velocity >= 1.0:
+            reasons.append(f"{in_window + 1} transfers within {self.VELOCITY_WINDOW // 60} minutes")
+        if is_new and new_ratio >= 0.5:
+            reasons.append(f"{new_count} of {in_window + 1} recent transfers to new recipients")
+        if amount_score > 0:
+            reasons.append(f"amount is {zscore:.1f} standard deviations above normal")
+        
+        if score >= self.DECLINE_SCORE:
+            action = 'decline'
+        elif score >= self.FLAG_SCORE:
+            action = 'flag'
+        else:
+            action = 'allow'
+        
+        FRAUD_DECISIONS.labels(action).inc()
+        FRAUD_SECONDS.observe(time.perf_counter() - started)
+        return {
+            'score': round(score, 4),
+            'action': action,
+            'reasons': reasons,
+            'new_recipient': is_new
+        }
+    
+    def record(self, user_data, recipient, amount, assessment=None, now=None):
+        """Fold a completed transfer into the account's screening state"""
+        now = time.time() if now is None else now
+        state = self._state(user_data)
+        is_new = assessment['new_recipient'] if assessment else recipient not in state['counterparties']
+        
+        # Ring buffer of [timestamp, amount, recipient, was_new]
+        state['recent'].append([now, amount, recipient, is_new])
+        if len(state['recent']) > self.RECENT_SIZE:
+            del state['recent'][0]
+        
+        # Known counterparties, most recently used last; evict the oldest when full
+        counterparties = state['counterparties']
+        counterparties.pop(recipient, None)
+        counterparties[recipient] = int(now)
+        if len(counterparties) > self.MAX_COUNTERPARTIES:
+            del counterparties[next(iter(counterparties))]
+        
+        # Welford running mean/variance of transfer amounts
+        stats = state['amount_stats']
+        stats['count'] += 1
+        delta = amount - stats['mean']
+        stats['mean'] += delta / stats['count']
+        stats['m2'] += delta * (amount - stats['mean'])
+    
+    def _state(self, user_data):
+        """Screening state for an account, rebuilt once from transfer history"""
+        if 'fraud_state' not in user_data:
+            user_data['fraud_state'] = {
+                'recent': [],
+                'counterparties': {},
+                'amount_stats': {'count': 0, 'mean': 0.0, 'm2': 0.0}
+            }
+            for transaction in user_data.get('transactions', []):
+                if transaction.get('type') != 'transfer_out' or 'recipient' not in transaction:
+                    continue
+                try:
+                    when = datetime.strptime(transaction['timestamp'], "%Y-%m-%d %H:%M:%S").timestamp()
+                except (KeyError, ValueError):
+                    continue
+                self.record(user_data, transaction['recipient'], transaction['amount'], now=when)
+        return user_data['fraud_state']
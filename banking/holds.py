@@ -0,0 +1,242 @@
+"""
+Hold Manager - Two-phase authorization holds: place, capture, release and timed expiry
+"""
+
+import glob
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from utils.file_handler import FileHandler, exclusive_write
+from utils.metrics import metrics, BANKING_AMOUNT, BANKING_OPERATIONS
+from utils.audit_log import AuditLogger
+from utils.change_feed import ChangeFeed
+from banking.limits import LimitManager
+from banking.currency import FXRateTable
+
+HOLD_EVENTS = metrics.counter(
+    'securebank_holds_total', "Authorization hold lifecycle events", ('event',))
+
+class HoldManager:
+    """Keeps each account's pending holds keyed by id with a maintained total
+
+    Available balance is balance minus 'held_total', so it never needs the holds
+    themselves. Expiry uses an on-disk timer wheel: every hold is also appended to
+    data/holds/<minute>.jsonl for the minute it expires, and an expiry run opens
+    only the buckets that are due, never the accounts that have no due holds.
+    """
+    
+    HOLDS_DIR = "holds"
+    BUCKET_FORMAT = "%Y%m%d%H%M"
+    TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+    DEFAULT_TTL_HOURS = 168      # Card authorizations commonly lapse after seven days
+    MAX_TTL_HOURS = 30 * 24
+    
+    def __init__(self):
+        self.audit_logger = AuditLogger()
+        self.limit_manager = LimitManager()
+    
+    @staticmethod
+    def available_balance(user_data):
+        """Ledger balance less everything on hold"""
+        return round(user_data['balance'] - user_data.get('held_total', 0.0), 2)
+    
+    @exclusive_write
+    def place(self, username, amount, description="Authorization", ttl_hours=None, now=None):
+        """Reserve amount against the available balance; returns the hold or None if declined"""
+        now = time.time() if now is None else now
+        ttl_hours = self.DEFAULT_TTL_HOURS if ttl_hours is None else ttl_hours
+        try:
+            if amount <= 0:
+                print("❌ Hold amount must be positive.")
+                return None
+            if not 0 < ttl_hours <= self.MAX_TTL_HOURS:
+                print(f"❌ Holds must expire within {self.MAX_TTL_HOURS} hours.")
+                return None
+            users_data = FileHandler.load_users()
+            user_data = users_data.get(username)
+            if user_data is None or user_data.get('account_status', 'active') != 'active':
+                print("❌ Account is not active.")
+                return None
+            if amount > self.available_balance(user_data):
+                HOLD_EVENTS.labels('declined').inc()
+                print(f"❌ Insufficient available funds. Available: "
+                      f"{FXRateTable.format(self.available_balance(user_data), FXRateTable.currency_of(user_data))}")
+                return None
+            allowed, message = self.limit_manager.check(user_data, 'withdrawal', amount)
+            if not allowed:
+                HOLD_EVENTS.labels('declined').inc()
+                print(f"❌ {message}")
+                return None
+            
+            expires = datetime.fromtimestamp(now) + timedelta(hours=ttl_hours)
+            hold = {
+                'id': uuid.uuid4().hex[:8],
+                'amount': amount,
+                'remaining': amount,
+                'description': description,
+                'placed_at': datetime.fromtimestamp(now).strftime(self.TIME_FORMAT),
+                'expires_at': expires.strftime(self.TIME_FORMAT)
+            }
+            user_data.setdefault('holds', {})[hold['id']] = hold
+            user_data['held_total'] = round(user_data.get('held_total', 0.0) + amount, 2)
+            # Queued for expiry before the commit, so a crash cannot leave a hold that never lapses
+            self._schedule_expiry(username, hold, expires)
+            if not FileHandler.save_users(users_data, changed=[username]):
+                return None
+            self._committed('placed', username, hold, amount, user_data)
+            return hold
+        except Exception as e:
+            print(f"❌ Error placing hold: {e}")
+            return None
+    
+    @exclusive_write
+    def capture(self, username, hold_id, amount=None, final=True):
+        """Debit up to the held amount; a final capture releases whatever is left of the hold"""
+        try:
+            users_data = FileHandler.load_users()
+            user_data = users_data.get(username, {})
+            hold = user_data.get('holds', {}).get(hold_id)
+            if hold is None:
+                print("❌ No pending hold with that id.")
+                return False
+            amount = hold['remaining'] if amount is None else round(amount, 2)
+            if not 0 < amount <= hold['remaining']:
+                currency = FXRateTable.currency_of(user_data)
+                print(f"❌ Capture must be between {FXRateTable.format(0.01, currency)} and "
+                      f"{FXRateTable.format(hold['remaining'], currency)}.")
+                return False
+            
+            user_data['balance'] = round(user_data['balance'] - amount, 2)
+            hold['remaining'] = round(hold['remaining'] - amount, 2)
+            released = amount
+            if final or hold['remaining'] <= 0:
+                released += hold['remaining']
+                del user_data['holds'][hold_id]
+            user_data['held_total'] = round(user_data['held_total'] - released, 2)
+            user_data['transactions'].append({
+                'type': 'withdrawal',
+                'amount': amount,
+                'description': f"{hold['description']} (captured hold {hold_id})",
+                'hold_id': hold_id,
+                'timestamp': FileHandler.get_current_timestamp(),
+                'balance_after': user_data['balance']
+            })
+            self.limit_manager.record(user_data, 'withdrawal', amount)
+            if not FileHandler.save_users(users_data, changed=[username]):
+                return False
+            BANKING_OPERATIONS.labels('hold_capture', 'success').inc()
+            BANKING_AMOUNT.labels('hold_capture').inc(amount)
+            self._committed('captured', username, hold, amount, user_data, released=round(released - amount, 2))
+            return True
+        except Exception as e:
+            print(f"❌ Error capturing hold: {e}")
+            return False
+    
+    def release(self, username, hold_id):
+        """Drop a hold without moving money"""
+        return self._drop(username, hold_id, 'released')
+    
+    def list_holds(self, username):
+        """Pending holds on an account, soonest expiry first"""
+        user_data = FileHandler.load_users().get(username, {})
+        return sorted(user_data.get('holds', {}).values(), key=lambda hold: hold['expires_at'])
+    
+    @exclusive_write
+    def expire_due(self, now=None):
+        """Release every hold whose expiry has passed; returns how many expired"""
+        now = time.time() if now is None else now
+        current = datetime.fromtimestamp(now)
+        current_bucket = current.strftime(self.BUCKET_FORMAT)
+        due_time = current.strftime(self.TIME_FORMAT)
+        
+        due = []
+        finished_buckets = []
+        for path in sorted(glob.glob(os.path.join(self._directory(), "*.jsonl"))):
+            bucket = os.path.basename(path)[:-len(".jsonl")]
+            if bucket > current_bucket:
+                break
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Torn by a crash mid-append
+                    if entry['expires_at'] <= due_time:
+                        due.append(entry)
+            if bucket < current_bucket:
+                finished_buckets.append(path)  # Nothing can be added to a minute that has passed
+        if not due:
+            for path in finished_buckets:
+                os.remove(path)
+            return 0
+        
+        users_data = FileHandler.load_users()
+        expired = []
+        for entry in due:
+            user_data = users_data.get(entry['username'], {})
+            hold = user_data.get('holds', {}).get(entry['id'])
+            # Captured or released holds have already left the account, and their entries are skipped
+            if hold is None or hold['expires_at'] != entry['expires_at']:
+                continue
+            del user_data['holds'][entry['id']]
+            user_data['held_total'] = round(user_data['held_total'] - hold['remaining'], 2)
+            expired.append((entry['username'], hold))
+        if expired and not FileHandler.save_users(users_data, changed=[username for username, _ in expired]):
+            return 0
+        for username, hold in expired:
+            self._committed('expired', username, hold, hold['remaining'], users_data[username])
+        for path in finished_buckets:
+            os.remove(path)
+        return len(expired)
+    
+    def run_forever(self, interval=60):
+        """Expire holds every interval seconds until interrupted"""
+        while True:
+            count = self.expire_due()
+            if count:
+                print(f"🕒 {FileHandler.get_current_timestamp()} expired {count} holds")
+            time.sleep(interval)
+    
+    @exclusive_write
+    def _drop(self, username, hold_id, event):
+        """Remove a hold and return its amount to the available balance"""
+        try:
+            users_data = FileHandler.load_users()
+            user_data = users_data.get(username, {})
+            hold = user_data.get('holds', {}).pop(hold_id, None)
+            if hold is None:
+                print("❌ No pending hold with that id.")
+                return False
+            user_data['held_total'] = round(user_data['held_total'] - hold['remaining'], 2)
+            if not FileHandler.save_users(users_data, changed=[username]):
+                return False
+            self._committed(event, username, hold, hold['remaining'], user_data)
+            return True
+        except Exception as e:
+            print(f"❌ Error releasing hold: {e}")
+            return False
+    
+    def _schedule_expiry(self, username, hold, expires):
+        """Append the hold to the timer-wheel bucket for its expiry minute"""
+        directory = self._directory()
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, expires.strftime(self.BUCKET_FORMAT) + ".jsonl")
+        with open(path, 'a') as f:
+            f.write(json.dumps({'username': username, 'id': hold['id'], 'expires_at': hold['expires_at']}) + "\n")
+    
+    def _committed(self, event, username, hold, amount, user_data, **fields):
+        """Metrics, audit and change feed for a saved hold change"""
+        HOLD_EVENTS.labels(event).inc()
+        self.audit_logger.log(f"hold_{event}", username, accounts=[username], amount=amount,
+                              hold_id=hold['id'], held_total=user_data.get('held_total', 0.0), **fields)
+        ChangeFeed().publish(f"hold_{event}", [username], amount=amount, hold_id=hold['id'],
+                             balance_after=user_data['balance'], available=self.available_balance(user_data),
+                             **fields)
+    
+    @classmethod
+    def _directory(cls):
+        """Timer-wheel buckets inside the current data directory"""
+        return os.path.join(FileHandler.DATA_DIR, cls.HOLDS_DIR)
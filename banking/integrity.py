@@ -0,0 +1,339 @@
+"""
+Ledger Integrity Checker - Parallel fsck of balance chains, transfer legs and money conservation
+"""
+
+import glob
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import zlib
+from collections import Counter
+from utils.file_handler import FileHandler
+from banking.archive import TransactionArchive
+from banking.sub_accounts import SubAccountManager
+from utils.snapshot import SnapshotManager
+from banking.vault import ClosedAccountVault
+from banking.currency import FXRateTable
+
+# Accounts shared with forked workers without pickling (set in the parent before the pool starts)
+_SHARED_ACCOUNTS = []
+
+def _cents(value):
+    """Money as integer cents, so sums are exact"""
+    return int(round(value * 100))
+
+def _check_range(task):
+    """Pool worker: verify one slice of accounts and spill its transfer legs by partition"""
+    start, end, accounts, spill_dir, partitions, data_dir = task
+    if accounts is None:
+        accounts = _SHARED_ACCOUNTS[start:end]
+    FileHandler.set_data_directory(data_dir)
+    return LedgerChecker.check_accounts(accounts, spill_dir, partitions, start)
+
+def _join_partition(task):
+    """Pool worker: hash-join the outgoing and incoming transfer legs of one partition"""
+    spill_dir, partition, max_samples = task
+    outgoing = Counter()
+    incoming = Counter()
+    for path in glob.glob(os.path.join(spill_dir, f"p{partition:04d}-*.legs")):
+        with open(path, 'r') as f:
+            for line in f:
+                side, key = line.rstrip('\n').split('\t', 1)
+                if side == 'O':
+                    outgoing[key] += 1
+                else:
+                    incoming[key] += 1
+    
+    issues = []
+    unmatched = 0
+    for key, count in outgoing.items():
+        missing = count - incoming.get(key, 0)
+        if missing > 0:
+            unmatched += missing
+            if len(issues) < max_samples:
+                sender, recipient, timestamp, cents = key.split('|')
+                issues.append({'account': sender, 'check': 'transfer_in_missing', 'severity': 'error',
+                               'detail': f"{int(cents) / 100:.2f} to {recipient} at {timestamp} "
+                                         f"has no matching transfer_in"})
+    for key, count in incoming.items():
+        missing = count - outgoing.get(key, 0)
+        if missing > 0:
+            unmatched += missing
+            if len(issues) < max_samples:
+                sender, recipient, timestamp, cents = key.split('|')
+                issues.append({'account': recipient, 'check': 'transfer_out_missing', 'severity': 'error',
+                               'detail': f"{int(cents) / 100:.2f} from {sender} at {timestamp} "
+                                         f"has no matching transfer_out"})
+    return {'legs': sum(outgoing.values()) + sum(incoming.values()), 'unmatched': unmatched, 'issues': issues}
+
+class LedgerChecker:
+    """Verifies every account's ledger in parallel and reports discrepancies"""
+    
+    CREDIT_TYPES = ('deposit', 'transfer_in', 'interest')
+    DEBIT_TYPES = ('withdrawal', 'transfer_out', 'fee')
+    EXTERNAL_CREDITS = ('deposit', 'interest')
+    EXTERNAL_DEBITS = ('withdrawal', 'fee')
+    TOLERANCE_CENTS = 1          # Float balances may drift by a rounding cent
+    MAX_SAMPLES = 100            # Issues kept per check kind and per join partition
+    WARNINGS = ('out_of_order',) # Reported but do not fail the check
+    
+    def __init__(self, workers=None, partitions=None, chunk_size=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.partitions = partitions or self.workers * 4
+        self.chunk_size = chunk_size
+    
+    def run(self):
+        """Check the whole bank; returns a report dict"""
+        started = time.perf_counter()
+        with SnapshotManager().open() as snapshot:
+            # Sub-accounts are checked as ledgers of their own, so internal transfer legs pair up
+            return self._check(SubAccountManager.ledgers(snapshot.users()), started)
+    
+    def _check(self, accounts, started):
+        """Check a pinned set of ledgers"""
+        loaded = time.perf_counter()
+        
+        chunk_size = self.chunk_size or max(500, len(accounts) // (self.workers * 8) or 1)
+        spill_dir = tempfile.mkdtemp(prefix="fsck-")
+        try:
+            results, joins = self._run_pool(accounts, chunk_size, spill_dir)
+        finally:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+        
+        report = {
+            'accounts': 0,
+            'transactions': 0,
+            'transfer_legs': 0,
+            'unmatched_legs': 0,
+            'currencies': {},
+            'counts': Counter(),
+            'issues': []
+        }
+        for result in results:
+            for key in ('accounts', 'transactions'):
+                report[key] += result[key]
+            self._add_money(report['currencies'], result['currencies'])
+            report['counts'].update(result['counts'])
+            self._keep_samples(report, result['issues'])
+        for join in joins:
+            report['transfer_legs'] += join['legs']
+            report['unmatched_legs'] += join['unmatched']
+            self._keep_samples(report, join['issues'])
+        if report['unmatched_legs']:
+            report['counts']['unmatched_transfer_leg'] = report['unmatched_legs']
+        
+        # Compacted accounts still hold money and took part in transfers; they count towards the bank
+        vault = ClosedAccountVault.totals()
+        report['vault_accounts'] = vault['accounts']
+        self._add_money(report['currencies'], vault['currencies'])
+        
+        # Conservation holds within each currency: transfers in one currency net to zero, so only
+        # external flows and the currency's side of cross-currency transfers may change its total
+        for currency, money in sorted(report['currencies'].items()):
+            expected = money['external_credit_cents'] - money['external_debit_cents'] + \
+                money['fx_in_cents'] - money['fx_out_cents']
+            money['conservation_drift_cents'] = money['balance_cents'] - expected
+            money['transfer_imbalance_cents'] = money['transfer_out_cents'] - money['transfer_in_cents']
+            if abs(money['conservation_drift_cents']) > self.TOLERANCE_CENTS:
+                report['counts']['conservation'] += 1
+                report['issues'].append({
+                    'account': None, 'check': 'conservation', 'severity': 'error',
+                    'detail': f"{currency} total differs from deposits minus withdrawals by "
+                              f"{FXRateTable.format(money['conservation_drift_cents'] / 100, currency)}"})
+        
+        report['counts'] = dict(report['counts'])
+        report['errors'] = sum(1 for issue in report['issues'] if issue['severity'] == 'error')
+        report['ok'] = not any(count for check, count in report['counts'].items()
+                               if check not in self.WARNINGS)
+        report['workers'] = self.workers
+        report['load_seconds'] = round(loaded - started, 3)
+        report['check_seconds'] = round(time.perf_counter() - loaded, 3)
+        return report
+    
+    def _run_pool(self, accounts, chunk_size, spill_dir):
+        """Phase 1 checks chains and spills legs; phase 2 joins legs partition by partition"""
+        global _SHARED_ACCOUNTS
+        ranges = [(start, min(start + chunk_size, len(accounts)))
+                  for start in range(0, len(accounts), chunk_size)]
+        data_dir = FileHandler.DATA_DIR
+        if self.workers <= 1:
+            results = [self.check_accounts(accounts[start:end], spill_dir, self.partitions, start)
+                       for start, end in ranges]
+            joins = [_join_partition((spill_dir, p, self.MAX_SAMPLES)) for p in range(self.partitions)]
+            return results, joins
+        
+        # Forked workers inherit the loaded accounts; other start methods get their slice pickled
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        shared = context.get_start_method() == 'fork'
+        _SHARED_ACCOUNTS = accounts if shared else []
+        tasks = [(start, end, None if shared else accounts[start:end], spill_dir, self.partitions, data_dir)
+                 for start, end in ranges]
+        try:
+            with context.Pool(self.workers) as pool:
+                results = pool.map(_check_range, tasks)
+                joins = pool.map(_join_partition,
+                                 [(spill_dir, p, self.MAX_SAMPLES) for p in range(self.partitions)])
+        finally:
+            _SHARED_ACCOUNTS = []
+        return results, joins
+    
+    def _keep_samples(self, report, issues):
+        """Keep at most MAX_SAMPLES issues of each check kind"""
+        kept = Counter(issue['check'] for issue in report['issues'])
+        for issue in issues:
+            if kept[issue['check']] < self.MAX_SAMPLES:
+                kept[issue['check']] += 1
+                report['issues'].append(issue)
+    
+    @staticmethod
+    def _add_money(totals, other):
+        """Add per-currency money totals in other into totals"""
+        for currency, money in other.items():
+            target = totals.setdefault(currency, dict.fromkeys(ClosedAccountVault.TOTAL_KEYS, 0))
+            for key in ClosedAccountVault.TOTAL_KEYS:
+                target[key] += money[key]
+    
+    @classmethod
+    def check_accounts(cls, accounts, spill_dir, partitions, chunk_id=0):
+        """Verify a list of (username, user_data) pairs; transfer legs go to partitioned spill files"""
+        result = {
+            'accounts': 0,
+            'transactions': 0,
+            'currencies': {},       # Money totals in cents, kept apart per currency
+            'counts': Counter(),
+            'issues': []
+        }
+        counts = result['counts']
+        issues = result['issues']
+        
+        def report(username, check, detail, severity='error'):
+            counts[check] += 1
+            if counts[check] <= cls.MAX_SAMPLES:
+                issues.append({'account': username, 'check': check, 'severity': severity, 'detail': detail})
+        
+        archive = TransactionArchive()
+        # The other leg of a transfer with a compacted account is in the vault, counted in its totals
+        vaulted = ClosedAccountVault.tombstones()
+        buffers = [[] for _ in range(partitions)]
+        for username, user_data in accounts:
+            result['accounts'] += 1
+            money = result['currencies'].setdefault(FXRateTable.currency_of(user_data),
+                                                    dict.fromkeys(ClosedAccountVault.TOTAL_KEYS, 0))
+            try:
+                transactions = archive.transactions(username, user_data)
+            except (IOError, OSError, ValueError) as e:
+                report(username, 'archive_unreadable', str(e))
+                transactions = user_data.get('transactions', [])
+            
+            running = 0
+            previous_timestamp = ''
+            for position, transaction in enumerate(transactions):
+                result['transactions'] += 1
+                kind = transaction.get('type')
+                cents = _cents(transaction.get('amount', 0))
+                if kind in cls.CREDIT_TYPES:
+                    running += cents
+                elif kind in cls.DEBIT_TYPES:
+                    running -= cents
+                after = _cents(transaction.get('balance_after', 0))
+                if abs(after - running) > cls.TOLERANCE_CENTS:
+                    report(username, 'chain_break',
+                           f"transaction {position} ({kind}) balance_after {after / 100:.2f}, "
+                           f"expected {running / 100:.2f}")
+                    running = after  # Resynchronise so one bad entry is reported once
+                
+                timestamp = transaction.get('timestamp', '')
+                if timestamp < previous_timestamp:
+                    report(username, 'out_of_order', f"transaction {position} at {timestamp} precedes "
+                                                     f"{previous_timestamp}", severity='warning')
+                previous_timestamp = max(previous_timestamp, timestamp)
+                
+                if kind in cls.EXTERNAL_CREDITS:
+                    money['external_credit_cents'] += cents
+                elif kind in cls.EXTERNAL_DEBITS:
+                    money['external_debit_cents'] += cents
+                elif kind == 'transfer_out':
+                    # Cross-currency legs move different amounts on each side, so they are totalled apart
+                    money['fx_out_cents' if 'fx_rate' in transaction else 'transfer_out_cents'] += cents
+                    counterparty = transaction.get('recipient')
+                    if counterparty is None:
+                        report(username, 'leg_unlinked', f"transfer_out {position} has no recipient")
+                    elif counterparty.partition(SubAccountManager.SEPARATOR)[0] not in vaulted:
+                        key = f"{username}|{counterparty}|{timestamp}|{cents}"
+                        buffers[zlib.crc32(key.encode()) % partitions].append(f"O\t{key}\n")
+                elif kind == 'transfer_in':
+                    if 'fx_rate' in transaction:
+                        money['fx_in_cents'] += cents
+                        source_amount = transaction.get('source_amount', 0)
+                        expected = _cents(round(source_amount * transaction['fx_rate'], 2))
+                        if abs(cents - expected) > cls.TOLERANCE_CENTS:
+                            report(username, 'fx_mismatch',
+                                   f"transfer_in {position} credited {cents / 100:.2f}, but {source_amount:.2f} "
+                                   f"at {transaction['fx_rate']} is {expected / 100:.2f}")
+                        cents = _cents(source_amount)  # Paired with the sender's leg in its currency
+                    else:
+                        money['transfer_in_cents'] += cents
+                    counterparty = transaction.get('sender')
+                    if counterparty is None:
+                        report(username, 'leg_unlinked', f"transfer_in {position} has no sender")
+                    elif counterparty.partition(SubAccountManager.SEPARATOR)[0] not in vaulted:
+                        key = f"{counterparty}|{username}|{timestamp}|{cents}"
+                        buffers[zlib.crc32(key.encode()) % partitions].append(f"I\t{key}\n")
+            
+            balance = _cents(user_data.get('balance', 0))
+            money['balance_cents'] += balance
+            if abs(balance - running) > cls.TOLERANCE_CENTS:
+                report(username, 'balance_mismatch',
+                       f"balance {balance / 100:.2f} but transactions sum to {running / 100:.2f}")
+            if transactions:
+                last = _cents(transactions[-1].get('balance_after', 0))
+                if abs(balance - last) > cls.TOLERANCE_CENTS:
+                    report(username, 'balance_after_mismatch',
+                           f"balance {balance / 100:.2f} but last balance_after is {last / 100:.2f}")
+            if balance < 0:
+                report(username, 'negative_balance', f"balance {balance / 100:.2f}")
+            held = _cents(user_data.get('held_total', 0))
+            remaining = sum(_cents(hold.get('remaining', 0)) for hold in user_data.get('holds', {}).values())
+            if abs(held - remaining) > cls.TOLERANCE_CENTS:
+                report(username, 'held_total_mismatch',
+                       f"held_total {held / 100:.2f} but pending holds sum to {remaining / 100:.2f}")
+            if held > balance:
+                report(username, 'overheld', f"holds of {held / 100:.2f} exceed balance {balance / 100:.2f}")
+        
+        for partition, lines in enumerate(buffers):
+            if lines:
+                with open(os.path.join(spill_dir, f"p{partition:04d}-{chunk_id:09d}.legs"), 'w') as f:
+                    f.writelines(lines)
+        return result
+    
+    @staticmethod
+    def print_report(report, show=20):
+        """Display an integrity report"""
+        print("\n🧾 LEDGER INTEGRITY REPORT")
+        print("=" * 80)
+        print(f"Accounts: {report['accounts']:,}   Transactions: {report['transactions']:,}   "
+              f"Transfer legs: {report['transfer_legs']:,}   Vaulted accounts: {report['vault_accounts']:,}")
+        for currency, money in sorted(report['currencies'].items()):
+            amount = {key: FXRateTable.format(cents / 100, currency) for key, cents in money.items()}
+            print(f"{currency} total: {amount['balance_cents']}   External in: {amount['external_credit_cents']}   "
+                  f"External out: {amount['external_debit_cents']}")
+            print(f"    Conservation drift: {amount['conservation_drift_cents']}   "
+                  f"Transfer imbalance: {amount['transfer_imbalance_cents']}")
+            if money['fx_out_cents'] or money['fx_in_cents']:
+                print(f"    Cross-currency: {amount['fx_out_cents']} sent, {amount['fx_in_cents']} credited")
+        print(f"Workers: {report['workers']}   Load: {report['load_seconds']:.2f}s   "
+              f"Check: {report['check_seconds']:.2f}s")
+        print("-" * 80)
+        if not report['counts']:
+            print("✅ No discrepancies found.")
+        for check, count in sorted(report['counts'].items()):
+            marker = "⚠️ " if check in LedgerChecker.WARNINGS else "❌"
+            print(f"{marker} {check}: {count:,}")
+        for issue in report['issues'][:show]:
+            print(f"   [{issue['check']}] {issue['account'] or 'bank'}: {issue['detail']}")
+        if len(report['issues']) > show:
+            print(f"   ... {len(report['issues']) - show} more samples in the full report")
+        print("=" * 80)
@@ -0,0 +1,227 @@
+"""
+Interest Engine - Batch interest accrual and monthly fees across all accounts
+"""
+
+import json
+import os
+import re
+from utils.file_handler import FileHandler
+from utils.audit_log import AuditLogger
+from utils.change_feed import ChangeFeed
+from banking.currency import FXRateTable
+
+class InterestEngine:
+    """Computes and posts interest and fees for a period in one pass, idempotently"""
+    
+    CONFIG_FILE = "interest.json"
+    JOURNAL_DIR = "accruals"
+    
+    # Balances and fee amounts are in dollars, converted for accounts in other currencies
+    DEFAULT_CONFIG = {
+        # Marginal annual rates: each tier's rate applies to the slice of balance above its floor
+        'rate_tiers': [
+            {'min_balance': 0, 'annual_rate': 0.005},
+            {'min_balance': 10000, 'annual_rate': 0.015},
+            {'min_balance': 50000, 'annual_rate': 0.025}
+        ],
+        'fees': [
+            # Monthly maintenance fee, waived at or above the minimum balance
+            {'name': 'Monthly maintenance fee', 'amount': 2.00, 'waive_min_balance': 1000}
+        ]
+    }
+    
+    def __init__(self, config=None):
+        self.config = config or self._load_config()
+        self.tiers = sorted(self.config['rate_tiers'], key=lambda tier: tier['min_balance'])
+        self.audit_logger = AuditLogger()
+    
+    def _load_config(self):
+        """Defaults overridden by data/interest.json when present"""
+        config = json.loads(json.dumps(self.DEFAULT_CONFIG))
+        path = os.path.join(FileHandler.DATA_DIR, self.CONFIG_FILE)
+        try:
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    config.update(json.load(f))
+        except Exception as e:
+            print(f"❌ Error loading interest configuration: {e}")
+        return config
+    
+    @staticmethod
+    def validate_period(period):
+        """Periods are calendar months written as YYYY-MM"""
+        if not re.match(r"^\d{4}-(0[1-9]|1[0-2])$", period or ''):
+            raise ValueError(f"Invalid period '{period}'. Use YYYY-MM.")
+        return period
+    
+    def monthly_interest(self, balance, currency=None):
+        """Interest for one month on balance using marginal rate tiers"""
+        if balance <= 0:
+            return 0.0
+        fx = FXRateTable()
+        interest = 0.0
+        for index, tier in enumerate(self.tiers):
+            floor = fx.threshold(tier['min_balance'], currency)
+            if balance <= floor:
+                break
+            ceiling = fx.threshold(self.tiers[index + 1]['min_balance'], currency) \
+                if index + 1 < len(self.tiers) else balance
+            portion = min(balance, ceiling) - floor
+            interest += portion * tier['annual_rate'] / 12
+        return round(interest, 2)
+    
+    def compute_postings(self, username, user_data, period):
+        """Postings (interest first, then fees) owed by one account for the period"""
+        if user_data.get('account_status', 'active') != 'active':
+            return []
+        if self._already_posted(user_data, period):
+            return []
+        
+        postings = []
+        balance = user_data['balance']
+        currency = FXRateTable.currency_of(user_data)
+        fx = FXRateTable()
+        interest = self.monthly_interest(balance, currency)
+        if interest > 0:
+            postings.append(('interest', interest, f"Interest for {period}"))
+            balance += interest
+        
+        for fee in self.config.get('fees', []):
+            waive_at = fx.threshold(fee.get('waive_min_balance'), currency)
+            if waive_at is not None and balance >= waive_at:
+                continue
+            amount = round(min(fx.threshold(fee['amount'], currency), max(balance, 0)), 2)
+            if amount > 0:
+                postings.append(('fee', amount, f"{fee['name']} ({period})"))
+                balance -= amount
+        return postings
+    
+    def run(self, period, chunk_size=None, dry_run=False):
+        """Post the period for every account.
+
+        Each account records the periods posted to it, so rerunning a period
+        (or resuming after a crash) never double-posts, and a missed month can
+        still be back-filled after a later one. A completed period is answered from
+        its journal, so accounts only keep the periods that have not completed yet.
+        Without chunk_size everything
+        is committed in a single save; with it, progress is committed every chunk_size accounts.
+        Each chunk is reloaded, posted and saved under the writer lock, so live
+        transactions committed while the run is in progress are kept.
+        """
+        self.validate_period(period)
+        journal = self._journal_path(period)
+        if os.path.exists(journal):
+            with open(journal, 'r') as f:
+                summary = json.load(f)
+            summary['already_completed'] = True
+            return summary
+        
+        completed = self._completed_periods()
+        summary = {
+            'period': period,
+            'accounts_posted': 0,
+            'accounts_skipped': 0,
+            'totals': {},           # Currency -> interest and fees posted, each in that currency
+            'accounts_backfilled': 0,
+            'completed_at': None,
+            'dry_run': dry_run
+        }
+        
+        if dry_run:
+            timestamp = FileHandler.get_current_timestamp()
+            for username, user_data in FileHandler.load_users().items():
+                self._post_account(username, user_data, period, timestamp, summary, completed)
+        else:
+            for users_data, chunk in FileHandler.locked_chunks(FileHandler.load_users(), chunk_size):
+                # Stamped as the chunk commits, so postings never predate live entries saved before them
+                timestamp = FileHandler.get_current_timestamp()
+                unpublished = []  # Feed events and audit records wait until the save that commits them
+                for username in chunk:
+                    user_data = users_data.get(username)
+                    if user_data is None:
+                        continue  # Compacted since the run started
+                    balance_before = user_data['balance']
+                    postings = self._post_account(username, user_data, period, timestamp, summary, completed)
+                    if postings:
+                        unpublished.append((username, balance_before, user_data['balance'], len(postings)))
+                if not FileHandler.save_users(users_data):
+                    raise IOError("Failed to commit accruals")
+                self._publish(unpublished, period, timestamp)
+        
+        for totals in summary['totals'].values():
+            totals['interest'] = round(totals['interest'], 2)
+            totals['fee'] = round(totals['fee'], 2)
+        if dry_run:
+            return summary
+        
+        summary['completed_at'] = FileHandler.get_current_timestamp()
+        self._write_journal(journal, summary)
+        return summary
+    
+    def _post_account(self, username, user_data, period, timestamp, summary, completed):
+        """Apply the period's postings to one account record; returns them (None when skipped)"""
+        if user_data.get('account_status', 'active') != 'active' or self._already_posted(user_data, period):
+            summary['accounts_skipped'] += 1
+            return None
+        
+        postings = self.compute_postings(username, user_data, period)
+        totals = summary['totals'].setdefault(FXRateTable.currency_of(user_data), {'interest': 0.0, 'fee': 0.0})
+        for posting_type, amount, description in postings:
+            if posting_type == 'interest':
+                user_data['balance'] = round(user_data['balance'] + amount, 2)
+            else:
+                user_data['balance'] = round(user_data['balance'] - amount, 2)
+            totals[posting_type] += amount
+            user_data.setdefault('transactions', []).append({
+                'type': posting_type,
+                'amount': amount,
+                'description': description,
+                'timestamp': timestamp,
+                'balance_after': user_data['balance']
+            })
+        if user_data.get('last_accrual_period', '') > period:
+            summary['accounts_backfilled'] += 1
+        # Completed periods are never checked per account again, so their entries are dropped
+        user_data['accrual_periods'] = [posted for posted in user_data.get('accrual_periods', [])
+                                        if posted not in completed] + [period]
+        user_data['last_accrual_period'] = max(user_data.get('last_accrual_period', ''), period)
+        summary['accounts_posted'] += 1
+        return postings
+    
+    def _publish(self, unpublished, period, timestamp):
+        """Audit and send committed accrual postings to the change feed"""
+        feed = ChangeFeed()
+        for username, balance_before, balance_after, count in unpublished:
+            amount = round(balance_after - balance_before, 2)
+            self.audit_logger.log('accrual', 'system', accounts=[username], amount=amount,
+                                  balance_before=balance_before, balance_after=balance_after,
+                                  period=period, postings=count)
+            feed.publish('accrual', [username], amount=amount, balance_after=balance_after,
+                         period=period, timestamp=timestamp)
+    
+    @staticmethod
+    def _already_posted(user_data, period):
+        """Whether this period was posted to the account (accounts from before accrual_periods keep only the last)"""
+        return period in user_data.get('accrual_periods', ()) or user_data.get('last_accrual_period') == period
+    
+    def _completed_periods(self):
+        """Periods whose run finished and left a journal"""
+        directory = os.path.join(FileHandler.DATA_DIR, self.JOURNAL_DIR)
+        if not os.path.isdir(directory):
+            return set()
+        return {name[:-len('.json')] for name in os.listdir(directory) if name.endswith('.json')}
+    
+    def _journal_path(self, period):
+        """Completion marker for a period"""
+        return os.path.join(FileHandler.DATA_DIR, self.JOURNAL_DIR, f"{period}.json")
+    
+    @staticmethod
+    def _write_journal(path, summary):
+        """Record that a period finished so reruns return immediately"""
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        temp_file = path + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(summary, f, indent=2)
+        os.replace(temp_file, path)
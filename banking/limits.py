@@ -0,0 +1,123 @@
+"""
+Limit Manager - Rolling daily and monthly limits backed by time-bucketed counters
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+from utils.file_handler import FileHandler
+from banking.currency import FXRateTable
+
+class LimitManager:
+    """Enforces rolling-window limits per account and operation type"""
+    
+    LIMITS_FILE = "limits.json"
+    
+    # Window name -> (bucket width in seconds, number of buckets)
+    WINDOWS = {
+        'daily': (3600, 24),       # Rolling 24 hours in hourly buckets
+        'monthly': (86400, 30)     # Rolling 30 days in daily buckets
+    }
+    
+    # Operation -> window -> maximum total in dollars, converted for other currencies (None means unlimited)
+    DEFAULT_LIMITS = {
+        'deposit': {'daily': 25000, 'monthly': None},
+        'withdrawal': {'daily': 10000, 'monthly': 50000},
+        'transfer': {'daily': 20000, 'monthly': 100000},
+        'internal_transfer': {'daily': None, 'monthly': None}  # Between a customer's own accounts
+    }
+    
+    # Transaction types that count toward each operation's limits
+    TRANSACTION_TYPES = {
+        'deposit': 'deposit',
+        'withdrawal': 'withdrawal',
+        'transfer_out': 'transfer'
+    }
+    
+    def __init__(self):
+        self.limits = self._load_limits()
+    
+    def _load_limits(self):
+        """Load bank-wide limits, letting data/limits.json override the defaults"""
+        limits = {op: dict(windows) for op, windows in self.DEFAULT_LIMITS.items()}
+        path = os.path.join(FileHandler.DATA_DIR, self.LIMITS_FILE)
+        try:
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    overrides = json.load(f)
+                for op, windows in overrides.items():
+                    limits.setdefault(op, {}).update(windows)
+        except Exception as e:
+            print(f"❌ Error loading limits configuration: {e}")
+        return limits
+    
+    def get_limit(self, user_data, operation, window):
+        """Effective limit in the account's currency (per-account overrides win and are already in it)"""
+        account_limits = user_data.get('limits', {}).get(operation, {})
+        if window in account_limits:
+            return account_limits[window]
+        return FXRateTable().threshold(self.limits.get(operation, {}).get(window), FXRateTable.currency_of(user_data))
+    
+    def window_total(self, user_data, operation, window, now=None):
+        """Total recorded for an operation in the rolling window (bounded by bucket count)"""
+        now = time.time() if now is None else now
+        width, count = self.WINDOWS[window]
+        oldest = int(now // width) - count + 1
+        buckets = self._counters(user_data).get(operation, {}).get(window, [])
+        return sum(total for bucket, total in buckets if bucket >= oldest)
+    
+    def check(self, user_data, operation, amount, now=None):
+        """Return (allowed, message) for adding amount to every configured window"""
+        for window in self.WINDOWS:
+            limit = self.get_limit(user_data, operation, window)
+            if limit is None:
+                continue
+            used = self.window_total(user_data, operation, window, now)
+            if used + amount > limit + 1e-9:
+                remaining = max(limit - used, 0)
+                label = operation.title()
+                currency = FXRateTable.currency_of(user_data)
+                return False, (f"{window.title()} {operation} limit of {FXRateTable.format(limit, currency)} exceeded. "
+                               f"{label} allowance remaining: {FXRateTable.format(remaining, currency)}")
+        return True, None
+    
+    def record(self, user_data, operation, amount, now=None):
+        """Add amount to the current bucket of every window, expiring old buckets"""
+        now = time.time() if now is None else now
+        counters = self._counters(user_data).setdefault(operation, {})
+        for window, (width, count) in self.WINDOWS.items():
+            current = int(now // width)
+            buckets = [b for b in counters.get(window, []) if b[0] > current - count]
+            if buckets and buckets[-1][0] == current:
+                buckets[-1][1] = round(buckets[-1][1] + amount, 2)
+            else:
+                buckets.append([current, amount])
+            counters[window] = buckets
+    
+    def _counters(self, user_data):
+        """Counter state for an account, rebuilt once from history for older accounts"""
+        if 'limit_counters' not in user_data:
+            user_data['limit_counters'] = {}
+            self._rebuild(user_data)
+        return user_data['limit_counters']
+    
+    def _rebuild(self, user_data):
+        """Seed counters from recent transactions (one-time migration)"""
+        now = time.time()
+        horizon = max(width * count for width, count in self.WINDOWS.values())
+        recent = []
+        for transaction in reversed(user_data.get('transactions', [])):
+            try:
+                when = datetime.strptime(transaction['timestamp'], "%Y-%m-%d %H:%M:%S").timestamp()
+            except (KeyError, ValueError):
+                continue
+            if when < now - horizon:
+                break
+            operation = self.TRANSACTION_TYPES.get(transaction.get('type'))
+            if transaction.get('internal'):
+                operation = 'internal_transfer' if transaction['type'] == 'transfer_out' else None
+            if operation and transaction.get('description') != 'Initial deposit':
+                recent.append((when, operation, transaction['amount']))
+        for when, operation, amount in reversed(recent):
+            self.record(user_data, operation, amount, now=when)
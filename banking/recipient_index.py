@@ -0,0 +1,167 @@
+"""
+Recipient Index - Prefix trie over usernames and token index over names for recipient lookup
+"""
+
+import heapq
+from utils.file_handler import FileHandler
+
+class RecipientIndex:
+    """In-memory, incrementally maintained index of active accounts"""
+    
+    _instance = None
+    END = ''  # Trie key marking the end of a username
+    
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(RecipientIndex, cls).__new__(cls)
+            cls._instance.reset()
+        return cls._instance
+    
+    def reset(self):
+        """Drop all indexed data; the next lookup rebuilds from storage"""
+        self.trie = {}
+        self.name_tokens = {}
+        self.names = {}
+        self.built = False
+        self.data_dir = None
+    
+    def ensure_built(self, users_data=None):
+        """Build the index from storage once per data directory"""
+        if self.built and self.data_dir == FileHandler.DATA_DIR:
+            return
+        self.reset()
+        if users_data is None:
+            users_data = FileHandler.load_users()
+        for username, user_data in users_data.items():
+            if user_data.get('account_status', 'active') == 'active':
+                self._insert(username, user_data.get('name', ''))
+        self.built = True
+        self.data_dir = FileHandler.DATA_DIR
+    
+    def add(self, username, name):
+        """Index a new account (called on signup); unbuilt indexes pick it up when built"""
+        if self.built:
+            self._insert(username, name)
+    
+    def _insert(self, username, name):
+        """Insert an account into the trie and token index"""
+        node = self.trie
+        for char in username:
+            node = node.setdefault(char, {})
+        node[self.END] = True
+        self.names[username] = name
+        for token in self._tokens(name):
+            self.name_tokens.setdefault(token, set()).add(username)
+    
+    def remove(self, username):
+        """Remove an account (called on closure)"""
+        if not self.built or username not in self.names:
+            return
+        path = [self.trie]
+        for char in username:
+            path.append(path[-1][char])
+        path[-1].pop(self.END, None)
+        # Prune now-empty branches bottom-up
+        for depth in range(len(username), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][username[depth - 1]]
+        for token in self._tokens(self.names.pop(username)):
+            usernames = self.name_tokens.get(token)
+            if usernames:
+                usernames.discard(username)
+                if not usernames:
+                    del self.name_tokens[token]
+    
+    def contains(self, username):
+        """Exact lookup"""
+        return username in self.names
+    
+    def autocomplete(self, prefix, limit=10):
+        """Usernames starting with prefix, in alphabetical order"""
+        node = self.trie
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        results = []
+        stack = [(node, prefix)]
+        while stack and len(results) < limit:
+            node, word = stack.pop()
+            if self.END in node:
+                results.append(word)
+            for char in sorted((c for c in node if c != self.END), reverse=True):
+                stack.append((node[char], word + char))
+        return results
+    
+    def fuzzy(self, query, max_distance=2, limit=10, anchor_first=False):
+        """Usernames within max_distance edits of query (trie-pruned Levenshtein)
+
+        With anchor_first only names sharing the query's first character are searched,
+        which covers most typos while visiting a small fraction of the trie.
+        """
+        results = []
+        columns = range(1, len(query) + 1)
+        first_row = list(range(len(query) + 1))
+        if anchor_first and query:
+            node = self.trie.get(query[0])
+            if node is None:
+                return []
+            stack = [(node, query[0], [1] + [column - 1 for column in columns])]
+        else:
+            stack = [(self.trie, '', first_row)]
+        while stack:
+            node, word, previous_row = stack.pop()
+            for char, child in node.items():
+                if char == self.END:
+                    continue
+                row = [previous_row[0] + 1]
+                for column in columns:
+                    cost = 0 if query[column - 1] == char else 1
+                    row.append(min(row[column - 1] + 1,
+                                   previous_row[column] + 1,
+                                   previous_row[column - 1] + cost))
+                if min(row) > max_distance:
+                    continue
+                if self.END in child and row[-1] <= max_distance:
+                    results.append((row[-1], word + char))
+                stack.append((child, word + char, row))
+        results.sort()
+        return [username for _, username in results[:limit]]
+    
+    def search_names(self, query, limit=10):
+        """Usernames whose full name contains every token of query"""
+        tokens = self._tokens(query)
+        if not tokens:
+            return []
+        matches = None
+        for token in sorted(tokens, key=lambda t: len(self.name_tokens.get(t, ()))):
+            usernames = self.name_tokens.get(token, set())
+            matches = set(usernames) if matches is None else matches & usernames
+            if not matches:
+                return []
+        return heapq.nsmallest(limit, matches)
+    
+    def suggest(self, query, limit=5):
+        """'Did you mean' candidates: prefix matches, then near-misses, then name matches"""
+        self.ensure_built()
+        # Cheapest searches first: one edit before two, anchored before the whole trie
+        near_misses = []
+        for anchor_first in (True, False):
+            for max_distance in ((1, 2) if len(query) > 4 else (1,)):
+                near_misses = self.fuzzy(query, max_distance, limit, anchor_first=anchor_first)
+                if near_misses:
+                    break
+            if near_misses:
+                break
+        suggestions = []
+        for candidates in (self.autocomplete(query, limit), near_misses, self.search_names(query, limit)):
+            for username in candidates:
+                if username not in suggestions:
+                    suggestions.append(username)
+        return [(username, self.names[username]) for username in suggestions[:limit]]
+    
+    @staticmethod
+    def _tokens(name):
+        """Lower-case word tokens of a name"""
+        return set(name.lower().split())
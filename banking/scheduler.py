@@ -0,0 +1,355 @@
+"""
+Transfer Scheduler - Standing orders and future-dated transfers driven by a min-heap of due times
+"""
+
+import calendar
+import heapq
+import time
+import uuid
+from datetime import datetime, timedelta
+from utils.file_handler import FileHandler, exclusive_write
+from utils.metrics import metrics
+from utils.audit_log import AuditLogger
+from utils.change_feed import ChangeFeed
+from auth.session import SessionManager
+from banking.transfer import TransferManager
+from banking.currency import FXRateTable
+
+SCHEDULED_RUNS = metrics.counter(
+    'securebank_scheduled_transfers_total', "Scheduled transfer attempts", ('outcome',))
+
+class TransferScheduler:
+    """Stores schedules on each account and executes due ones in next-run order"""
+    
+    _instance = None
+    
+    FREQUENCIES = ('once', 'daily', 'weekly', 'monthly')
+    MAX_RETRIES = 3          # Attempts per occurrence after the first failure
+    RETRY_DELAY = 3600       # Seconds before the first retry; doubles on each further retry
+    TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+    RESCAN_SECONDS = 3600    # Full rescan as a backstop for a schedule whose feed event was never published
+    
+    # Failures that retrying cannot fix
+    PERMANENT_FAILURES = ('recipient_missing', 'recipient_inactive', 'self_transfer',
+                          'invalid_amount', 'max_exceeded')
+    
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(TransferScheduler, cls).__new__(cls)
+            cls._instance.heap = []
+            cls._instance.data_dir = None
+            cls._instance.synced_seq = None
+            cls._instance.rescanned_at = 0.0
+            cls._instance.session_manager = SessionManager()
+            cls._instance.transfer_manager = TransferManager()
+            cls._instance.audit_logger = AuditLogger()
+        return cls._instance
+    
+    def manage_schedules(self):
+        """Interactive menu to list, create and cancel the current user's standing orders"""
+        try:
+            current_user = self.session_manager.get_current_user()
+            if not current_user:
+                print("❌ Please log in first.")
+                return
+            username = current_user['username']
+            
+            print(f"\n📅 SCHEDULED TRANSFERS")
+            print("-" * 50)
+            schedules = [s for s in self.list_schedules(username) if s['status'] in ('active', 'suspended')]
+            if not schedules:
+                print("No scheduled transfers.")
+            for schedule in schedules:
+                print(f"[{schedule['id']}] {FXRateTable.format(schedule['amount'], current_user.get('currency'))} "
+                      f"to {schedule['recipient']} ({schedule['frequency']}) next: {schedule['next_run']} - {schedule['status']}")
+                if schedule.get('last_error'):
+                    print(f"           last error: {schedule['last_error']}")
+            print("-" * 50)
+            print("1. ➕ New scheduled transfer")
+            print("2. ✖️  Cancel a scheduled transfer")
+            print("3. ↩️  Back")
+            choice = input("Enter your choice (1-3): ").strip()
+            
+            if choice == '1':
+                recipient = input("Recipient's username: ").strip().lower()
+                try:
+                    amount = round(float(input(f"Amount ({current_user.get('currency', 'USD')}): ")), 2)
+                except ValueError:
+                    print("❌ Please enter a valid amount.")
+                    return
+                frequency = input(f"Frequency ({'/'.join(self.FREQUENCIES)}): ").strip().lower()
+                start = input("First run (YYYY-MM-DD [HH:MM], blank for now): ").strip()
+                try:
+                    first_run = datetime.now().replace(microsecond=0) if not start else (
+                        datetime.strptime(start, "%Y-%m-%d %H:%M") if ' ' in start
+                        else datetime.strptime(start, "%Y-%m-%d"))
+                except ValueError:
+                    print("❌ Invalid date. Use YYYY-MM-DD or YYYY-MM-DD HH:MM.")
+                    return
+                description = input("Description (optional): ").strip()
+                schedule = self.create(username, recipient, amount, frequency, first_run, description)
+                if schedule:
+                    print(f"✅ Scheduled transfer {schedule['id']} created; first run {schedule['next_run']}.")
+            elif choice == '2':
+                schedule_id = input("Schedule id to cancel: ").strip()
+                if self.cancel(username, schedule_id):
+                    print("✅ Scheduled transfer cancelled.")
+                else:
+                    print("❌ No active scheduled transfer with that id.")
+                    
+        except Exception as e:
+            print(f"❌ Error managing scheduled transfers: {e}")
+    
+    @exclusive_write
+    def create(self, username, recipient, amount, frequency, first_run, description=""):
+        """Add a schedule for username; returns the schedule or None if rejected"""
+        try:
+            if frequency not in self.FREQUENCIES:
+                print(f"❌ Frequency must be one of: {', '.join(self.FREQUENCIES)}.")
+                return None
+            first_run = self._parse(first_run) if isinstance(first_run, str) else first_run.replace(microsecond=0)
+            
+            users_data = FileHandler.load_users()
+            self._sync(users_data)
+            allowed, reason, message = self.transfer_manager.validate_transfer(
+                users_data, username, recipient, amount)
+            if not allowed and reason in self.PERMANENT_FAILURES + ('sender_inactive',):
+                print(f"❌ {message}")
+                return None
+            
+            when = first_run.strftime(self.TIME_FORMAT)
+            schedule = {
+                'id': uuid.uuid4().hex[:8],
+                'recipient': recipient,
+                'amount': amount,
+                'description': description or "Standing order",
+                'frequency': frequency,
+                'day_of_month': first_run.day,
+                'status': 'active',
+                'due_at': when,
+                'next_run': when,
+                'retries': 0,
+                'runs': 0,
+                'last_run': None,
+                'last_error': None,
+                'created_at': FileHandler.get_current_timestamp()
+            }
+            users_data[username].setdefault('scheduled_transfers', []).append(schedule)
+            if not FileHandler.save_users(users_data):
+                return None
+            heapq.heappush(self.heap, (first_run.timestamp(), username, schedule['id']))
+            # Other scheduler processes pick the new schedule up from the feed
+            self._mark_synced(ChangeFeed().publish('schedule_create', [username], schedule_id=schedule['id'],
+                                                   next_run=when))
+            self.audit_logger.log('schedule_create', username, accounts=[username, recipient],
+                                  amount=amount, schedule_id=schedule['id'], frequency=frequency)
+            return schedule
+        except Exception as e:
+            print(f"❌ Error creating scheduled transfer: {e}")
+            return None
+    
+    @exclusive_write
+    def cancel(self, username, schedule_id):
+        """Cancel one of username's schedules; its heap entry is discarded lazily"""
+        try:
+            users_data = FileHandler.load_users()
+            schedule = self._find(users_data.get(username, {}), schedule_id)
+            if not schedule or schedule['status'] != 'active':
+                return False
+            schedule['status'] = 'cancelled'
+            if not FileHandler.save_users(users_data):
+                return False
+            # The heap entry is discarded lazily here and in other scheduler processes alike
+            self._mark_synced(ChangeFeed().publish('schedule_cancel', [username], schedule_id=schedule_id))
+            self.audit_logger.log('schedule_cancel', username, accounts=[username], schedule_id=schedule_id)
+            return True
+        except Exception as e:
+            print(f"❌ Error cancelling scheduled transfer: {e}")
+            return False
+    
+    def list_schedules(self, username):
+        """All schedules stored on an account"""
+        users_data = FileHandler.load_users()
+        return users_data.get(username, {}).get('scheduled_transfers', [])
+    
+    def next_due(self):
+        """Epoch seconds of the earliest pending run, or None"""
+        self._sync()
+        return self.heap[0][0] if self.heap else None
+    
+    def run_due(self, now=None):
+        """Execute every occurrence due at or before now, oldest first; returns a summary"""
+        now = time.time() if now is None else now
+        summary = {'executed': 0, 'retrying': 0, 'missed': 0, 'suspended': 0, 'cancelled': 0}
+        self._sync()
+        
+        while self.heap and self.heap[0][0] <= now:
+            due, username, schedule_id = heapq.heappop(self.heap)
+            # One occurrence per lock, so live writers are not held off through a long catch-up
+            with FileHandler.writer_lock():
+                users_data = FileHandler.load_users()
+                schedule = self._find(users_data.get(username, {}), schedule_id)
+                # Stale entries (cancelled or rescheduled since they were pushed) are skipped
+                if not schedule or schedule['status'] != 'active' or self._epoch(schedule['next_run']) != due:
+                    continue
+                
+                outcome, users_data = self._execute(users_data, username, schedule, now)
+                summary[outcome] += 1
+                SCHEDULED_RUNS.labels(outcome).inc()
+                schedule = self._find(users_data[username], schedule_id)
+                if schedule['status'] == 'active':
+                    heapq.heappush(self.heap, (self._epoch(schedule['next_run']), username, schedule_id))
+                # Successful transfers commit the schedule with them; anything else is committed here
+                if outcome != 'executed':
+                    FileHandler.save_users(users_data)
+        
+        return summary
+    
+    def run_forever(self, interval=60):
+        """Tick until interrupted, sleeping until the next due run (at most interval seconds)"""
+        while True:
+            summary = self.run_due()
+            if any(summary.values()):
+                print(f"🕒 {FileHandler.get_current_timestamp()} " +
+                      ", ".join(f"{key}: {value}" for key, value in summary.items() if value))
+            next_due = self.next_due()
+            wait = interval if next_due is None else min(interval, max(0.0, next_due - time.time()))
+            time.sleep(max(wait, 0.5))
+    
+    def _execute(self, users_data, username, schedule, now):
+        """Attempt one occurrence; returns (outcome, users_data)"""
+        amount = schedule['amount']
+        recipient = schedule['recipient']
+        allowed, reason, message = self.transfer_manager.validate_transfer(users_data, username, recipient, amount)
+        if not allowed:
+            if reason == 'sender_inactive':
+                schedule['status'] = 'cancelled'
+                schedule['last_error'] = message
+                return 'cancelled', users_data
+            if reason in self.PERMANENT_FAILURES:
+                schedule['status'] = 'suspended'
+                schedule['last_error'] = message
+                self.audit_logger.log('schedule_suspend', 'system', accounts=[username, recipient],
+                                      amount=amount, schedule_id=schedule['id'], reason=reason)
+                return 'suspended', users_data
+            return self._retry(schedule, message, now), users_data
+        
+        # Advance the schedule before transferring so the transfer's save commits both together
+        previous = dict(schedule)
+        schedule['runs'] += 1
+        schedule['retries'] = 0
+        schedule['last_run'] = datetime.fromtimestamp(now).strftime(self.TIME_FORMAT)
+        schedule['last_error'] = None
+        self._advance(schedule)
+        
+        if self.transfer_manager._process_transfer(username, recipient, amount,
+                                                   f"{schedule['description']} (scheduled)", users_data=users_data):
+            return 'executed', users_data
+        
+        # Declined, over a limit or errored: reload the committed state and retry this occurrence later
+        users_data = FileHandler.load_users()
+        schedule = self._find(users_data[username], previous['id'])
+        schedule.update(previous)
+        return self._retry(schedule, "Transfer was not completed", now), users_data
+    
+    def _retry(self, schedule, message, now):
+        """Back off and retry the current occurrence, or give up on it after MAX_RETRIES"""
+        schedule['last_error'] = message
+        schedule['retries'] += 1
+        if schedule['retries'] <= self.MAX_RETRIES:
+            delay = self.RETRY_DELAY * 2 ** (schedule['retries'] - 1)
+            schedule['next_run'] = datetime.fromtimestamp(now + delay).strftime(self.TIME_FORMAT)
+            return 'retrying'
+        schedule['retries'] = 0
+        self._advance(schedule)
+        return 'missed'
+    
+    def _advance(self, schedule):
+        """Move due_at/next_run to the following occurrence (or finish a one-off)"""
+        due = self._parse(schedule['due_at'])
+        frequency = schedule['frequency']
+        if frequency == 'once':
+            schedule['status'] = 'completed'
+            return
+        if frequency == 'daily':
+            due += timedelta(days=1)
+        elif frequency == 'weekly':
+            due += timedelta(weeks=1)
+        else:
+            month = due.month % 12 + 1
+            year = due.year + (1 if month == 1 else 0)
+            day = min(schedule['day_of_month'], calendar.monthrange(year, month)[1])
+            due = due.replace(year=year, month=month, day=day)
+        schedule['due_at'] = schedule['next_run'] = due.strftime(self.TIME_FORMAT)
+    
+    def _sync(self, users_data=None):
+        """Bring the heap up to date with schedules created elsewhere, from the change feed
+
+        Only events published since the last sync are read, so a tick costs the
+        traffic since the previous one, not a scan of every schedule. The heap is
+        rebuilt from storage on a cold start, when the feed has a gap or was
+        reset, after a bulk import (imported accounts may carry schedules) and
+        every RESCAN_SECONDS.
+        """
+        feed = ChangeFeed()
+        if self.data_dir != FileHandler.DATA_DIR or self.synced_seq is None or \
+                time.monotonic() - self.rescanned_at >= self.RESCAN_SECONDS:
+            return self._rebuild(users_data)
+        last_seq = feed.last_seq()
+        if last_seq < self.synced_seq:
+            return self._rebuild(users_data)
+        if last_seq == self.synced_seq:
+            return
+        
+        expected = self.synced_seq + 1
+        pushed = []
+        for event in feed.read(expected):
+            if event['seq'] != expected or (event['type'] == 'signup' and event.get('source') == 'import'):
+                return self._rebuild(users_data)
+            expected += 1
+            if event['type'] == 'schedule_create':
+                pushed.append((self._epoch(event['next_run']), event['accounts'][0], event['schedule_id']))
+            # Cancellations need nothing: run_due skips entries whose schedule is no longer active
+        for entry in pushed:
+            heapq.heappush(self.heap, entry)
+        self.synced_seq = expected - 1
+    
+    def _rebuild(self, users_data=None):
+        """Rebuild the heap with one scan of every account's schedules"""
+        # Taken before the scan, so anything published during it is read again rather than missed
+        synced_seq = ChangeFeed().last_seq()
+        if users_data is None:
+            users_data = FileHandler.load_users()
+        heap = []
+        for username, user_data in users_data.items():
+            for schedule in user_data.get('scheduled_transfers', ()):
+                if schedule['status'] == 'active':
+                    heap.append((self._epoch(schedule['next_run']), username, schedule['id']))
+        heapq.heapify(heap)
+        self.heap = heap
+        self.data_dir = FileHandler.DATA_DIR
+        self.synced_seq = synced_seq
+        self.rescanned_at = time.monotonic()
+    
+    def _mark_synced(self, seq):
+        """Skip our own feed event when it directly follows what has been read (its entry is already pushed)"""
+        if seq is not None and self.synced_seq is not None and seq == self.synced_seq + 1:
+            self.synced_seq = seq
+    
+    @staticmethod
+    def _find(user_data, schedule_id):
+        """Schedule with the given id on an account"""
+        for schedule in user_data.get('scheduled_transfers', ()):
+            if schedule['id'] == schedule_id:
+                return schedule
+        return None
+    
+    @classmethod
+    def _parse(cls, value):
+        """Parse a stored timestamp"""
+        return datetime.strptime(value, cls.TIME_FORMAT)
+    
+    @classmethod
+    def _epoch(cls, value):
+        """Epoch seconds of a stored timestamp"""
+        return cls._parse(value).timestamp()
@@ -0,0 +1,209 @@
+"""
+Statement Run - Month-end statements for every active account, in parallel and resumable
+"""
+
+import calendar
+import json
+import multiprocessing
+import os
+import sys
+import time
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import deque
+from utils.file_handler import FileHandler
+from utils.snapshot import SnapshotManager
+from banking.archive import TransactionArchive
+from banking.balance_history import BalanceHistory, LedgerTimestamps
+from banking.transactions import TransactionManager
+
+try:
+    import resource
+except ImportError:  # No getrusage (e.g. Windows); peak memory is left out of the summary
+    resource = None
+
+def _render_chunk(task):
+    """Pool worker: render and write the statements for one chunk of accounts"""
+    chunk_id, accounts, period_dir, start, end, data_dir = task
+    FileHandler.set_data_directory(data_dir)
+    return StatementRun.render_accounts(chunk_id, accounts, period_dir, start, end)
+
+class StatementRun:
+    """Fans month-end statements out over a process pool with a resumable progress manifest"""
+    
+    MANIFEST_FILE = "manifest.jsonl"
+    SUMMARY_FILE = "summary.json"
+    SHARDS = 256                  # Subdirectories per period, so no directory grows huge
+    
+    def __init__(self, period, output_dir="statements", workers=None, chunk_size=500):
+        self.period = TransactionArchive.validate_month(period)
+        self.output_dir = output_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        year, month = (int(part) for part in period.split('-'))
+        self.start = f"{period}-01 00:00:00"
+        self.end = f"{period}-{calendar.monthrange(year, month)[1]:02d} 23:59:59"
+        self.period_dir = os.path.join(output_dir, period)
+        self.manifest_path = os.path.join(self.period_dir, self.MANIFEST_FILE)
+    
+    def run(self):
+        """Render every active account's statement for the period; returns a throughput summary"""
+        started = time.perf_counter()
+        if not os.path.exists(self.period_dir):
+            os.makedirs(self.period_dir)
+        done = self._completed_ranges()
+        
+        # Every statement comes from one pinned version while live traffic keeps committing
+        with SnapshotManager().open() as snapshot:
+            return self._run(snapshot.users(), done, started)
+    
+    def _run(self, users_data, done, started):
+        """Render pending accounts from users_data and write the summary"""
+        usernames = sorted(username for username, user_data in users_data.items()
+                           if user_data.get('account_status', 'active') == 'active'
+                           and user_data.get('created_at', '') <= self.end)
+        pending = [username for username in usernames if not self._in_ranges(done, username)]
+        summary = {
+            'period': self.period,
+            'accounts': len(usernames),
+            'skipped': len(usernames) - len(pending),
+            'rendered': 0,
+            'bytes': 0,
+            'workers': self.workers,
+            'chunks': 0
+        }
+        
+        with open(self.manifest_path, 'a') as manifest:
+            if manifest.tell() and not self._ends_with_newline():
+                manifest.write("\n")  # Keep a torn last line from swallowing the next entry
+            for result in self._render(users_data, pending):
+                # A chunk is only recorded once all of its files are in place
+                manifest.write(json.dumps(result) + "\n")
+                manifest.flush()
+                os.fsync(manifest.fileno())
+                summary['rendered'] += result['count']
+                summary['bytes'] += result['bytes']
+                summary['chunks'] += 1
+        
+        elapsed = time.perf_counter() - started
+        summary['seconds'] = round(elapsed, 3)
+        summary['accounts_per_second'] = round(summary['rendered'] / elapsed, 1) if elapsed else 0.0
+        summary['mb_per_second'] = round(summary['bytes'] / 1048576 / elapsed, 2) if elapsed else 0.0
+        summary['peak_rss_mb'] = summary['peak_worker_rss_mb'] = None
+        if resource:
+            # ru_maxrss is in kilobytes on Linux and bytes on macOS
+            unit = 1048576 if sys.platform == 'darwin' else 1024
+            summary['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1)
+            summary['peak_worker_rss_mb'] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1)
+        with open(os.path.join(self.period_dir, self.SUMMARY_FILE), 'w') as f:
+            json.dump(summary, f, indent=2)
+        return summary
+    
+    def _render(self, users_data, usernames):
+        """Yield chunk results, keeping at most two chunks per worker in flight"""
+        tasks = (self._task(chunk_id, users_data, usernames[start:start + self.chunk_size])
+                 for chunk_id, start in enumerate(range(0, len(usernames), self.chunk_size)))
+        if self.workers <= 1:
+            for task in tasks:
+                yield _render_chunk(task)
+            return
+        
+        with multiprocessing.Pool(self.workers) as pool:
+            in_flight = deque()
+            for task in tasks:
+                in_flight.append(pool.apply_async(_render_chunk, (task,)))
+                if len(in_flight) >= self.workers * 2:
+                    yield in_flight.popleft().get()
+            while in_flight:
+                yield in_flight.popleft().get()
+    
+    def _task(self, chunk_id, users_data, usernames):
+        """Slim per-account payloads: only this period's hot entries and what is needed for balances"""
+        accounts = []
+        for username in usernames:
+            user_data = users_data[username]
+            hot = user_data.get('transactions', [])
+            timestamps = LedgerTimestamps(hot)
+            first = bisect_left(timestamps, self.start)
+            last = bisect_right(timestamps, self.end)
+            accounts.append((username, {
+                'name': user_data['name'],
+                'username': username,
+                'account_status': user_data.get('account_status', 'active'),
+                'balance': user_data['balance'],
+                'created_at': user_data.get('created_at'),
+                'archived': user_data.get('archived'),
+                'transactions': hot[first:last],
+                'balance_before_period': hot[first - 1]['balance_after'] if first else None
+            }))
+        return chunk_id, accounts, self.period_dir, self.start, self.end, FileHandler.DATA_DIR
+    
+    @classmethod
+    def render_accounts(cls, chunk_id, accounts, period_dir, start, end):
+        """Write one statement file per account; returns the chunk's manifest entry"""
+        manager = TransactionManager()
+        history = BalanceHistory()
+        nbytes = 0
+        for username, record in accounts:
+            transactions = manager.archive.transactions(username, record, start[:10], end[:10])
+            if transactions:
+                first = transactions[0]
+                sign = -1 if first['type'] in manager.CREDIT_TYPES else (
+                    1 if first['type'] in manager.DEBIT_TYPES else 0)
+                opening = round(first['balance_after'] + sign * first['amount'], 2)
+                closing = transactions[-1]['balance_after']
+            elif record['balance_before_period'] is not None:
+                opening = closing = record['balance_before_period']
+            elif record['archived']:
+                opening = closing = history.balance_as_of(username, dict(record, transactions=[]), end)[0]
+            else:
+                opening = closing = 0.0
+            
+            directory = os.path.join(period_dir, f"{zlib.crc32(username.encode()) % cls.SHARDS:02x}")
+            if not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{username}.txt")
+            with open(path + '.tmp', 'w') as f:
+                for line in manager._statement_lines(record, transactions, start[:10], end[:10], opening, closing):
+                    f.write(line)
+                    f.write("\n")
+                nbytes += f.tell()
+            os.replace(path + '.tmp', path)
+        return {
+            'chunk': chunk_id,
+            'first': accounts[0][0],
+            'last': accounts[-1][0],
+            'count': len(accounts),
+            'bytes': nbytes
+        }
+    
+    def _completed_ranges(self):
+        """Username ranges already rendered by earlier attempts, as (firsts, running max of lasts)"""
+        ranges = []
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A torn final line from an interrupted run
+                    ranges.append((entry['first'], entry['last']))
+        ranges.sort()
+        firsts = [first for first, _ in ranges]
+        reach = []
+        for _, last in ranges:
+            reach.append(max(last, reach[-1]) if reach else last)
+        return firsts, reach
+    
+    def _ends_with_newline(self):
+        """Whether the manifest's last byte is a newline"""
+        with open(self.manifest_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+    
+    @staticmethod
+    def _in_ranges(ranges, username):
+        """Whether username falls inside any completed range (ranges from resumed runs may overlap)"""
+        firsts, reach = ranges
+        index = bisect_right(firsts, username) - 1
+        return index >= 0 and reach[index] >= username
@@ -0,0 +1,238 @@
+"""
+Sub-Account Manager - Several typed accounts (checking, savings) under one customer login
+"""
+
+import time
+from utils.file_handler import FileHandler, exclusive_write
+from auth.session import SessionManager
+from utils.metrics import BANKING_AMOUNT, BANKING_OPERATIONS, BANKING_SECONDS
+from utils.audit_log import AuditLogger
+from utils.change_feed import ChangeFeed
+from banking.limits import LimitManager
+from banking.currency import FXRateTable
+
+class SubAccountManager:
+    """Opens extra accounts for a customer and moves money between them
+
+    The customer record keeps the login, profile and the primary checking account
+    (its 'balance' and 'transactions'), so every existing reader sees the primary
+    account unchanged. Further accounts live in the customer's 'sub_accounts' map,
+    keyed by account id; each holds only its own balance, ledger, limits and
+    counters, never a copy of the customer's details.
+    """
+    
+    ACCOUNT_TYPES = ('checking', 'savings')
+    PRIMARY = 'checking'
+    SEPARATOR = ':'        # Ledger name of a sub-account is "<username>:<account id>"
+    MAX_ACCOUNTS = 10      # Including the primary account
+    ID_MAX_LENGTH = max(len(account_type) for account_type in ACCOUNT_TYPES) + len(f"-{MAX_ACCOUNTS}")
+    
+    def __init__(self):
+        self.session_manager = SessionManager()
+        self.audit_logger = AuditLogger()
+        self.limit_manager = LimitManager()
+    
+    @classmethod
+    def get_account(cls, user_data, account_id):
+        """The record holding an account's balance and ledger, or None"""
+        if account_id == cls.PRIMARY:
+            return user_data
+        return user_data.get('sub_accounts', {}).get(account_id)
+    
+    @classmethod
+    def account_ids(cls, user_data):
+        """Primary account first, then sub-accounts in the order they were opened"""
+        return [cls.PRIMARY] + list(user_data.get('sub_accounts', {}))
+    
+    @classmethod
+    def ledger_name(cls, username, account_id):
+        """Name used for an account's ledger in transfer legs and bank-wide checks"""
+        return username if account_id == cls.PRIMARY else f"{username}{cls.SEPARATOR}{account_id}"
+    
+    @classmethod
+    def ledgers(cls, users_data):
+        """(ledger name, record) for every account in the bank, sub-accounts included"""
+        ledgers = []
+        for username, user_data in users_data.items():
+            ledgers.append((username, user_data))
+            for account_id, record in user_data.get('sub_accounts', {}).items():
+                ledgers.append((cls.ledger_name(username, account_id), record))
+        return ledgers
+    
+    def manage_accounts(self):
+        """Interactive menu to list accounts, open a new one and move money between them"""
+        try:
+            current_user = self.session_manager.get_current_user()
+            if not current_user:
+                print("❌ Please log in first.")
+                return
+            username = current_user['username']
+            user_data = FileHandler.load_users()[username]
+            currency = FXRateTable.currency_of(user_data)
+            
+            print(f"\n🗂️  MY ACCOUNTS")
+            print("-" * 50)
+            for account_id in self.account_ids(user_data):
+                record = self.get_account(user_data, account_id)
+                label = " (primary)" if account_id == self.PRIMARY else ""
+                print(f"{account_id:<15} {record.get('type', self.PRIMARY):<10} "
+                      f"{FXRateTable.format(record['balance'], currency):>14}{label}")
+            print("-" * 50)
+            print("1. ➕ Open a new account")
+            print("2. 🔁 Move money between my accounts")
+            print("3. ↩️  Back")
+            choice = input("Enter your choice (1-3): ").strip()
+            
+            if choice == '1':
+                account_type = input(f"Account type ({'/'.join(self.ACCOUNT_TYPES)}): ").strip().lower()
+                account_id = self.open_account(username, account_type)
+                if account_id:
+                    print(f"✅ Account '{account_id}' opened.")
+            elif choice == '2':
+                source = input("From account: ").strip().lower()
+                destination = input("To account: ").strip().lower()
+                try:
+                    amount = round(float(input(f"Amount ({currency}): ")), 2)
+                except ValueError:
+                    print("❌ Please enter a valid amount.")
+                    return
+                if self.internal_transfer(username, source, destination, amount):
+                    print(f"✅ Moved {FXRateTable.format(amount, currency)} from {source} to {destination}.")
+                    
+        except Exception as e:
+            print(f"❌ Error managing accounts: {e}")
+    
+    @exclusive_write
+    def open_account(self, username, account_type):
+        """Open a new empty account for a customer; returns its id or None if rejected"""
+        try:
+            if account_type not in self.ACCOUNT_TYPES:
+                print(f"❌ Account type must be one of: {', '.join(self.ACCOUNT_TYPES)}.")
+                return None
+            users_data = FileHandler.load_users()
+            user_data = users_data[username]
+            sub_accounts = user_data.setdefault('sub_accounts', {})
+            if len(sub_accounts) + 1 >= self.MAX_ACCOUNTS:
+                print(f"❌ A customer may hold at most {self.MAX_ACCOUNTS} accounts.")
+                return None
+            
+            # First account of a type is named after it, later ones are numbered
+            account_id = account_type
+            number = 1
+            while account_id == self.PRIMARY or account_id in sub_accounts:
+                number += 1
+                account_id = f"{account_type}-{number}"
+            timestamp = FileHandler.get_current_timestamp()
+            sub_accounts[account_id] = {
+                'type': account_type,
+                'balance': 0.0,
+                'currency': FXRateTable.currency_of(user_data),  # Money moves between them unconverted
+                'account_status': 'active',
+                'created_at': timestamp,
+                'transactions': []
+            }
+            
+            if not FileHandler.save_users(users_data, changed=[self.ledger_name(username, account_id)]):
+                return None
+            ChangeFeed().publish('account_open', [self.ledger_name(username, account_id)],
+                                 account_type=account_type, timestamp=timestamp)
+            BANKING_OPERATIONS.labels('account_open', 'success').inc()
+            self.audit_logger.log('account_open', username, accounts=[self.ledger_name(username, account_id)],
+                                  account_type=account_type)
+            return account_id
+            
+        except Exception as e:
+            BANKING_OPERATIONS.labels('account_open', 'error').inc()
+            print(f"❌ Error opening account: {e}")
+            return None
+    
+    @exclusive_write
+    def internal_transfer(self, username, source_id, destination_id, amount, description="Internal transfer"):
+        """Move money between two of a customer's own accounts in a single save
+
+        Both accounts belong to the logged-in customer, so there is no recipient
+        lookup, confirmation or fraud screening, and the transfer does not count
+        toward the external transfer limits.
+        """
+        started = time.perf_counter()
+        source_name = self.ledger_name(username, source_id)
+        destination_name = self.ledger_name(username, destination_id)
+        try:
+            users_data = FileHandler.load_users()
+            user_data = users_data[username]
+            source = self.get_account(user_data, source_id)
+            destination = self.get_account(user_data, destination_id)
+            if source is None or destination is None:
+                print("❌ Unknown account. Choose from: " + ", ".join(self.account_ids(user_data)))
+                return False
+            if source is destination:
+                print("❌ Choose two different accounts.")
+                return False
+            if amount <= 0:
+                print("❌ Amount must be positive.")
+                return False
+            if any(record.get('account_status', 'active') != 'active' for record in (source, destination)):
+                print("❌ Both accounts must be active.")
+                return False
+            available = round(source['balance'] - source.get('held_total', 0.0), 2)
+            if available < amount:
+                BANKING_OPERATIONS.labels('internal_transfer', 'insufficient_funds').inc()
+                print(f"❌ Insufficient funds in {source_id}. "
+                      f"Available: {FXRateTable.format(available, FXRateTable.currency_of(user_data))}")
+                return False
+            
+            allowed, message = self.limit_manager.check(source, 'internal_transfer', amount)
+            if not allowed:
+                BANKING_OPERATIONS.labels('internal_transfer', 'limit_exceeded').inc()
+                print(f"❌ {message}")
+                return False
+            
+            source_before = source['balance']
+            source['balance'] = round(source['balance'] - amount, 2)
+            destination['balance'] = round(destination['balance'] + amount, 2)
+            timestamp = FileHandler.get_current_timestamp()
+            
+            # Same leg shape as transfers between customers, so ledger checks pair them up
+            source['transactions'].append({
+                'type': 'transfer_out',
+                'amount': amount,
+                'description': f"{description} (to {destination_id})",
+                'recipient': destination_name,
+                'internal': True,
+                'timestamp': timestamp,
+                'balance_after': source['balance']
+            })
+            destination['transactions'].append({
+                'type': 'transfer_in',
+                'amount': amount,
+                'description': f"{description} (from {source_id})",
+                'sender': source_name,
+                'internal': True,
+                'timestamp': timestamp,
+                'balance_after': destination['balance']
+            })
+            self.limit_manager.record(source, 'internal_transfer', amount)
+            
+            # One save commits both legs together
+            if not FileHandler.save_users(users_data, changed=[source_name, destination_name]):
+                BANKING_OPERATIONS.labels('internal_transfer', 'error').inc()
+                return False
+            ChangeFeed().publish('internal_transfer', [source_name, destination_name], amount=amount,
+                                 balances={source_name: source['balance'], destination_name: destination['balance']},
+                                 timestamp=timestamp)
+            if source_id == self.PRIMARY or destination_id == self.PRIMARY:
+                self.session_manager.update_session_balance(user_data['balance'])
+            
+            BANKING_OPERATIONS.labels('internal_transfer', 'success').inc()
+            BANKING_AMOUNT.labels('internal_transfer').inc(amount)
+            BANKING_SECONDS.labels('internal_transfer').observe(time.perf_counter() - started)
+            self.audit_logger.log('internal_transfer', username, accounts=[source_name, destination_name],
+                                  amount=amount, balance_before=source_before, balance_after=source['balance'])
+            return True
+            
+        except Exception as e:
+            BANKING_OPERATIONS.labels('internal_transfer', 'error').inc()
+            self.audit_logger.log('internal_transfer', username, accounts=[source_name, destination_name],
+                                  amount=amount, outcome='error', reason=str(e))
+            print(f"❌ Internal transfer error: {e}")
+            return False
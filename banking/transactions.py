@@ -2,14 +2,22 @@
 Transaction Manager - Handles transaction history and statements
 """
 
+from datetime import datetime
 from utils.file_handler import FileHandler
 from auth.session import SessionManager
+from banking.archive import TransactionArchive
+from utils.snapshot import SnapshotManager
+from banking.currency import FXRateTable
 
 class TransactionManager:
     """Manages transaction history and account statements"""
     
+    CREDIT_TYPES = ['deposit', 'transfer_in', 'interest']
+    DEBIT_TYPES = ['withdrawal', 'transfer_out', 'fee']
+    
     def __init__(self):
         self.session_manager = SessionManager()
+        self.archive = TransactionArchive()
     
     def show_transaction_history(self):
         """Display transaction history"""
@@ -21,23 +29,24 @@ class TransactionManager:
             
             users_data = FileHandler.load_users()
             username = current_user['username']
-            transactions = users_data[username].get('transactions', [])
+            user_data = users_data[username]
+            total_count = len(user_data.get('transactions', [])) + user_data.get('archived', {}).get('count', 0)
             
-            if not transactions:
+            # Show recent transactions (last 20), reaching into the archive only if needed
+            recent_transactions = self.archive.recent(username, user_data, 20)
+            
+            if not recent_transactions:
                 print("\n📊 No transactions found.")
                 return
             
             print(f"\n📊 TRANSACTION HISTORY - {current_user['name']}")
             print("=" * 80)
             
-            # Show recent transactions (last 20)
-            recent_transactions = transactions[-20:]
-            
             for i, transaction in enumerate(reversed(recent_transactions), 1):
-                self._display_transaction(transaction, i)
+                self._display_transaction(transaction, i, current_user.get('currency'))
             
-            if len(transactions) > 20:
-                print(f"\n... and {len(transactions) - 20} more transactions")
+            if total_count > 20:
+                print(f"\n... and {total_count - 20} more transactions")
                 print("Generate account statement for complete history.")
             
             print("=" * 80)
@@ -53,13 +62,25 @@ class TransactionManager:
                 print("❌ Please log in first.")
                 return
             
-            users_data = FileHandler.load_users()
-            username = current_user['username']
-            user_data = users_data[username]
-            transactions = user_data.get('transactions', [])
+            # Read from a pinned version so concurrent saves cannot change the account mid-statement
+            with SnapshotManager().open() as snapshot:
+                username = current_user['username']
+                user_data = snapshot.users()[username]
+            
+            # Optional date range; archived months are read only when the range reaches them
+            start = input("Statement start date (YYYY-MM-DD, blank for full history): ").strip() or None
+            end = input("Statement end date (YYYY-MM-DD, blank for today): ").strip() or None
+            try:
+                for value in (start, end):
+                    if value:
+                        datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                print("❌ Invalid date. Use YYYY-MM-DD.")
+                return
+            transactions = self.archive.transactions(username, user_data, start, end)
             
             # Generate statement
-            statement = self._generate_statement_content(user_data, transactions)
+            statement = self._generate_statement_content(user_data, transactions, start, end)
             
             # Display statement
             print(statement)
@@ -74,11 +95,11 @@ class TransactionManager:
                     print(f"✅ Statement saved as {filename}")
                 except Exception as e:
                     print(f"❌ Error saving statement: {e}")
-            
+                    
         except Exception as e:
             print(f"❌ Error generating statement: {e}")
     
-    def _display_transaction(self, transaction, index):
+    def _display_transaction(self, transaction, index, currency=None):
         """Display a single transaction"""
         transaction_type = transaction['type']
         amount = transaction['amount']
@@ -92,64 +113,93 @@ class TransactionManager:
             'withdrawal': '💸 ⬇️',
             'transfer_in': '🔄 ⬆️',
             'transfer_out': '🔄 ⬇️',
+            'interest': '📈 ⬆️',
+            'fee': '🧾 ⬇️',
             'account_closure': '❌'
         }
         
         symbol = type_symbols.get(transaction_type, '📝')
         
         # Format amount with sign
-        if transaction_type in ['deposit', 'transfer_in']:
-            amount_str = f"+${amount:.2f}"
-        elif transaction_type in ['withdrawal', 'transfer_out']:
-            amount_str = f"-${amount:.2f}"
+        if transaction_type in self.CREDIT_TYPES:
+            amount_str = f"+{FXRateTable.format(amount, currency)}"
+        elif transaction_type in self.DEBIT_TYPES:
+            amount_str = f"-{FXRateTable.format(amount, currency)}"
         else:
-            amount_str = f"${amount:.2f}"
+            amount_str = FXRateTable.format(amount, currency)
         
         print(f"{index:2d}. {symbol} {transaction_type.replace('_', ' ').title()}")
         print(f"    Amount: {amount_str}")
         print(f"    Description: {description}")
         print(f"    Date: {timestamp}")
-        print(f"    Balance After: ${balance_after:.2f}")
+        if 'fx_rate' in transaction:
+            print(f"    Exchange: {self._exchange_note(transaction)}")
+        print(f"    Balance After: {FXRateTable.format(balance_after, currency)}")
         print("-" * 80)
     
-    def _generate_statement_content(self, user_data, transactions):
+    @staticmethod
+    def _exchange_note(transaction):
+        """How a cross-currency transfer leg was converted, and with which rate version"""
+        if transaction['type'] == 'transfer_in':
+            source = FXRateTable.format(transaction['source_amount'], transaction['source_currency'])
+            target = FXRateTable.format(transaction['amount'], transaction.get('currency'))
+        else:
+            source = FXRateTable.format(transaction['amount'], transaction.get('currency'))
+            target = FXRateTable.format(transaction['credited_amount'], transaction['credited_currency'])
+        return f"{source} -> {target} at {transaction['fx_rate']:.6g} (rates {transaction['fx_version']})"
+    
+    def _generate_statement_content(self, user_data, transactions, start=None, end=None):
         """Generate complete account statement content"""
-        statement_lines = []
+        return "\n".join(self._statement_lines(user_data, transactions, start, end))
+    
+    def _statement_lines(self, user_data, transactions, start=None, end=None, opening=None, closing=None):
+        """Yield the statement line by line so batch runs can stream it to disk"""
+        currency = FXRateTable.currency_of(user_data)
+        
+        def money(amount):
+            return FXRateTable.format(amount, currency)
         
         # Header
-        statement_lines.append("=" * 80)
-        statement_lines.append("🏦 SECURE BANK - ACCOUNT STATEMENT")
-        statement_lines.append("=" * 80)
-        statement_lines.append("")
+        yield "=" * 80
+        yield "🏦 SECURE BANK - ACCOUNT STATEMENT"
+        yield "=" * 80
+        yield ""
         
         # Account information
-        statement_lines.append("📋 ACCOUNT INFORMATION")
-        statement_lines.append("-" * 40)
-        statement_lines.append(f"Account Holder: {user_data['name']}")
-        statement_lines.append(f"Username: {user_data.get('username', 'N/A')}")
-        statement_lines.append(f"Account Status: {user_data.get('account_status', 'active').title()}")
-        statement_lines.append(f"Current Balance: ${user_data['balance']:.2f}")
-        statement_lines.append(f"Account Created: {user_data.get('created_at', 'N/A')}")
-        statement_lines.append(f"Statement Generated: {FileHandler.get_current_timestamp()}")
-        statement_lines.append("")
+        yield "📋 ACCOUNT INFORMATION"
+        yield "-" * 40
+        yield f"Account Holder: {user_data['name']}"
+        yield f"Username: {user_data.get('username', 'N/A')}"
+        yield f"Account Status: {user_data.get('account_status', 'active').title()}"
+        yield f"Currency: {currency}"
+        yield f"Current Balance: {money(user_data['balance'])}"
+        if opening is not None:
+            yield f"Opening Balance: {money(opening)}"
+        if closing is not None:
+            yield f"Closing Balance: {money(closing)}"
+        yield f"Account Created: {user_data.get('created_at', 'N/A')}"
+        yield f"Statement Generated: {FileHandler.get_current_timestamp()}"
+        if start or end:
+            yield f"Statement Period: {start or 'account opening'} to {end or 'today'}"
+        yield ""
         
         # Transaction summary
         if transactions:
-            total_deposits = sum(t['amount'] for t in transactions if t['type'] in ['deposit', 'transfer_in'])
-            total_withdrawals = sum(t['amount'] for t in transactions if t['type'] in ['withdrawal', 'transfer_out'])
+            total_deposits = sum(t['amount'] for t in transactions if t['type'] in self.CREDIT_TYPES)
+            total_withdrawals = sum(t['amount'] for t in transactions if t['type'] in self.DEBIT_TYPES)
             
-            statement_lines.append("📊 TRANSACTION SUMMARY")
-            statement_lines.append("-" * 40)
-            statement_lines.append(f"Total Transactions: {len(transactions)}")
-            statement_lines.append(f"Total Deposits: ${total_deposits:.2f}")
-            statement_lines.append(f"Total Withdrawals: ${total_withdrawals:.2f}")
-            statement_lines.append(f"Net Amount: ${total_deposits - total_withdrawals:.2f}")
-            statement_lines.append("")
+            yield "📊 TRANSACTION SUMMARY"
+            yield "-" * 40
+            yield f"Total Transactions: {len(transactions)}"
+            yield f"Total Deposits: {money(total_deposits)}"
+            yield f"Total Withdrawals: {money(total_withdrawals)}"
+            yield f"Net Amount: {money(total_deposits - total_withdrawals)}"
+            yield ""
         
         # Transaction details
         if transactions:
-            statement_lines.append("📝 TRANSACTION DETAILS")
-            statement_lines.append("-" * 80)
+            yield "📝 TRANSACTION DETAILS"
+            yield "-" * 80
             
             for i, transaction in enumerate(reversed(transactions), 1):
                 transaction_type = transaction['type']
@@ -159,26 +209,26 @@ class TransactionManager:
                 balance_after = transaction['balance_after']
                 
                 # Format amount with sign
-                if transaction_type in ['deposit', 'transfer_in']:
-                    amount_str = f"+${amount:.2f}"
-                elif transaction_type in ['withdrawal', 'transfer_out']:
-                    amount_str = f"-${amount:.2f}"
+                if transaction_type in self.CREDIT_TYPES:
+                    amount_str = f"+{money(amount)}"
+                elif transaction_type in self.DEBIT_TYPES:
+                    amount_str = f"-{money(amount)}"
                 else:
-                    amount_str = f"${amount:.2f}"
+                    amount_str = money(amount)
                 
-                statement_lines.append(f"{i:3d}. {transaction_type.replace('_', ' ').title()}")
-                statement_lines.append(f"     Amount: {amount_str}")
-                statement_lines.append(f"     Description: {description}")
-                statement_lines.append(f"     Date: {timestamp}")
-                statement_lines.append(f"     Balance After: ${balance_after:.2f}")
-                statement_lines.append("-" * 80)
+                yield f"{i:3d}. {transaction_type.replace('_', ' ').title()}"
+                yield f"     Amount: {amount_str}"
+                yield f"     Description: {description}"
+                yield f"     Date: {timestamp}"
+                if 'fx_rate' in transaction:
+                    yield f"     Exchange: {self._exchange_note(transaction)}"
+                yield f"     Balance After: {money(balance_after)}"
+                yield "-" * 80
         else:
-            statement_lines.append("📝 No transactions found.")
-            statement_lines.append("")
+            yield "📝 No transactions found."
+            yield ""
         
         # Footer
-        statement_lines.append("")
-        statement_lines.append("Thank you for banking with Secure Bank! 🏦")
-        statement_lines.append("=" * 80)
-        
-        return "\n".join(statement_lines)
+        yield ""
+        yield "Thank you for banking with Secure Bank! 🏦"
+        yield "=" * 80
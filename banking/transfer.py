@@ -2,14 +2,30 @@
 Transfer Manager - Handles money transfers between accounts
 """
 
-from utils.file_handler import FileHandler
+import time
+from utils.file_handler import FileHandler, exclusive_write
 from auth.session import SessionManager
+from utils.metrics import BANKING_AMOUNT, BANKING_OPERATIONS, BANKING_SECONDS
+from utils.audit_log import AuditLogger
+from utils.change_feed import ChangeFeed
+from banking.holds import HoldManager
+from banking.currency import FXRateTable
+from banking.limits import LimitManager
+from banking.fraud import FraudScreener
+from banking.recipient_index import RecipientIndex
 
 class TransferManager:
     """Manages money transfer operations"""
     
+    MAX_TRANSFER = 10000  # Per-transaction transfer limit (dollars, converted for other currencies)
+    
     def __init__(self):
         self.session_manager = SessionManager()
+        self.audit_logger = AuditLogger()
+        self.limit_manager = LimitManager()
+        self.fraud_screener = FraudScreener()
+        self.recipient_index = RecipientIndex()
+        self.fx = FXRateTable()
     
     def transfer_money(self):
         """Handle money transfer between accounts"""
@@ -22,8 +38,13 @@ class TransferManager:
             print(f"\n🔄 TRANSFER MONEY")
             print("-" * 20)
             
-            # Get recipient username
-            recipient_username = input("Enter recipient's username: ").strip().lower()
+            # Get recipient username (a trailing '*' lists matching accounts)
+            while True:
+                recipient_username = input("Enter recipient's username (end with * to search): ").strip().lower()
+                if recipient_username.endswith('*'):
+                    self._show_matches(recipient_username[:-1])
+                    continue
+                break
             if not recipient_username:
                 print("❌ Recipient username cannot be empty.")
                 return
@@ -36,6 +57,10 @@ class TransferManager:
             users_data = FileHandler.load_users()
             if recipient_username not in users_data:
                 print("❌ Recipient account not found.")
+                self.recipient_index.ensure_built(users_data)
+                suggestions = self.recipient_index.suggest(recipient_username)
+                if suggestions:
+                    print("💡 Did you mean: " + ", ".join(f"{username} ({name})" for username, name in suggestions))
                 return
             
             # Check if recipient account is active
@@ -45,24 +70,34 @@ class TransferManager:
             
             # Get current balance
             sender_username = current_user['username']
-            sender_balance = users_data[sender_username]['balance']
+            sender_balance = HoldManager.available_balance(users_data[sender_username])
             recipient_name = users_data[recipient_username]['name']
+            sender_currency = FXRateTable.currency_of(users_data[sender_username])
+            recipient_currency = FXRateTable.currency_of(users_data[recipient_username])
             
             print(f"Transferring to: {recipient_name}")
-            print(f"Your available balance: ${sender_balance:.2f}")
+            print(f"Your available balance: {FXRateTable.format(sender_balance, sender_currency)}")
+            if recipient_currency != sender_currency:
+                print(f"💱 {recipient_name} holds {recipient_currency}; the amount will be converted.")
             
             # Get transfer amount
+            max_transfer = FXRateTable().threshold(self.MAX_TRANSFER, sender_currency)
             while True:
                 try:
-                    amount = float(input("Enter transfer amount ($): "))
+                    amount = float(input(f"Enter transfer amount ({sender_currency}): "))
                     if amount <= 0:
                         print("❌ Transfer amount must be positive.")
                         continue
                     if amount > sender_balance:
                         print("❌ Insufficient funds.")
                         continue
-                    if amount > 10000:
-                        print("❌ Maximum transfer limit is $10,000 per transaction.")
+                    if amount > max_transfer:
+                        print(f"❌ Maximum transfer limit is "
+                              f"{FXRateTable.format(max_transfer, sender_currency)} per transaction.")
+                        continue
+                    allowed, message = self.limit_manager.check(users_data[sender_username], 'transfer', amount)
+                    if not allowed:
+                        print(f"❌ {message}")
                         continue
                     break
                 except ValueError:
@@ -79,7 +114,11 @@ class TransferManager:
             print("-" * 30)
             print(f"From: {current_user['name']} ({sender_username})")
             print(f"To: {recipient_name} ({recipient_username})")
-            print(f"Amount: ${amount:.2f}")
+            print(f"Amount: {FXRateTable.format(amount, sender_currency)}")
+            if recipient_currency != sender_currency:
+                credited, rate, version = self.fx.convert(amount, sender_currency, recipient_currency)
+                print(f"Recipient gets: {FXRateTable.format(credited, recipient_currency)} "
+                      f"(rate {rate:.6g}, rates {version}; the rate at the time of the transfer applies)")
             print(f"Description: {description}")
             print("-" * 30)
             
@@ -88,32 +127,115 @@ class TransferManager:
                 print("❌ Transfer cancelled.")
                 return
             
-            # Process transfer
+            # Process transfer (on failure _process_transfer has already printed the reason)
             if self._process_transfer(sender_username, recipient_username, amount, description):
                 print("✅ Transfer completed successfully!")
-                print(f"${amount:.2f} transferred to {recipient_name}")
+                print(f"{FXRateTable.format(amount, sender_currency)} transferred to {recipient_name}")
                 
                 # Show updated balance
                 updated_balance = users_data[sender_username]['balance'] - amount
-                print(f"Your new balance: ${updated_balance:.2f}")
+                print(f"Your new balance: {FXRateTable.format(updated_balance, sender_currency)}")
                 self.session_manager.update_session_balance(updated_balance)
-            else:
-                print("❌ Transfer failed. Please try again.")
                 
         except Exception as e:
             print(f"❌ Error processing transfer: {e}")
     
-    def _process_transfer(self, sender_username, recipient_username, amount, description):
-        """Process the money transfer"""
+    def _show_matches(self, query):
+        """List accounts whose username starts with, or name contains, the query"""
+        self.recipient_index.ensure_built()
+        current_user = self.session_manager.get_current_user()
+        matches = self.recipient_index.autocomplete(query, limit=10)
+        for username in self.recipient_index.search_names(query, limit=10):
+            if username not in matches:
+                matches.append(username)
+        matches = [username for username in matches if username != current_user['username']]
+        
+        if not matches:
+            print("❌ No matching accounts found.")
+            return
+        print("🔎 Matching accounts:")
+        for username in matches[:10]:
+            print(f"   {username} ({self.recipient_index.names[username]})")
+    
+    def validate_transfer(self, users_data, sender_username, recipient_username, amount):
+        """Non-interactive transfer checks; returns (allowed, reason, message)"""
+        sender = users_data.get(sender_username)
+        recipient = users_data.get(recipient_username)
+        if sender is None or sender.get('account_status', 'active') != 'active':
+            return False, 'sender_inactive', "Sender account is not active."
+        if recipient_username == sender_username:
+            return False, 'self_transfer', "Cannot transfer money to yourself."
+        if recipient is None:
+            return False, 'recipient_missing', "Recipient account not found."
+        if recipient.get('account_status') != 'active':
+            return False, 'recipient_inactive', "Recipient account is not active."
+        if amount <= 0:
+            return False, 'invalid_amount', "Transfer amount must be positive."
+        sender_currency = FXRateTable.currency_of(sender)
+        max_transfer = FXRateTable().threshold(self.MAX_TRANSFER, sender_currency)
+        if amount > max_transfer:
+            return False, 'max_exceeded', (f"Maximum transfer limit is "
+                                           f"{FXRateTable.format(max_transfer, sender_currency)} per transaction.")
+        if amount > HoldManager.available_balance(sender):
+            return False, 'insufficient_funds', "Insufficient funds."
+        allowed, message = self.limit_manager.check(sender, 'transfer', amount)
+        if not allowed:
+            return False, 'limit_exceeded', message
         try:
-            users_data = FileHandler.load_users()
+            self.fx.current().cross(FXRateTable.currency_of(sender), FXRateTable.currency_of(recipient))
+        except ValueError as e:
+            return False, 'fx_unavailable', str(e)
+        return True, None, None
+    
+    @exclusive_write
+    def _process_transfer(self, sender_username, recipient_username, amount, description, users_data=None):
+        """Process the money transfer (on users_data when given, otherwise freshly loaded)"""
+        started = time.perf_counter()
+        try:
+            if users_data is None:
+                users_data = FileHandler.load_users()
+            
+            # Holds placed since the prompt may have reduced what is available
+            if amount > HoldManager.available_balance(users_data[sender_username]):
+                BANKING_OPERATIONS.labels('transfer', 'insufficient_funds').inc()
+                self.audit_logger.log('transfer', sender_username, accounts=[sender_username, recipient_username],
+                                      amount=amount, outcome='failure', reason='insufficient_funds')
+                print("❌ Insufficient available funds.")
+                return False
+            
+            # Enforce rolling daily/monthly limits
+            allowed, message = self.limit_manager.check(users_data[sender_username], 'transfer', amount)
+            if not allowed:
+                BANKING_OPERATIONS.labels('transfer', 'limit_exceeded').inc()
+                self.audit_logger.log('transfer', sender_username, accounts=[sender_username, recipient_username],
+                                      amount=amount, outcome='failure', reason='limit_exceeded')
+                print(f"❌ {message}")
+                return False
+            
+            # Screen for velocity, fan-out to new recipients and unusual amounts
+            assessment = self.fraud_screener.assess(users_data[sender_username], recipient_username, amount)
+            if assessment['action'] == 'decline':
+                BANKING_OPERATIONS.labels('transfer', 'declined').inc()
+                self.audit_logger.log('transfer', sender_username, accounts=[sender_username, recipient_username],
+                                      amount=amount, outcome='declined', risk_score=assessment['score'],
+                                      reasons=assessment['reasons'])
+                print("🚩 Transfer declined by fraud screening: " + "; ".join(assessment['reasons']))
+                return False
+            
+            sender_balance_before = users_data[sender_username]['balance']
+            recipient_balance_before = users_data[recipient_username]['balance']
+            
+            # The recipient is credited in their own currency, at one version of the rates
+            sender_currency = FXRateTable.currency_of(users_data[sender_username])
+            recipient_currency = FXRateTable.currency_of(users_data[recipient_username])
+            credited, rate, rate_version = self.fx.convert(amount, sender_currency, recipient_currency)
             
             # Update sender balance
             users_data[sender_username]['balance'] -= amount
             sender_new_balance = users_data[sender_username]['balance']
             
             # Update recipient balance
-            users_data[recipient_username]['balance'] += amount
+            users_data[recipient_username]['balance'] += credited
             recipient_new_balance = users_data[recipient_username]['balance']
             
             # Create timestamp
@@ -128,24 +250,54 @@ class TransferManager:
                 'timestamp': timestamp,
                 'balance_after': sender_new_balance
             }
-            users_data[sender_username]['transactions'].append(sender_transaction)
+            if assessment['action'] == 'flag':
+                sender_transaction['flagged'] = True
+                sender_transaction['risk_score'] = assessment['score']
             
             # Add transaction to recipient
             recipient_transaction = {
                 'type': 'transfer_in',
-                'amount': amount,
+                'amount': credited,
                 'description': f"{description} (from {users_data[sender_username]['name']})",
                 'sender': sender_username,
                 'timestamp': timestamp,
                 'balance_after': recipient_new_balance
             }
+            fx = {}
+            if recipient_currency != sender_currency:
+                fx = {'fx_rate': rate, 'fx_version': rate_version}
+                sender_transaction.update(fx, currency=sender_currency, credited_amount=credited,
+                                          credited_currency=recipient_currency)
+                recipient_transaction.update(fx, currency=recipient_currency, source_amount=amount,
+                                             source_currency=sender_currency)
+            users_data[sender_username]['transactions'].append(sender_transaction)
             users_data[recipient_username]['transactions'].append(recipient_transaction)
+            self.limit_manager.record(users_data[sender_username], 'transfer', amount)
+            self.fraud_screener.record(users_data[sender_username], recipient_username, amount, assessment)
             
             # Save changes
-            FileHandler.save_users(users_data)
+            if not FileHandler.save_users(users_data, changed=[sender_username, recipient_username]):
+                BANKING_OPERATIONS.labels('transfer', 'error').inc()
+                return False
+            ChangeFeed().publish('transfer', [sender_username, recipient_username], amount=amount,
+                                 balances={sender_username: sender_new_balance,
+                                           recipient_username: recipient_new_balance},
+                                 timestamp=timestamp, **fx)
             
+            BANKING_OPERATIONS.labels('transfer', 'success').inc()
+            BANKING_AMOUNT.labels('transfer').inc(amount)
+            BANKING_SECONDS.labels('transfer').observe(time.perf_counter() - started)
+            self.audit_logger.log('transfer', sender_username, accounts=[sender_username, recipient_username],
+                                  amount=amount, balance_before=sender_balance_before,
+                                  balance_after=sender_new_balance,
+                                  recipient_balance_before=recipient_balance_before,
+                                  recipient_balance_after=recipient_new_balance,
+                                  risk_score=assessment['score'], risk_action=assessment['action'], **fx)
             return True
             
         except Exception as e:
+            BANKING_OPERATIONS.labels('transfer', 'error').inc()
+            self.audit_logger.log('transfer', sender_username, accounts=[sender_username, recipient_username],
+                                  amount=amount, outcome='error', reason=str(e))
             print(f"❌ Transfer processing error: {e}")
             return False
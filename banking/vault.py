@@ -0,0 +1,364 @@
+"""
+Closed Account Vault - Compacts long-closed accounts out of the hot store into compressed run files
+"""
+
+import glob
+import gzip
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+from utils.file_handler import FileHandler
+from utils.metrics import metrics
+from utils.audit_log import AuditLogger
+from utils.change_feed import ChangeFeed
+from utils.snapshot import SnapshotManager
+from banking.archive import TransactionArchive
+from banking.sub_accounts import SubAccountManager
+from banking.currency import FXRateTable
+
+COMPACTED_ACCOUNTS = metrics.counter(
+    'securebank_vault_compacted_accounts_total', "Closed accounts moved out of the hot store")
+RECLAIMED_BYTES = metrics.counter(
+    'securebank_vault_reclaimed_bytes_total', "Bytes freed in the data directory by compaction")
+
+class ClosedAccountVault:
+    """Cold home for closed accounts past retention, plus the tombstones that keep their usernames
+
+    Each run writes one gzip JSONL file with every compacted account's full record
+    and history, then removes the accounts (and their archive segments) from the
+    hot store. tombstones.txt maps each compacted username to its run file and is
+    all signup needs to keep the name reserved. manifest.json keeps each run's
+    money totals, so fsck can still prove conservation for the whole bank.
+    """
+    
+    VAULT_DIR = "vault"
+    TOMBSTONE_FILE = "tombstones.txt"
+    MANIFEST_FILE = "manifest.json"
+    DEFAULT_RETENTION_DAYS = 365
+    TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+    
+    EXTERNAL_CREDITS = ('deposit', 'interest')
+    EXTERNAL_DEBITS = ('withdrawal', 'fee')
+    TOTAL_KEYS = ('balance_cents', 'external_credit_cents', 'external_debit_cents',
+                  'transfer_out_cents', 'transfer_in_cents', 'fx_out_cents', 'fx_in_cents')
+    DERIVED_FIELDS = ('archived', 'limit_counters', 'fraud_state')  # Rebuilt from history, never vaulted
+    
+    _tombstones = None
+    _tombstones_identity = None
+    
+    def __init__(self):
+        self.archive = TransactionArchive()
+        self.audit_logger = AuditLogger()
+    
+    @classmethod
+    def directory(cls):
+        """Vault directory inside the current data directory"""
+        return os.path.join(FileHandler.DATA_DIR, cls.VAULT_DIR)
+    
+    @classmethod
+    def is_reserved(cls, username):
+        """Whether a username belongs to a compacted account"""
+        return username in cls.tombstones()
+    
+    @classmethod
+    def tombstones(cls):
+        """{username: run file} for every compacted account, re-read only when the file changes"""
+        path = os.path.join(cls.directory(), cls.TOMBSTONE_FILE)
+        try:
+            identity = (path,) + FileHandler.file_identity(path)
+        except OSError:
+            return {}
+        if identity != cls._tombstones_identity:
+            tombstones = {}
+            with open(path, 'r') as f:
+                for line in f:
+                    username, _, run_file = line.rstrip("\n").partition("\t")
+                    if run_file:
+                        tombstones[username] = run_file
+            cls._tombstones, cls._tombstones_identity = tombstones, identity
+        return cls._tombstones
+    
+    @classmethod
+    def totals(cls):
+        """Accounts and money totals, in cents per currency, of every committed run"""
+        totals = {'accounts': 0, 'currencies': {}}
+        for run in cls._load_manifest():
+            if run['state'] != 'committed':
+                continue
+            totals['accounts'] += run['accounts']
+            # Runs written before totals were kept per currency hold one flat set, in dollars
+            by_currency = run['totals'] if 'balance_cents' not in run['totals'] else \
+                {FXRateTable.DEFAULT_CURRENCY: run['totals']}
+            for currency, money in by_currency.items():
+                target = totals['currencies'].setdefault(currency, dict.fromkeys(cls.TOTAL_KEYS, 0))
+                for key in cls.TOTAL_KEYS:
+                    target[key] += money.get(key, 0)
+        return totals
+    
+    def retrieve(self, username):
+        """A compacted account's full record, read back from its run file, or None"""
+        run_file = self.tombstones().get(username)
+        if run_file is None:
+            return None
+        with gzip.open(os.path.join(self.directory(), run_file), 'rt') as f:
+            for line in f:
+                record = json.loads(line)
+                if record['username'] == username:
+                    return record
+        return None
+    
+    @classmethod
+    def cutoff_for(cls, retention_days=None, now=None):
+        """Accounts closed before this timestamp are eligible"""
+        days = cls.DEFAULT_RETENTION_DAYS if retention_days is None else retention_days
+        return (datetime.fromtimestamp(now or time.time()) - timedelta(days=days)).strftime(cls.TIME_FORMAT)
+    
+    def run(self, retention_days=None, chunk_size=None, dry_run=False):
+        """Compact closed accounts past retention and sweep dead files; returns a summary
+
+        Each chunk of chunk_size accounts (all of them without it) becomes its own
+        vault run, written and removed from a fresh load under the writer lock, so
+        live transactions committed while the run is in progress are kept.
+        """
+        started = time.perf_counter()
+        cutoff = self.cutoff_for(retention_days)
+        users_file = FileHandler.USERS_FILE
+        size_before = os.path.getsize(users_file) if os.path.exists(users_file) else 0
+        if not dry_run:
+            with FileHandler.writer_lock():
+                self._recover(FileHandler.load_users())
+        load_started = time.perf_counter()
+        users_data = FileHandler.load_users()
+        load_before = time.perf_counter() - load_started
+        summary = {
+            'cutoff': cutoff,
+            'accounts_compacted': 0,
+            'transactions_compacted': 0,
+            'skipped_with_holds': 0,
+            'hot_bytes_before': size_before,
+            'hot_bytes_after': size_before,
+            'archive_bytes_removed': 0,
+            'dead_bytes_removed': 0,
+            'vault_bytes': 0,
+            'load_seconds_before': round(load_before, 3),
+            'load_seconds_after': round(load_before, 3),
+            'dry_run': dry_run
+        }
+        
+        eligible = []
+        for username, user_data in users_data.items():
+            if not self._past_retention(user_data, cutoff):
+                continue
+            if user_data.get('holds'):
+                summary['skipped_with_holds'] += 1  # Left for the expiry job to clear first
+                continue
+            eligible.append(username)
+        
+        if dry_run:
+            summary['accounts_compacted'] = len(eligible)
+            summary['transactions_compacted'] = sum(
+                len(users_data[username].get('transactions', [])) +
+                users_data[username].get('archived', {}).get('count', 0) for username in eligible)
+        else:
+            for users_data, chunk in FileHandler.locked_chunks(eligible, chunk_size):
+                # Re-check on the fresh load: a live writer may have touched the account since
+                chunk = [username for username in chunk if username in users_data and
+                         self._past_retention(users_data[username], cutoff) and
+                         not users_data[username].get('holds')]
+                if chunk:
+                    self._compact(chunk, users_data, summary)
+            if summary['accounts_compacted']:
+                summary['hot_bytes_after'] = os.path.getsize(users_file)
+                load_started = time.perf_counter()
+                FileHandler.load_users()
+                summary['load_seconds_after'] = round(time.perf_counter() - load_started, 3)
+            
+            with FileHandler.writer_lock():
+                summary['dead_bytes_removed'] = self._sweep_dead_files(FileHandler.load_users())
+            SnapshotManager().gc()
+            RECLAIMED_BYTES.inc(max(0, summary['hot_bytes_before'] - summary['hot_bytes_after']) +
+                                summary['archive_bytes_removed'] + summary['dead_bytes_removed'])
+        summary['bytes_reclaimed'] = (summary['hot_bytes_before'] - summary['hot_bytes_after'] +
+                                      summary['archive_bytes_removed'] + summary['dead_bytes_removed'] -
+                                      summary['vault_bytes'])
+        summary['seconds'] = round(time.perf_counter() - started, 3)
+        return summary
+    
+    def _compact(self, eligible, users_data, summary):
+        """Move one chunk of accounts into a vault run and save the hot store without them"""
+        run_file, count, totals = self._write_run(eligible, users_data)
+        summary['accounts_compacted'] += len(eligible)
+        summary['transactions_compacted'] += count
+        summary['vault_bytes'] += os.path.getsize(os.path.join(self.directory(), run_file))
+        run = {'file': run_file, 'created_at': FileHandler.get_current_timestamp(), 'accounts': len(eligible),
+               'usernames': eligible, 'totals': totals, 'state': 'pending'}
+        manifest = self._load_manifest()
+        manifest.append(run)
+        # Tombstones land before the accounts leave, so the names are never free in between
+        self._append_tombstones(eligible, run_file)
+        self._write_manifest(manifest)
+        
+        for username in eligible:
+            del users_data[username]
+        if not FileHandler.save_users(users_data):
+            raise IOError("Failed to save the compacted hot store")
+        run['state'] = 'committed'
+        del run['usernames']
+        self._write_manifest(manifest)
+        
+        for username in eligible:
+            summary['archive_bytes_removed'] += self._remove_tree(self.archive._account_dir(username))
+        ChangeFeed().publish('accounts_compacted', eligible, run_file=run_file)
+        self.audit_logger.log('vacuum', 'system', accounts=eligible[:10], count=len(eligible),
+                              run_file=run_file)
+        COMPACTED_ACCOUNTS.inc(len(eligible))
+    
+    @classmethod
+    def _past_retention(cls, user_data, cutoff):
+        """Whether an account is closed and was closed before the cutoff"""
+        return user_data.get('account_status') == 'closed' and cls._closed_at(user_data) < cutoff
+    
+    @staticmethod
+    def _closed_at(user_data):
+        """When an account was closed; older closures without closed_at use their last activity"""
+        if user_data.get('closed_at'):
+            return user_data['closed_at']
+        transactions = user_data.get('transactions', [])
+        return transactions[-1]['timestamp'] if transactions else user_data.get('created_at', '')
+    
+    def _write_run(self, usernames, users_data):
+        """Write the run file; returns (file name, transactions written, money totals per currency)"""
+        directory = self.directory()
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        # Several chunks of one vacuum can land in the same second, so the run number is part of the name
+        stamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        run_file = f"closed-{stamp}-{os.getpid()}-{len(self._load_manifest())}.jsonl.gz"
+        path = os.path.join(directory, run_file)
+        totals = {}
+        count = 0
+        with gzip.open(path + '.tmp', 'wt') as out:
+            for username in usernames:
+                user_data = users_data[username]
+                record = {'username': username}
+                record.update((key, value) for key, value in user_data.items() if key not in self.DERIVED_FIELDS)
+                record['transactions'] = self.archive.transactions(username, user_data)
+                count += len(record['transactions'])
+                out.write(json.dumps(record, separators=(',', ':')) + "\n")
+                for _, ledger in SubAccountManager.ledgers({username: record}):
+                    self._add_totals(totals, ledger)
+        with open(path + '.tmp', 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        return run_file, count, totals
+    
+    def _add_totals(self, totals, ledger):
+        """Accumulate one ledger's balance and flows, in cents of its currency, as fsck counts them"""
+        totals = totals.setdefault(FXRateTable.currency_of(ledger), dict.fromkeys(self.TOTAL_KEYS, 0))
+        totals['balance_cents'] += round(ledger.get('balance', 0) * 100)
+        for transaction in ledger.get('transactions', []):
+            kind = transaction.get('type')
+            cents = round(transaction.get('amount', 0) * 100)
+            if kind in self.EXTERNAL_CREDITS:
+                totals['external_credit_cents'] += cents
+            elif kind in self.EXTERNAL_DEBITS:
+                totals['external_debit_cents'] += cents
+            elif kind == 'transfer_out':
+                totals['fx_out_cents' if 'fx_rate' in transaction else 'transfer_out_cents'] += cents
+            elif kind == 'transfer_in':
+                totals['fx_in_cents' if 'fx_rate' in transaction else 'transfer_in_cents'] += cents
+    
+    def _recover(self, users_data):
+        """Settle a run interrupted between writing the vault and saving the hot store"""
+        manifest = self._load_manifest()
+        pending = [run for run in manifest if run['state'] == 'pending']
+        if not pending:
+            return
+        for run in pending:
+            if any(username in users_data for username in run['usernames']):
+                # The save never happened: the accounts are still live, so the run file is discarded
+                manifest.remove(run)
+                try:
+                    os.remove(os.path.join(self.directory(), run['file']))
+                except OSError:
+                    pass
+            else:
+                run['state'] = 'committed'
+                del run['usernames']
+        self._write_manifest(manifest)
+    
+    def _sweep_dead_files(self, users_data):
+        """Remove files nothing can read any more; returns bytes freed"""
+        freed = 0
+        # Temporary files of writers that died mid-save: users.json.<pid>.<thread>.tmp, accounts.tbl.<pid>.tmp
+        temp_files = [(path, -3) for path in glob.glob(FileHandler.USERS_FILE + ".*.*.tmp")]
+        temp_files += [(path, -2) for path in glob.glob(os.path.join(FileHandler.DATA_DIR, "*.tbl.*.tmp"))]
+        for path, pid_field in temp_files:
+            try:
+                pid = int(os.path.basename(path).split('.')[pid_field])
+            except (IndexError, ValueError):
+                continue
+            if pid != os.getpid() and not SnapshotManager._alive(pid):
+                freed += self._remove_file(path)
+        
+        archive_root = os.path.join(FileHandler.DATA_DIR, TransactionArchive.ARCHIVE_DIR)
+        for directory in glob.glob(os.path.join(archive_root, "*")):
+            username = os.path.basename(directory)
+            user_data = users_data.get(username)
+            if user_data is None:
+                # Archive of an account that no longer exists in the hot store
+                freed += self._remove_tree(directory)
+                continue
+            # Segments from an archive run that never committed are invisible to readers
+            live = {segment['file'] for segment in self.archive._load_index(username, user_data)}
+            live.add(TransactionArchive.INDEX_FILE)
+            for path in glob.glob(os.path.join(directory, "*")):
+                if os.path.basename(path) not in live:
+                    freed += self._remove_file(path)
+        return freed
+    
+    def _append_tombstones(self, usernames, run_file):
+        """Reserve compacted usernames, one line each"""
+        with open(os.path.join(self.directory(), self.TOMBSTONE_FILE), 'a') as f:
+            f.writelines(f"{username}\t{run_file}\n" for username in usernames)
+            f.flush()
+            os.fsync(f.fileno())
+    
+    @classmethod
+    def _load_manifest(cls):
+        """Every run, committed or still pending"""
+        path = os.path.join(cls.directory(), cls.MANIFEST_FILE)
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r') as f:
+            return json.load(f)
+    
+    @classmethod
+    def _write_manifest(cls, manifest):
+        """Replace the manifest atomically"""
+        path = os.path.join(cls.directory(), cls.MANIFEST_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(path + '.tmp', path)
+    
+    @staticmethod
+    def _remove_file(path):
+        """Delete a file; returns its size, or 0 if it was already gone"""
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        except OSError:
+            return 0
+    
+    @staticmethod
+    def _remove_tree(directory):
+        """Delete a directory tree; returns the bytes it held"""
+        if not os.path.isdir(directory):
+            return 0
+        size = sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(directory) for name in names)
+        shutil.rmtree(directory, ignore_errors=True)
+        return size
@@ -4,30 +4,52 @@ Secure Bank - Main Entry Point
 A console-based banking application with file storage
 """
 
+import argparse
+import atexit
+import importlib
+import json
 import os
 import sys
-from auth.login import LoginManager
-from auth.signup import SignupManager
-from auth.session import SessionManager
-from banking.account import AccountManager
-from banking.transfer import TransferManager
-from banking.transactions import TransactionManager
+import time
 from utils.file_handler import FileHandler
 
 class SecureBankApp:
     """Main application class for Secure Bank"""
     
-    def __init__(self):
-        self.session_manager = SessionManager()
-        self.login_manager = LoginManager()
-        self.signup_manager = SignupManager()
-        self.account_manager = AccountManager()
-        self.transfer_manager = TransferManager()
-        self.transaction_manager = TransactionManager()
+    # Attribute -> (module, class); each manager is imported and built on first use,
+    # so startup pays only for the menus and a session that never banks skips the rest
+    MANAGERS = {
+        'session_manager': ('auth.session', 'SessionManager'),
+        'login_manager': ('auth.login', 'LoginManager'),
+        'signup_manager': ('auth.signup', 'SignupManager'),
+        'account_manager': ('banking.account', 'AccountManager'),
+        'transfer_manager': ('banking.transfer', 'TransferManager'),
+        'transaction_manager': ('banking.transactions', 'TransactionManager'),
+        'transfer_scheduler': ('banking.scheduler', 'TransferScheduler'),
+        'sub_account_manager': ('banking.sub_accounts', 'SubAccountManager')
+    }
+    
+    def __init__(self, profiler=None):
+        self.profiler = profiler
         
         # Ensure data directory exists
         FileHandler.ensure_data_directory()
     
+    def __getattr__(self, name):
+        """Import and construct a manager the first time it is used"""
+        if name not in self.MANAGERS:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        module_name, class_name = self.MANAGERS[name]
+        manager = getattr(importlib.import_module(module_name), class_name)()
+        setattr(self, name, manager)
+        return manager
+    
+    def run_action(self, action, func, *args):
+        """Run a menu action, under the profiler when profiling is enabled"""
+        if self.profiler:
+            return self.profiler.run(action, func, *args)
+        return func(*args)
+    
     def display_welcome(self):
         """Display welcome message and bank logo"""
         print("\n" + "="*60)
@@ -60,7 +82,9 @@ class SecureBankApp:
         print("6. 📄 Account Statement")
         print("7. 🔑 Change Password")
         print("8. ⚠️  Close Account")
-        print("9. 🚪 Logout")
+        print("9. 📅 Scheduled Transfers")
+        print("10. 🗂️  My Accounts")
+        print("11. 🚪 Logout")
         print("-" * 50)
     
     def handle_main_menu(self):
@@ -70,10 +94,10 @@ class SecureBankApp:
             choice = input("Enter your choice (1-3): ").strip()
             
             if choice == '1':
-                if self.login_manager.login():
+                if self.run_action('login', self.login_manager.login):
                     self.handle_banking_menu()
             elif choice == '2':
-                self.signup_manager.signup()
+                self.run_action('signup', self.signup_manager.signup)
             elif choice == '3':
                 print("\n👋 Thank you for using Secure Bank!")
                 print("Have a great day! 🌟")
@@ -85,31 +109,35 @@ class SecureBankApp:
         """Handle banking operations menu"""
         while self.session_manager.is_logged_in():
             self.display_banking_menu()
-            choice = input("Enter your choice (1-9): ").strip()
+            choice = input("Enter your choice (1-11): ").strip()
             
             if choice == '1':
-                self.account_manager.check_balance()
+                self.run_action('check_balance', self.account_manager.check_balance)
             elif choice == '2':
-                self.account_manager.deposit()
+                self.run_action('deposit', self.account_manager.deposit)
             elif choice == '3':
-                self.account_manager.withdraw()
+                self.run_action('withdraw', self.account_manager.withdraw)
             elif choice == '4':
-                self.transfer_manager.transfer_money()
+                self.run_action('transfer', self.transfer_manager.transfer_money)
             elif choice == '5':
-                self.transaction_manager.show_transaction_history()
+                self.run_action('transaction_history', self.transaction_manager.show_transaction_history)
             elif choice == '6':
-                self.transaction_manager.generate_account_statement()
+                self.run_action('account_statement', self.transaction_manager.generate_account_statement)
             elif choice == '7':
-                self.account_manager.change_password()
+                self.run_action('change_password', self.account_manager.change_password)
             elif choice == '8':
-                if self.account_manager.close_account():
+                if self.run_action('close_account', self.account_manager.close_account):
                     break
             elif choice == '9':
+                self.run_action('scheduled_transfers', self.transfer_scheduler.manage_schedules)
+            elif choice == '10':
+                self.run_action('my_accounts', self.sub_account_manager.manage_accounts)
+            elif choice == '11':
                 self.session_manager.logout()
                 print("✅ Successfully logged out!")
                 break
             else:
-                print("❌ Invalid choice. Please select 1-9.")
+                print("❌ Invalid choice. Please select 1-11.")
     
     def run(self):
         """Main application loop"""
@@ -123,6 +151,609 @@ class SecureBankApp:
             print(f"\n❌ An unexpected error occurred: {e}")
             sys.exit(1)
 
+def build_parser():
+    """Build the command-line parser for headless commands"""
+    parser = argparse.ArgumentParser(description="Secure Bank - console banking application")
+    parser.add_argument('--data-dir', default=FileHandler.DATA_DIR,
+                        help="Directory holding users.json (default: data)")
+    parser.add_argument('--metrics-file', help="Write Prometheus text-format metrics to this file on exit")
+    parser.add_argument('--metrics-port', type=int, help="Serve Prometheus metrics on this local port")
+    parser.add_argument('--audit-policy', choices=['block', 'sync', 'drop'], default='block',
+                        help="What auditing does when its queue is full (default: block)")
+    parser.add_argument('--profile', metavar='DIR', nargs='?', const='profiles',
+                        help="Profile every menu action with cProfile, writing .pstats files to DIR (default: profiles)")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="With --profile, also track allocations with tracemalloc")
+    parser.add_argument('--profile-top', type=int, default=20, help="Functions/allocation sites in the profile summary")
+    subparsers = parser.add_subparsers(dest='command')
+    
+    generate_parser = subparsers.add_parser('generate', help="Generate a synthetic bank for load testing")
+    generate_parser.add_argument('--accounts', type=int, default=1000, help="Number of accounts")
+    generate_parser.add_argument('--seed', type=int, default=42, help="Random seed")
+    generate_parser.add_argument('--mean-transactions', type=float, default=20,
+                                 help="Mean transactions per account")
+    generate_parser.add_argument('--distribution', default='poisson',
+                                 choices=['poisson', 'uniform', 'pareto', 'fixed'],
+                                 help="Distribution of transactions per account")
+    generate_parser.add_argument('--history-days', type=int, default=365, help="Days of history")
+    generate_parser.add_argument('--kdf-iterations', type=int, default=None,
+                                 help="PBKDF2 iterations for generated passwords (default: cheap test profile)")
+    generate_parser.add_argument('--workload', help="Also write a seeded JSONL workload to this path")
+    generate_parser.add_argument('--operations', type=int, default=1000, help="Operations in the workload")
+    
+    replay_parser = subparsers.add_parser('replay', help="Replay a JSONL workload and report latency")
+    replay_parser.add_argument('workload', help="Path to the workload JSONL file")
+    replay_parser.add_argument('--limit', type=int, default=None, help="Replay at most this many operations")
+    replay_parser.add_argument('--report', help="Write the JSON report to this path")
+    
+    analytics_parser = subparsers.add_parser('analytics', help="Bank-wide analytics reports")
+    analytics_parser.add_argument('--output', default='reports', help="Directory for report files")
+    analytics_parser.add_argument('--format', choices=['csv', 'json'], default='csv', help="Report format")
+    analytics_parser.add_argument('--dormant-days', type=int, default=180,
+                                  help="Days without activity before an account counts as dormant")
+    analytics_parser.add_argument('--currency', help="Convert every amount to this currency at current FX rates")
+    
+    accrue_parser = subparsers.add_parser('accrue', help="Post monthly interest and fees to every account")
+    accrue_parser.add_argument('--period', required=True, help="Month to post, as YYYY-MM")
+    accrue_parser.add_argument('--chunk-size', type=int, default=None,
+                               help="Commit every N accounts instead of once at the end")
+    accrue_parser.add_argument('--dry-run', action='store_true', help="Compute postings without saving them")
+    
+    scheduler_parser = subparsers.add_parser('scheduler', help="Run due scheduled transfers")
+    scheduler_parser.add_argument('--once', action='store_true', help="Run everything due now and exit")
+    scheduler_parser.add_argument('--interval', type=float, default=60,
+                                  help="Longest sleep between checks when running continuously (seconds)")
+    
+    archive_parser = subparsers.add_parser('archive', help="Move old transactions to compressed cold storage")
+    archive_group = archive_parser.add_mutually_exclusive_group()
+    archive_group.add_argument('--older-than-days', type=int, default=None,
+                               help="Archive whole months older than this many days (default 365)")
+    archive_group.add_argument('--before', help="Archive everything before this month (YYYY-MM)")
+    archive_parser.add_argument('--chunk-size', type=int, default=None,
+                                help="Commit every N accounts instead of once at the end")
+    archive_parser.add_argument('--dry-run', action='store_true', help="Report what would move without moving it")
+    
+    fsck_parser = subparsers.add_parser('fsck', help="Verify balance chains, transfer legs and money conservation")
+    fsck_parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    fsck_parser.add_argument('--chunk-size', type=int, default=None, help="Accounts per worker task")
+    fsck_parser.add_argument('--report', help="Write the full report as JSON to this path")
+    
+    asof_parser = subparsers.add_parser('as-of', help="Account or bank-wide balances at a past date")
+    asof_parser.add_argument('date', help="YYYY-MM-DD (end of day) or 'YYYY-MM-DD HH:MM:SS'")
+    asof_parser.add_argument('--username', help="Query one account instead of the whole bank")
+    asof_parser.add_argument('--output', help="Write every account's balance to this CSV file")
+    
+    statements_parser = subparsers.add_parser('statements', help="Month-end statements for every active account")
+    statements_parser.add_argument('--period', required=True, help="Month to report, as YYYY-MM")
+    statements_parser.add_argument('--output', default='statements', help="Output directory")
+    statements_parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    statements_parser.add_argument('--chunk-size', type=int, default=500, help="Accounts per worker task")
+    
+    export_parser = subparsers.add_parser('export', help="Stream every account to JSONL or CSV")
+    export_parser.add_argument('path', help="Output file")
+    export_parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl', help="Output format")
+    export_parser.add_argument('--transactions', help="CSV only: also write every transaction to this file")
+    
+    import_parser = subparsers.add_parser('import', help="Bulk-create accounts from a JSONL or CSV file")
+    import_parser.add_argument('path', help="Input file (.jsonl or .csv)")
+    import_parser.add_argument('--transactions', help="CSV only: the transactions file written by export")
+    import_parser.add_argument('--workers', type=int, default=None,
+                               help="Password-hashing processes (default: all cores)")
+    import_parser.add_argument('--chunk-size', type=int, default=5000, help="Accounts committed per save")
+    import_parser.add_argument('--rejects', help="Rejected rows report (default: <path>.rejects.jsonl)")
+    import_parser.add_argument('--kdf-iterations', type=int, default=None,
+                               help="PBKDF2 iterations for imported passwords (default: production cost)")
+    
+    feed_parser = subparsers.add_parser('feed', help="Print committed changes as JSON lines")
+    feed_parser.add_argument('--from-seq', type=int, default=1, help="First sequence number to print")
+    feed_parser.add_argument('--follow', action='store_true', help="Keep waiting for new changes")
+    feed_parser.add_argument('--poll-interval', type=float, default=0.5,
+                             help="Seconds between checks for new changes when following")
+    
+    holds_parser = subparsers.add_parser('holds', help="Place, capture, release, list or expire authorization holds")
+    holds_parser.add_argument('action', choices=['place', 'capture', 'release', 'list', 'expire'])
+    holds_parser.add_argument('--username', help="Account holding the funds")
+    holds_parser.add_argument('--amount', type=float, default=None,
+                              help="Amount to hold, or to capture (default: everything still held)")
+    holds_parser.add_argument('--hold-id', help="Hold to capture or release")
+    holds_parser.add_argument('--partial', action='store_true',
+                              help="Keep the rest of the hold open after this capture")
+    holds_parser.add_argument('--ttl-hours', type=float, default=None,
+                              help=f"Hours until an uncaptured hold lapses (default: {7 * 24})")
+    holds_parser.add_argument('--description', default="Authorization", help="Merchant or reason for the hold")
+    holds_parser.add_argument('--follow', action='store_true', help="With expire: keep expiring holds as they lapse")
+    holds_parser.add_argument('--interval', type=float, default=60, help="Seconds between expiry runs with --follow")
+    
+    vacuum_parser = subparsers.add_parser('vacuum', help="Move long-closed accounts to the vault and sweep dead files")
+    vacuum_parser.add_argument('--retention-days', type=int, default=None,
+                               help="Days an account stays closed before it is compacted (default 365)")
+    vacuum_parser.add_argument('--chunk-size', type=int, default=None,
+                               help="Compact N accounts per vault run instead of all in one")
+    vacuum_parser.add_argument('--dry-run', action='store_true', help="Report what would move without moving it")
+    vacuum_parser.add_argument('--show', metavar='USERNAME', help="Print a compacted account read back from the vault")
+    
+    fx_parser = subparsers.add_parser('fx', help="Show the current FX rate table or convert an amount")
+    fx_parser.add_argument('--amount', type=float, help="Amount to convert")
+    fx_parser.add_argument('--from', dest='source', help="Currency of the amount")
+    fx_parser.add_argument('--to', dest='target', help="Currency to convert to")
+    
+    replica_parser = subparsers.add_parser('replica', help="Follow a primary as a warm standby, query it or promote it")
+    replica_parser.add_argument('action', choices=['follow', 'status', 'promote', 'balance', 'history', 'statement'])
+    replica_parser.add_argument('--primary', help="Primary data directory to follow (needed the first time)")
+    replica_parser.add_argument('--interval', type=float, default=1.0, help="Seconds between shipping cycles")
+    replica_parser.add_argument('--once', action='store_true', help="With follow: ship one cycle and exit")
+    replica_parser.add_argument('--verify', action='store_true',
+                                help="With status: recompute the checksum of every replicated file")
+    replica_parser.add_argument('--no-catch-up', action='store_true',
+                                help="With promote: skip the final cycle (the primary is gone)")
+    replica_parser.add_argument('--force', action='store_true',
+                                help="With promote: promote even if files fail verification")
+    replica_parser.add_argument('--username', help="Account to query")
+    replica_parser.add_argument('--limit', type=int, default=20, help="Transactions shown by history")
+    replica_parser.add_argument('--start', help="Statement start date (YYYY-MM-DD)")
+    replica_parser.add_argument('--end', help="Statement end date (YYYY-MM-DD)")
+    
+    bench_parser = subparsers.add_parser('bench-startup', help="Time main.py launches against a wall-clock budget")
+    bench_parser.add_argument('--runs', type=int, default=7, help="Launches per command (the median is judged)")
+    bench_parser.add_argument('--budget-ms', type=float, default=None, help="Allowed median launch time (default 150)")
+    bench_parser.add_argument('--command', action='append', dest='bench_commands', metavar='ARGS',
+                              help="main.py arguments to time, quoted; repeatable (default: --help and two "
+                                   "read-only commands)")
+    bench_parser.add_argument('--top', type=int, default=15, help="Slowest imports to list")
+    bench_parser.add_argument('--report', help="Write the report as JSON to this path")
+    
+    return parser
+
+# Headless commands that only read the data directory, and so may run against a standby replica
+READ_ONLY_COMMANDS = {'analytics', 'fsck', 'as-of', 'statements', 'export', 'feed', 'fx', 'bench-startup', 'replica'}
+
+def run_command(args, profiler=None):
+    """Run a headless command; returns the process exit code"""
+    if FileHandler.read_only and args.command not in READ_ONLY_COMMANDS and \
+            not (args.command == 'holds' and args.action == 'list') and \
+            not (args.command == 'vacuum' and args.show):
+        print(f"❌ {FileHandler.DATA_DIR} is a read-only replica; run 'replica promote' before '{args.command}'.")
+        return 1
+    if args.command == 'generate':
+        from tools.generator import BankGenerator, WorkloadGenerator
+        
+        generator = BankGenerator(args.accounts, seed=args.seed,
+                                  mean_transactions=args.mean_transactions,
+                                  distribution=args.distribution,
+                                  history_days=args.history_days,
+                                  kdf_iterations=args.kdf_iterations)
+        users_data = generator.write(args.data_dir)
+        total_transactions = sum(len(u['transactions']) for u in users_data.values())
+        print(f"✅ Generated {len(users_data)} accounts with {total_transactions} transactions in {args.data_dir}")
+        
+        if args.workload:
+            WorkloadGenerator(args.accounts, seed=args.seed).write(args.workload, args.operations)
+            print(f"✅ Workload with {args.operations} operations written to {args.workload}")
+        return 0
+    
+    if args.command == 'replay':
+        from tools.replayer import WorkloadReplayer
+        
+        summary = WorkloadReplayer(profiler=profiler).replay(args.workload, limit=args.limit)
+        WorkloadReplayer.print_report(summary)
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(summary, f, indent=2)
+            print(f"✅ Report saved as {args.report}")
+        return 0
+    
+    if args.command == 'analytics':
+        from banking.analytics import AnalyticsEngine
+        from utils.snapshot import SnapshotManager
+        
+        started = time.perf_counter()
+        with SnapshotManager().open() as snapshot:
+            engine = AnalyticsEngine(users_data=snapshot.users()).load()
+        if args.currency:
+            try:
+                engine.normalize(args.currency.upper())
+            except ValueError as e:
+                print(f"❌ {e}")
+                return 1
+        loaded = time.perf_counter()
+        paths = engine.write_reports(args.output, args.format, args.dormant_days)
+        finished = time.perf_counter()
+        print(f"✅ Analysed {len(engine.usernames)} accounts and {len(engine.tx_amount)} transactions "
+              f"(load {loaded - started:.2f}s, compute {finished - loaded:.2f}s)")
+        for path in paths:
+            print(f"📄 {path}")
+        return 0
+    
+    if args.command == 'accrue':
+        from banking.interest import InterestEngine
+        from banking.currency import FXRateTable
+        
+        try:
+            summary = InterestEngine().run(args.period, chunk_size=args.chunk_size, dry_run=args.dry_run)
+        except (ValueError, IOError) as e:
+            print(f"❌ Accrual failed: {e}")
+            return 1
+        if summary.get('already_completed'):
+            print(f"ℹ️  Period {args.period} was already posted on {summary['completed_at']}.")
+            return 0
+        label = "Dry run for" if args.dry_run else "Accrued"
+        print(f"✅ {label} {summary['period']}: {summary['accounts_posted']} accounts posted, "
+              f"{summary['accounts_skipped']} skipped")
+        for currency, totals in sorted(summary['totals'].items()):
+            print(f"   {currency} interest: {FXRateTable.format(totals['interest'], currency)}   "
+                  f"Fees: {FXRateTable.format(totals['fee'], currency)}")
+        if summary.get('accounts_backfilled'):
+            print(f"⚠️  {summary['accounts_backfilled']} accounts already had a later period posted; {summary['period']} "
+                  f"was back-filled out of order, using today's balances")
+        return 0
+    
+    if args.command == 'scheduler':
+        from banking.scheduler import TransferScheduler
+        
+        scheduler = TransferScheduler()
+        if not args.once:
+            print("🕒 Scheduler running (Ctrl+C to stop)...")
+            try:
+                scheduler.run_forever(args.interval)
+            except KeyboardInterrupt:
+                print("\n👋 Scheduler stopped.")
+            return 0
+        summary = scheduler.run_due()
+        print("✅ Scheduled transfers: " + ", ".join(f"{key} {value}" for key, value in summary.items()))
+        return 0
+    
+    if args.command == 'archive':
+        from banking.archive import TransactionArchive
+        
+        try:
+            before = TransactionArchive.validate_month(args.before) if args.before else \
+                TransactionArchive.cutoff_for(args.older_than_days)
+            summary = TransactionArchive().run(before, chunk_size=args.chunk_size, dry_run=args.dry_run)
+        except (ValueError, IOError) as e:
+            print(f"❌ Archive failed: {e}")
+            return 1
+        label = "Would archive" if args.dry_run else "Archived"
+        print(f"✅ {label} {summary['transactions_archived']} transactions from "
+              f"{summary['accounts_archived']} accounts (before {before}) in {summary['seconds']:.2f}s")
+        if not args.dry_run:
+            print(f"   {summary['segments_written']} segments, {summary['segment_bytes']:,} bytes compressed; "
+                  f"hot store {summary['hot_bytes_before']:,} -> {summary['hot_bytes_after']:,} bytes")
+        return 0
+    
+    if args.command == 'fsck':
+        from banking.integrity import LedgerChecker
+        
+        report = LedgerChecker(workers=args.workers, chunk_size=args.chunk_size).run()
+        LedgerChecker.print_report(report)
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"✅ Report saved as {args.report}")
+        return 0 if report['ok'] else 2
+    
+    if args.command == 'as-of':
+        from banking.balance_history import BalanceHistory
+        from banking.currency import FXRateTable
+        
+        history = BalanceHistory()
+        try:
+            if args.username:
+                result = history.account_as_of(args.username, args.date)
+                print(f"💰 {result['username']} balance as of {result['as_of']}: "
+                      f"{FXRateTable.format(result['balance'], result['currency'])} "
+                      f"(from {result['source'].replace('_', ' ')})")
+                return 0
+            result = history.bank_as_of(args.date)
+        except (ValueError, IOError) as e:
+            print(f"❌ Balance query failed: {e}")
+            return 1
+        totals = ", ".join(FXRateTable.format(total, currency) for currency, total in sorted(result['totals'].items()))
+        print(f"🏦 Bank totals as of {result['as_of']}: {totals or FXRateTable.format(0)} across "
+              f"{result['accounts']:,} accounts ({result['seconds']:.3f}s)")
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write("username,currency,balance\n")
+                for username, balance in result['balances'].items():
+                    f.write(f"{username},{result['currencies'][username]},{balance:.2f}\n")
+            print(f"📄 {args.output}")
+        return 0
+    
+    if args.command == 'statements':
+        from banking.statements import StatementRun
+        
+        try:
+            summary = StatementRun(args.period, args.output, workers=args.workers, chunk_size=args.chunk_size).run()
+        except (ValueError, IOError) as e:
+            print(f"❌ Statement run failed: {e}")
+            return 1
+        print(f"✅ {summary['rendered']:,} statements for {summary['period']} written to "
+              f"{os.path.join(args.output, summary['period'])} ({summary['skipped']:,} already done)")
+        print(f"   {summary['seconds']:.2f}s, {summary['accounts_per_second']:,.1f} accounts/s, "
+              f"{summary['mb_per_second']:.2f} MB/s, {summary['workers']} workers")
+        if summary['peak_rss_mb'] is not None:
+            print(f"   Peak memory: {summary['peak_rss_mb']:.1f} MB (parent), "
+                  f"{summary['peak_worker_rss_mb']:.1f} MB (largest worker)")
+        return 0
+    
+    if args.command == 'export':
+        from tools.bulk import AccountExporter
+        
+        summary = AccountExporter(args.format).export(args.path, args.transactions)
+        print(f"✅ Exported {summary['accounts']:,} accounts and {summary['transactions']:,} transactions "
+              f"to {args.path} in {summary['seconds']:.2f}s")
+        return 0
+    
+    if args.command == 'import':
+        from tools.bulk import AccountImporter
+        
+        try:
+            summary = AccountImporter(workers=args.workers, chunk_size=args.chunk_size,
+                                      kdf_iterations=args.kdf_iterations).run(args.path, args.rejects,
+                                                                               args.transactions)
+        except (OSError, ValueError) as e:
+            print(f"❌ Import failed: {e}")
+            return 1
+        print(f"✅ Imported {summary['imported']:,} of {summary['rows']:,} rows in {summary['chunks']} chunks "
+              f"({summary['seconds']:.2f}s, {summary['rows_per_second']:,.1f} rows/s, "
+              f"{summary['hashed']:,} passwords hashed on {summary['workers']} workers)")
+        if summary['rejected']:
+            print(f"⚠️  {summary['rejected']:,} rows rejected; reasons in {summary['rejects']}")
+        return 0 if not summary['rejected'] else 2
+    
+    if args.command == 'feed':
+        from utils.change_feed import ChangeFeed
+        
+        feed = ChangeFeed()
+        events = feed.tail(args.from_seq, args.poll_interval) if args.follow else feed.read(args.from_seq)
+        try:
+            for event in events:
+                print(json.dumps(event), flush=True)
+        except KeyboardInterrupt:
+            pass
+        return 0
+    
+    if args.command == 'holds':
+        from banking.holds import HoldManager
+        from banking.currency import FXRateTable
+        
+        manager = HoldManager()
+        if args.action == 'expire':
+            if not args.follow:
+                print(f"✅ Expired {manager.expire_due()} holds")
+                return 0
+            print("🕒 Expiring holds (Ctrl+C to stop)...")
+            try:
+                manager.run_forever(args.interval)
+            except KeyboardInterrupt:
+                print("\n👋 Hold expiry stopped.")
+            return 0
+        if not args.username:
+            print("❌ --username is required.")
+            return 1
+        currency = FXRateTable.currency_of(FileHandler.load_users().get(args.username, {}))
+        if args.action == 'list':
+            for hold in manager.list_holds(args.username):
+                print(f"{hold['id']}  {FXRateTable.format(hold['remaining'], currency):>12} of "
+                      f"{FXRateTable.format(hold['amount'], currency)}  "
+                      f"expires {hold['expires_at']}  {hold['description']}")
+            return 0
+        if args.action == 'place':
+            if args.amount is None:
+                print("❌ --amount is required.")
+                return 1
+            hold = manager.place(args.username, round(args.amount, 2), args.description, args.ttl_hours)
+            if hold is None:
+                return 1
+            print(f"✅ Hold {hold['id']} for {FXRateTable.format(hold['amount'], currency)} placed, "
+                  f"expires {hold['expires_at']}")
+            return 0
+        if not args.hold_id:
+            print("❌ --hold-id is required.")
+            return 1
+        if args.action == 'capture':
+            done = manager.capture(args.username, args.hold_id, args.amount, final=not args.partial)
+        else:
+            done = manager.release(args.username, args.hold_id)
+        if done:
+            print(f"✅ Hold {args.hold_id} {'captured' if args.action == 'capture' else 'released'}")
+        return 0 if done else 1
+    
+    if args.command == 'vacuum':
+        from banking.vault import ClosedAccountVault
+        
+        vault = ClosedAccountVault()
+        if args.show:
+            record = vault.retrieve(args.show)
+            if record is None:
+                print(f"❌ {args.show} is not in the vault.")
+                return 1
+            print(json.dumps(record, indent=2))
+            return 0
+        try:
+            summary = vault.run(args.retention_days, chunk_size=args.chunk_size, dry_run=args.dry_run)
+        except (OSError, ValueError) as e:
+            print(f"❌ Vacuum failed: {e}")
+            return 1
+        label = "Would compact" if args.dry_run else "Compacted"
+        print(f"✅ {label} {summary['accounts_compacted']:,} accounts closed before {summary['cutoff']} "
+              f"({summary['transactions_compacted']:,} transactions) in {summary['seconds']:.2f}s")
+        if summary['skipped_with_holds']:
+            print(f"   {summary['skipped_with_holds']:,} closed accounts kept until their holds clear")
+        if not args.dry_run:
+            print(f"   Hot store {summary['hot_bytes_before']:,} -> {summary['hot_bytes_after']:,} bytes; "
+                  f"archive {summary['archive_bytes_removed']:,} and dead files {summary['dead_bytes_removed']:,} "
+                  f"bytes removed; vault +{summary['vault_bytes']:,} bytes")
+            print(f"   Reclaimed {summary['bytes_reclaimed']:,} bytes; load time "
+                  f"{summary['load_seconds_before']:.3f}s -> {summary['load_seconds_after']:.3f}s")
+        return 0
+    
+    if args.command == 'fx':
+        from banking.currency import FXRateTable
+        
+        fx = FXRateTable()
+        table = fx.current()
+        if args.amount is None:
+            print(f"💱 Rate version {table.version} (base {table.base})")
+            for currency in table.currencies():
+                print(f"   {currency}  {table.rates[currency]:>14.6f}")
+            return 0
+        try:
+            converted, rate, version = fx.convert(args.amount, (args.source or table.base).upper(),
+                                                  (args.target or table.base).upper())
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+        print(f"💱 {args.amount:,.2f} {(args.source or table.base).upper()} = {converted:,.2f} "
+              f"{(args.target or table.base).upper()} (rate {rate:.6g}, version {version})")
+        return 0
+    
+    if args.command == 'replica':
+        from utils.replica import StandbyReplica
+        
+        try:
+            replica = StandbyReplica(args.primary)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+        if args.action == 'follow':
+            def report(summary):
+                if 'error' in summary:
+                    print(f"⚠️  Shipping failed, retrying: {summary['error']}", flush=True)
+                elif summary['records'] or summary['removed'] or summary['files']:
+                    print(f"📦 seq {summary['applied_seq']}: {summary['records']} accounts, "
+                          f"{summary['removed']} removed, {summary['files']} files, {summary['bytes']:,} bytes "
+                          f"in {summary['seconds']:.2f}s; lag {summary['lag_events']} events "
+                          f"/ {summary['lag_seconds']:.1f}s", flush=True)
+            
+            try:
+                if args.once:
+                    report(replica.follow(once=True))
+                    return 0
+                print(f"🛰️  Following {replica.primary_dir} into {FileHandler.DATA_DIR} (Ctrl+C to stop)...")
+                replica.follow(args.interval, report)
+            except (OSError, ValueError) as e:
+                print(f"❌ Replica follow failed: {e}")
+                return 1
+            except KeyboardInterrupt:
+                print("\n👋 Replica stopped.")
+            return 0
+        if args.action == 'status':
+            if not replica.state:
+                print(f"❌ {FileHandler.DATA_DIR} is not a replica.")
+                return 1
+            status = replica.status()
+            role = "primary, promoted from a replica" if status['role'] == 'primary' else "replica"
+            print(f"🛰️  {FileHandler.DATA_DIR}: {role} of {status['primary']}")
+            print(f"   Applied seq {status['applied_seq']}, {status['files_mirrored']:,} files mirrored, "
+                  f"last sync {time.ctime(status['synced_at']) if status['synced_at'] else 'never'}")
+            if status.get('promoted_at'):
+                print(f"   Promoted {status['promoted_at']}")
+            elif status.get('primary_reachable'):
+                print(f"   Lag: {status['lag_events']} events, {status['lag_seconds']:.1f}s")
+            else:
+                print(f"⚠️  Primary unreachable; lag at last sync was {status.get('lag_events')} events")
+            if args.verify:
+                problems = replica.verify()
+                print("✅ Every replicated file matches its checksum" if not problems else
+                      f"❌ {len(problems)} files differ: {', '.join(problems[:10])}")
+                return 0 if not problems else 2
+            return 0
+        if args.action == 'promote':
+            try:
+                result = replica.promote(catch_up=not args.no_catch_up, force=args.force)
+            except (OSError, ValueError) as e:
+                print(f"❌ Promotion failed: {e}")
+                return 1
+            if result['catch_up_error']:
+                print(f"⚠️  Final catch-up skipped: {result['catch_up_error']}")
+                print(f"⚠️  Changes committed on the old primary after the last sync "
+                      f"({time.ctime(replica.state['synced_at'])}) are not on this copy")
+            if result['problems']:
+                print(f"⚠️  Promoted despite {len(result['problems'])} files failing verification")
+            print(f"✅ {FileHandler.DATA_DIR} is now a primary with {result['accounts']:,} accounts "
+                  f"(applied through seq {result['applied_seq']})")
+            if result['lag_events']:
+                print(f"⚠️  {result['lag_events']} events published on the old primary after the last shipped "
+                      f"version were not replicated")
+            return 0
+        
+        # Read-only queries, answered from this directory's committed users.json
+        from banking.currency import FXRateTable
+        from banking.holds import HoldManager
+        from banking.transactions import TransactionManager
+        
+        if not args.username:
+            print("❌ --username is required.")
+            return 1
+        users_data = FileHandler.load_users()
+        if args.username not in users_data:
+            print(f"❌ {args.username} not found.")
+            return 1
+        user_data = users_data[args.username]
+        currency = FXRateTable.currency_of(user_data)
+        if args.action == 'balance':
+            print(f"💰 {args.username}: {FXRateTable.format(user_data['balance'], currency)} "
+                  f"({user_data.get('account_status', 'active')}), on hold "
+                  f"{FXRateTable.format(user_data.get('held_total', 0), currency)}, available "
+                  f"{FXRateTable.format(HoldManager.available_balance(user_data), currency)}")
+        else:
+            manager = TransactionManager()
+            if args.action == 'history':
+                transactions = manager.archive.recent(args.username, user_data, args.limit)
+                for index, transaction in enumerate(reversed(transactions), 1):
+                    manager._display_transaction(transaction, index, currency)
+            else:
+                transactions = manager.archive.transactions(args.username, user_data, args.start, args.end)
+                print(manager._generate_statement_content(user_data, transactions, args.start, args.end))
+        if replica.state.get('role') == 'replica':
+            print(f"ℹ️  Replica as of seq {replica.state['applied_seq']}, synced "
+                  f"{time.time() - (replica.state['synced_at'] or 0):.1f}s ago")
+        return 0
+    
+    if args.command == 'bench-startup':
+        import shlex
+        from tools.startup_bench import StartupBenchmark
+        
+        commands = [shlex.split(command) for command in args.bench_commands] if args.bench_commands else None
+        benchmark = StartupBenchmark(FileHandler.DATA_DIR, runs=args.runs, budget_ms=args.budget_ms, top=args.top)
+        report = benchmark.run(commands)
+        StartupBenchmark.print_report(report)
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"✅ Report saved as {args.report}")
+        return 0 if report['ok'] else 2
+    
+    return 1
+
 if __name__ == "__main__":
-    app = SecureBankApp()
+    args = build_parser().parse_args()
+    FileHandler.set_data_directory(args.data_dir)
+    
+    from utils.audit_log import AuditLogger
+    AuditLogger().configure(policy=args.audit_policy)
+    
+    if args.metrics_file or args.metrics_port:
+        from utils.metrics import metrics
+        if args.metrics_file:
+            atexit.register(metrics.write_textfile, args.metrics_file)
+        if args.metrics_port:
+            metrics.serve(args.metrics_port)
+            print(f"📈 Metrics available at http://127.0.0.1:{args.metrics_port}/metrics")
+    
+    profiler = None
+    if args.profile:
+        from utils.profiler import ActionProfiler
+        profiler = ActionProfiler(args.profile, trace_memory=args.profile_memory, top_n=args.profile_top)
+        atexit.register(profiler.write_summary)
+    
+    if args.command:
+        sys.exit(run_command(args, profiler))
+    
+    if FileHandler.read_only:
+        print(f"❌ {FileHandler.DATA_DIR} is a read-only replica. Use 'replica balance|history|statement' "
+              f"to query it, or 'replica promote' to make it the primary.")
+        sys.exit(1)
+    
+    app = SecureBankApp(profiler)
     app.run()
@@ -0,0 +1,3 @@
+"""
+Tools module initialization
+"""
@@ -0,0 +1,392 @@
+"""
+Bulk Transfer - Streaming account export and chunked, validated import with parallel password hashing
+"""
+
+import base64
+import csv
+import json
+import multiprocessing
+import os
+import time
+from datetime import datetime
+from itertools import groupby
+from auth.signup import SignupManager
+from utils.file_handler import FileHandler
+from utils.password_utils import PasswordUtils
+from utils.audit_log import AuditLogger
+from utils.change_feed import ChangeFeed
+from utils.snapshot import SnapshotManager
+from banking.archive import TransactionArchive
+from banking.recipient_index import RecipientIndex
+from banking.sub_accounts import SubAccountManager
+from banking.vault import ClosedAccountVault
+from banking.currency import FXRateTable
+
+def _hash_password(task):
+    """Pool worker: derive one stored password hash"""
+    password, iterations = task
+    return PasswordUtils.hash_password(password, iterations=iterations)
+
+class AccountExporter:
+    """Writes every account, one at a time, to JSONL or CSV"""
+    
+    FORMATS = ('jsonl', 'csv')
+    ACCOUNT_FIELDS = ('username', 'name', 'password_hash', 'balance', 'currency', 'account_status', 'created_at')
+    TRANSACTION_FIELDS = ('username', 'type', 'amount', 'description', 'timestamp', 'balance_after',
+                          'counterparty')
+    
+    def __init__(self, export_format='jsonl'):
+        if export_format not in self.FORMATS:
+            raise ValueError(f"Unknown format '{export_format}'. Choose from {', '.join(self.FORMATS)}")
+        self.format = export_format
+        self.archive = TransactionArchive()
+    
+    def export(self, path, transactions_path=None):
+        """Export from a pinned snapshot; CSV puts transactions in a second file when one is given"""
+        started = time.perf_counter()
+        summary = {'accounts': 0, 'transactions': 0}
+        with SnapshotManager().open() as snapshot:
+            with open(path, 'w', newline='') as out:
+                if self.format == 'jsonl':
+                    for username, user_data in snapshot.users().items():
+                        record = self._record(username, user_data)
+                        out.write(json.dumps(record) + "\n")
+                        summary['accounts'] += 1
+                        summary['transactions'] += len(record['transactions'])
+                else:
+                    self._export_csv(snapshot.users(), out, transactions_path, summary)
+        summary['seconds'] = round(time.perf_counter() - started, 3)
+        return summary
+    
+    def _record(self, username, user_data):
+        """Portable account record: full history inline, no archive bookkeeping or derived counters"""
+        record = {'username': username}
+        record.update((key, value) for key, value in user_data.items()
+                      if key not in ('archived', 'limit_counters', 'fraud_state'))
+        record['transactions'] = self.archive.transactions(username, user_data)
+        return record
+    
+    def _export_csv(self, users_data, out, transactions_path, summary):
+        """Account rows to out; transaction rows to transactions_path if given"""
+        accounts = csv.writer(out)
+        accounts.writerow(self.ACCOUNT_FIELDS)
+        tx_file = open(transactions_path, 'w', newline='') if transactions_path else None
+        try:
+            transactions = csv.writer(tx_file) if tx_file else None
+            if transactions:
+                transactions.writerow(self.TRANSACTION_FIELDS)
+            for username, user_data in users_data.items():
+                row = dict(user_data, currency=FXRateTable.currency_of(user_data))
+                accounts.writerow([username] + [row.get(field, '') for field in self.ACCOUNT_FIELDS[1:]])
+                summary['accounts'] += 1
+                if not transactions:
+                    continue
+                for transaction in self.archive.transactions(username, user_data):
+                    transactions.writerow([
+                        username, transaction['type'], transaction['amount'], transaction.get('description', ''),
+                        transaction['timestamp'], transaction['balance_after'],
+                        transaction.get('recipient') or transaction.get('sender') or ''
+                    ])
+                    summary['transactions'] += 1
+        finally:
+            if tx_file:
+                tx_file.close()
+
+class AccountImporter:
+    """Streams rows in, validates them like signup, hashes passwords in parallel and commits in chunks"""
+    
+    TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+    STATUSES = ('active', 'closed')
+    BALANCE_TOLERANCE = 0.005
+    COUNTERPARTY_FIELDS = {'transfer_out': 'recipient', 'transfer_in': 'sender'}
+    
+    def __init__(self, workers=None, chunk_size=5000, kdf_iterations=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.kdf_iterations = kdf_iterations or PasswordUtils.ITERATIONS
+    
+    def run(self, path, rejects_path=None, transactions_path=None):
+        """Import path (.jsonl or .csv); rejected rows and reasons go to rejects_path
+
+        A CSV export's companion transactions file is given as transactions_path.
+        """
+        started = time.perf_counter()
+        if transactions_path and not path.endswith('.csv'):
+            raise ValueError("A transactions file can only accompany a CSV import")
+        rejects_path = rejects_path or path + ".rejects.jsonl"
+        users_data = FileHandler.load_users()
+        summary = {'rows': 0, 'imported': 0, 'rejected': 0, 'hashed': 0, 'chunks': 0,
+                   'workers': self.workers, 'rejects': rejects_path}
+        
+        seen = set()
+        chunk = []
+        orphans = []
+        rows = self._rows(path)
+        if transactions_path:
+            rows = self._with_ledgers(rows, transactions_path, orphans)
+        pool = multiprocessing.Pool(self.workers) if self.workers > 1 else None
+        try:
+            with open(rejects_path, 'w') as rejects:
+                for line, row in rows:
+                    summary['rows'] += 1
+                    account, reason = self._validate(row, users_data, seen)
+                    if reason:
+                        summary['rejected'] += 1
+                        rejects.write(json.dumps({'line': line, 'username': row.get('username'),
+                                                  'reason': reason}) + "\n")
+                        continue
+                    seen.add(account['username'])
+                    account['line'] = line
+                    chunk.append(account)
+                    if len(chunk) >= self.chunk_size:
+                        self._commit(chunk, pool, summary, rejects)
+                        chunk = []
+                if chunk:
+                    self._commit(chunk, pool, summary, rejects)
+                for line, username in orphans:
+                    summary['rejected'] += 1
+                    rejects.write(json.dumps({'line': line, 'username': username, 'file': transactions_path,
+                                              'reason': "Transactions for an account that is not in the import "
+                                                        "file or not in the same order"}) + "\n")
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        
+        elapsed = time.perf_counter() - started
+        summary['seconds'] = round(elapsed, 3)
+        summary['rows_per_second'] = round(summary['rows'] / elapsed, 1) if elapsed else 0.0
+        return summary
+    
+    @staticmethod
+    def _rows(path):
+        """Yield (line number, row dict) from a JSONL or CSV file without reading it all"""
+        with open(path, 'r', newline='') as f:
+            if path.endswith('.csv'):
+                for line, row in enumerate(csv.DictReader(f), 2):
+                    yield line, row
+                return
+            for line, text in enumerate(f, 1):
+                if not text.strip():
+                    continue
+                try:
+                    row = json.loads(text)
+                except ValueError:
+                    row = None
+                yield line, row if isinstance(row, dict) else {'_error': "Not a JSON object"}
+    
+    def _with_ledgers(self, rows, transactions_path, orphans):
+        """Attach each account's rows from a transactions CSV written in the same account order
+
+        Both files are read in step, so neither is held in memory. Transaction rows
+        whose account never comes up are added to orphans as (line, username).
+        """
+        with open(transactions_path, 'r', newline='') as f:
+            groups = groupby(enumerate(csv.DictReader(f), 2),
+                             key=lambda item: str(item[1].get('username') or '').strip().lower())
+            pending = next(groups, None)
+            for line, row in rows:
+                username = str(row.get('username') or '').strip().lower()
+                if pending and pending[0] == username:
+                    row['transactions'] = [self._csv_transaction(transaction) for _, transaction in pending[1]]
+                    pending = next(groups, None)
+                else:
+                    row['transactions'] = []
+                yield line, row
+            while pending:
+                orphans.append((next(pending[1])[0], pending[0]))
+                pending = next(groups, None)
+    
+    def _csv_transaction(self, row):
+        """Ledger entry from one exported transaction row"""
+        transaction = {'type': row.get('type')}
+        for key in ('amount', 'balance_after'):
+            try:
+                transaction[key] = float(row.get(key))
+            except (TypeError, ValueError):
+                transaction[key] = row.get(key)
+        if row.get('description'):
+            transaction['description'] = row['description']
+        transaction['timestamp'] = row.get('timestamp')
+        counterparty_field = self.COUNTERPARTY_FIELDS.get(transaction['type'])
+        if counterparty_field and row.get('counterparty'):
+            transaction[counterparty_field] = row['counterparty']
+        return transaction
+    
+    def _validate(self, row, users_data, seen):
+        """(account, None) for an importable row, or (None, reason)"""
+        if '_error' in row:
+            return None, row['_error']
+        username = str(row.get('username') or '').strip().lower()
+        error = SignupManager.username_error(username)
+        if error:
+            return None, error
+        if username in users_data or username in seen or ClosedAccountVault.is_reserved(username):
+            return None, "Username already exists."
+        name = str(row.get('name') or '').strip().title()
+        error = SignupManager.name_error(name)
+        if error:
+            return None, error
+        
+        password = row.get('password')
+        password_hash = row.get('password_hash')
+        if password:
+            error = SignupManager.password_error(str(password))
+            if error:
+                return None, error
+        elif not password_hash or not self._valid_hash(str(password_hash)):
+            return None, "A valid password or password_hash is required."
+        
+        try:
+            balance = round(float(row.get('balance')), 2)
+        except (TypeError, ValueError):
+            return None, "Balance must be a number."
+        currency = str(row.get('currency') or FXRateTable.DEFAULT_CURRENCY).upper()
+        error = SignupManager.currency_error(currency)
+        if error:
+            return None, error
+        created_at = row.get('created_at') or FileHandler.get_current_timestamp()
+        status = row.get('account_status') or 'active'
+        try:
+            datetime.strptime(created_at, self.TIMESTAMP_FORMAT)
+        except (TypeError, ValueError):
+            return None, f"created_at must be formatted as {self.TIMESTAMP_FORMAT}."
+        if status not in self.STATUSES:
+            return None, f"account_status must be one of: {', '.join(self.STATUSES)}."
+        
+        transactions = row.get('transactions')
+        if transactions is not None:
+            error = self._ledger_error(transactions, balance)
+        elif password:
+            # A new customer: the same opening rules as interactive signup
+            error = SignupManager.deposit_error(balance, currency)
+            transactions = [{
+                'type': 'deposit',
+                'amount': balance,
+                'description': 'Initial deposit',
+                'timestamp': created_at,
+                'balance_after': balance
+            }] if balance > 0 else []
+        else:
+            # A migrated account without its history: carry the balance over as it stands
+            error = "Balance cannot be negative." if balance < 0 else None
+            transactions = [{
+                'type': 'deposit',
+                'amount': balance,
+                'description': 'Balance brought forward',
+                'timestamp': created_at,
+                'balance_after': balance
+            }] if balance > 0 else []
+        if error:
+            return None, error
+        
+        sub_accounts = row.get('sub_accounts') or {}
+        error = self._sub_accounts_error(sub_accounts)
+        if error:
+            return None, error
+        for record in sub_accounts.values():
+            if record.setdefault('currency', currency) != currency:
+                return None, "Sub-accounts must hold the account's currency."
+        
+        account = {
+            'username': username,
+            'password': password,
+            'record': {
+                'name': name,
+                'password_hash': None if password else password_hash,
+                'balance': balance,
+                'currency': currency,
+                'account_status': status,
+                'created_at': created_at,
+                'transactions': transactions
+            }
+        }
+        if sub_accounts:
+            account['record']['sub_accounts'] = sub_accounts
+        return account, None
+    
+    def _ledger_error(self, transactions, balance):
+        """Why an imported history is unusable, or None"""
+        if not isinstance(transactions, list):
+            return "transactions must be a list."
+        for position, transaction in enumerate(transactions):
+            if not isinstance(transaction, dict) or any(
+                    key not in transaction for key in ('type', 'amount', 'timestamp', 'balance_after')):
+                return f"Transaction {position} needs type, amount, timestamp and balance_after."
+            if not all(isinstance(transaction[key], (int, float)) for key in ('amount', 'balance_after')):
+                return f"Transaction {position} has a non-numeric amount or balance_after."
+        last = transactions[-1]['balance_after'] if transactions else 0.0
+        if abs(last - balance) > self.BALANCE_TOLERANCE:
+            return "Balance does not match the last transaction's balance_after."
+        return None
+    
+    @staticmethod
+    def _sub_accounts_error(sub_accounts):
+        """Why imported sub-accounts are unusable, or None"""
+        if not isinstance(sub_accounts, dict):
+            return "sub_accounts must be an object."
+        for account_id, record in sub_accounts.items():
+            if not isinstance(record, dict) or record.get('type') not in SubAccountManager.ACCOUNT_TYPES \
+                    or not isinstance(record.get('balance'), (int, float)):
+                return f"Sub-account '{account_id}' needs a known type and a numeric balance."
+            record.setdefault('transactions', [])
+        return None
+    
+    @staticmethod
+    def _valid_hash(password_hash):
+        """Whether a migrated hash has the stored format PasswordUtils can verify"""
+        encoded = password_hash
+        if password_hash.startswith(PasswordUtils.HASH_PREFIX + "$"):
+            parts = password_hash.split("$", 2)
+            if len(parts) != 3 or not parts[1].isdigit():
+                return False
+            encoded = parts[2]
+        try:
+            return len(base64.b64decode(encoded.encode('utf-8'), validate=True)) == PasswordUtils.SALT_SIZE + 32
+        except ValueError:
+            return False
+    
+    def _commit(self, chunk, pool, summary, rejects):
+        """Hash the chunk's passwords across the pool and commit the chunk in one save
+
+        The save reloads users.json under the writer lock; a username a live signup
+        took since validation is rejected rather than overwritten.
+        """
+        tasks = [(account['password'], self.kdf_iterations) for account in chunk if account['password']]
+        if pool:
+            hashes = iter(pool.map(_hash_password, tasks, chunksize=max(1, len(tasks) // (self.workers * 4))))
+        else:
+            hashes = iter([_hash_password(task) for task in tasks])
+        summary['hashed'] += len(tasks)
+        for account in chunk:
+            if account['password']:
+                account['record']['password_hash'] = next(hashes)
+        
+        usernames = []
+        with FileHandler.writer_lock():
+            users_data = FileHandler.load_users()
+            for account in chunk:
+                if account['username'] in users_data:
+                    summary['rejected'] += 1
+                    rejects.write(json.dumps({'line': account['line'], 'username': account['username'],
+                                              'reason': "Username already exists."}) + "\n")
+                    continue
+                users_data[account['username']] = account['record']
+                usernames.append(account['username'])
+            changed = usernames + [SubAccountManager.ledger_name(username, account_id)
+                                   for username in usernames
+                                   for account_id in users_data[username].get('sub_accounts', {})]
+            if not FileHandler.save_users(users_data, changed=changed):
+                raise IOError("Failed to commit import chunk")
+        
+        feed = ChangeFeed()
+        index = RecipientIndex()
+        for username in usernames:
+            record = users_data[username]
+            feed.publish('signup', [username], balance_after=record['balance'],
+                         timestamp=record['created_at'], source='import')
+            if record['account_status'] == 'active':
+                index.add(username, record['name'])
+        AuditLogger().log('bulk_import', 'system', accounts=usernames[:10], count=len(usernames))
+        summary['imported'] += len(usernames)
+        summary['chunks'] += 1
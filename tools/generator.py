@@ -0,0 +1,228 @@
+"""
+Bank Generator - Builds deterministic synthetic banks and workloads for load testing
+"""
+
+import json
+import math
+import os
+import random
+from datetime import datetime, timedelta
+from utils.file_handler import FileHandler
+from utils.password_utils import PasswordUtils
+
+class BankGenerator:
+    """Generates a seeded synthetic bank with consistent transaction histories"""
+    
+    FIRST_NAMES = ["Ali", "Sara", "Omar", "Ayesha", "Bilal", "Fatima", "Hamza", "Zainab",
+                   "John", "Maria", "David", "Emma", "Lucas", "Olivia", "Noah", "Mia"]
+    LAST_NAMES = ["Khan", "Malik", "Ahmed", "Hussain", "Smith", "Garcia", "Brown",
+                  "Wilson", "Taylor", "Lee", "Martin", "Clark", "Lopez", "Young"]
+    DISTRIBUTIONS = ('poisson', 'uniform', 'pareto', 'fixed')
+    TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+    
+    def __init__(self, num_accounts, seed=42, mean_transactions=20, distribution='poisson',
+                 history_days=365, end_date=None, kdf_iterations=None):
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Unknown distribution '{distribution}'. Choose from {', '.join(self.DISTRIBUTIONS)}")
+        self.num_accounts = num_accounts
+        self.seed = seed
+        self.mean_transactions = mean_transactions
+        self.distribution = distribution
+        self.history_days = history_days
+        self.end_date = end_date or datetime(2024, 1, 1)
+        self.kdf_iterations = kdf_iterations or PasswordUtils.TEST_ITERATIONS
+        self.rng = random.Random(seed)
+    
+    @staticmethod
+    def username_for(index):
+        """Deterministic username for the account at index"""
+        return f"user{index:07d}"
+    
+    @staticmethod
+    def password_for(index):
+        """Deterministic password for the account at index (passes signup validation)"""
+        return f"pass{index:07d}"
+    
+    def generate(self):
+        """Generate the complete users dictionary"""
+        users_data = {}
+        start_date = self.end_date - timedelta(days=self.history_days)
+        span_seconds = self.history_days * 86400
+        
+        # Create accounts with their initial deposit
+        for index in range(self.num_accounts):
+            username = self.username_for(index)
+            created_offset = self.rng.randint(0, span_seconds // 2)
+            created_at = start_date + timedelta(seconds=created_offset)
+            initial_deposit = round(self.rng.uniform(10, 5000), 2)
+            salt = self.rng.getrandbits(PasswordUtils.SALT_SIZE * 8).to_bytes(PasswordUtils.SALT_SIZE, 'big')
+            
+            users_data[username] = {
+                'name': f"{self.rng.choice(self.FIRST_NAMES)} {self.rng.choice(self.LAST_NAMES)}",
+                'password_hash': PasswordUtils.hash_password(self.password_for(index),
+                                                             iterations=self.kdf_iterations,
+                                                             salt=salt),
+                'balance': initial_deposit,
+                'account_status': 'active',
+                'created_at': created_at.strftime(self.TIMESTAMP_FORMAT),
+                'transactions': [{
+                    'type': 'deposit',
+                    'amount': initial_deposit,
+                    'description': 'Initial deposit',
+                    'timestamp': created_at.strftime(self.TIMESTAMP_FORMAT),
+                    'balance_after': initial_deposit
+                }]
+            }
+        
+        # Schedule every account's activity, then replay it in time order so balances stay consistent
+        events = []
+        usernames = list(users_data)
+        for username in usernames:
+            created_at = datetime.strptime(users_data[username]['created_at'], self.TIMESTAMP_FORMAT)
+            remaining = int((self.end_date - created_at).total_seconds())
+            for _ in range(self._transaction_count()):
+                events.append((created_at + timedelta(seconds=self.rng.randint(1, max(remaining, 1))), username))
+        events.sort()
+        
+        for when, username in events:
+            self._apply_event(users_data, usernames, username, when.strftime(self.TIMESTAMP_FORMAT))
+        
+        return users_data
+    
+    def write(self, data_dir):
+        """Generate the bank and store it through FileHandler in data_dir"""
+        users_data = self.generate()
+        previous_dir = FileHandler.DATA_DIR
+        FileHandler.set_data_directory(data_dir)
+        try:
+            FileHandler.save_users(users_data)
+        finally:
+            FileHandler.set_data_directory(previous_dir)
+        return users_data
+    
+    def _transaction_count(self):
+        """Draw the number of transactions for one account from the configured distribution"""
+        mean = self.mean_transactions
+        if mean <= 0:
+            return 0
+        if self.distribution == 'fixed':
+            return int(mean)
+        if self.distribution == 'uniform':
+            return self.rng.randint(0, int(2 * mean))
+        if self.distribution == 'pareto':
+            # Heavy-tailed: most accounts are quiet, a few are very busy
+            alpha = 1.5
+            return int(mean * (alpha - 1) / alpha * self.rng.paretovariate(alpha))
+        # Poisson (normal approximation for large means)
+        if mean > 50:
+            return max(0, int(round(self.rng.gauss(mean, math.sqrt(mean)))))
+        limit = math.exp(-mean)
+        count, product = 0, self.rng.random()
+        while product > limit:
+            count += 1
+            product *= self.rng.random()
+        return count
+    
+    def _apply_event(self, users_data, usernames, username, timestamp):
+        """Apply one synthetic deposit, withdrawal or transfer"""
+        user = users_data[username]
+        kind = self.rng.choices(('deposit', 'withdrawal', 'transfer'), weights=(45, 30, 25))[0]
+        
+        if kind == 'deposit' or user['balance'] < 1:
+            amount = round(self.rng.uniform(1, 2000), 2)
+            user['balance'] = round(user['balance'] + amount, 2)
+            user['transactions'].append({
+                'type': 'deposit',
+                'amount': amount,
+                'description': 'Cash deposit',
+                'timestamp': timestamp,
+                'balance_after': user['balance']
+            })
+            return
+        
+        amount = round(self.rng.uniform(1, min(user['balance'], 1000)), 2)
+        recipient = self.rng.choice(usernames)
+        # Accounts cannot receive transfers before they are opened
+        if kind == 'withdrawal' or recipient == username or users_data[recipient]['created_at'] > timestamp:
+            user['balance'] = round(user['balance'] - amount, 2)
+            user['transactions'].append({
+                'type': 'withdrawal',
+                'amount': amount,
+                'description': 'Cash withdrawal',
+                'timestamp': timestamp,
+                'balance_after': user['balance']
+            })
+            return
+        
+        recipient_user = users_data[recipient]
+        user['balance'] = round(user['balance'] - amount, 2)
+        recipient_user['balance'] = round(recipient_user['balance'] + amount, 2)
+        user['transactions'].append({
+            'type': 'transfer_out',
+            'amount': amount,
+            'description': f"Transfer to {recipient_user['name']} (to {recipient_user['name']})",
+            'recipient': recipient,
+            'timestamp': timestamp,
+            'balance_after': user['balance']
+        })
+        recipient_user['transactions'].append({
+            'type': 'transfer_in',
+            'amount': amount,
+            'description': f"Transfer to {recipient_user['name']} (from {user['name']})",
+            'sender': username,
+            'timestamp': timestamp,
+            'balance_after': recipient_user['balance']
+        })
+
+class WorkloadGenerator:
+    """Generates a seeded JSONL workload of banking operations"""
+    
+    DEFAULT_MIX = {
+        'login': 20,
+        'balance': 20,
+        'deposit': 20,
+        'withdraw': 15,
+        'transfer': 15,
+        'statement': 10
+    }
+    
+    def __init__(self, num_accounts, seed=42, mix=None):
+        self.num_accounts = num_accounts
+        self.seed = seed
+        self.mix = mix or dict(self.DEFAULT_MIX)
+        self.rng = random.Random(seed)
+    
+    def generate(self, num_operations):
+        """Yield workload operations as dictionaries"""
+        operations = list(self.mix)
+        weights = [self.mix[op] for op in operations]
+        
+        for seq in range(1, num_operations + 1):
+            op = self.rng.choices(operations, weights=weights)[0]
+            index = self.rng.randrange(self.num_accounts)
+            entry = {'seq': seq, 'op': op, 'username': BankGenerator.username_for(index)}
+            
+            if op == 'login':
+                # Roughly one in twenty logins uses a wrong password
+                if self.rng.random() < 0.05:
+                    entry['password'] = "wrong" + BankGenerator.password_for(index)
+                else:
+                    entry['password'] = BankGenerator.password_for(index)
+            elif op == 'deposit':
+                entry['amount'] = round(self.rng.uniform(1, 2000), 2)
+            elif op == 'withdraw':
+                entry['amount'] = round(self.rng.uniform(1, 500), 2)
+            elif op == 'transfer':
+                entry['amount'] = round(self.rng.uniform(1, 500), 2)
+                entry['recipient'] = BankGenerator.username_for(self.rng.randrange(self.num_accounts))
+            yield entry
+    
+    def write(self, path, num_operations):
+        """Write the workload to a JSONL file"""
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as f:
+            for entry in self.generate(num_operations):
+                f.write(json.dumps(entry) + "\n")
+        return path
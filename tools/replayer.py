@@ -0,0 +1,175 @@
+"""
+Workload Replayer - Drives a JSONL workload through the banking managers and reports latency
+"""
+
+import json
+import time
+from auth.login import LoginManager
+from auth.session import SessionManager
+from banking.account import AccountManager
+from banking.transfer import TransferManager
+from banking.transactions import TransactionManager
+from utils.file_handler import FileHandler
+
+class WorkloadReplayer:
+    """Replays recorded operations headlessly and collects throughput/latency figures"""
+    
+    def __init__(self, profiler=None):
+        self.profiler = profiler
+        self.session_manager = SessionManager()
+        self.login_manager = LoginManager()
+        self.account_manager = AccountManager()
+        self.transfer_manager = TransferManager()
+        self.transaction_manager = TransactionManager()
+        self.latencies = {}
+        self.outcomes = {}
+        self.elapsed = 0.0
+    
+    def replay(self, workload_path, limit=None):
+        """Replay every operation in the workload file"""
+        handlers = {
+            'login': self._login,
+            'balance': self._balance,
+            'deposit': self._deposit,
+            'withdraw': self._withdraw,
+            'transfer': self._transfer,
+            'statement': self._statement
+        }
+        
+        started = time.perf_counter()
+        with open(workload_path, 'r') as f:
+            for count, line in enumerate(f):
+                if limit is not None and count >= limit:
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                op = entry['op']
+                handler = handlers.get(op)
+                
+                op_started = time.perf_counter()
+                try:
+                    if handler is None:
+                        outcome = 'unknown'
+                    elif self.profiler:
+                        outcome = self.profiler.run(op, handler, entry)
+                    else:
+                        outcome = handler(entry)
+                except Exception:
+                    outcome = 'failed'
+                self.latencies.setdefault(op, []).append(time.perf_counter() - op_started)
+                key = (op, outcome)
+                self.outcomes[key] = self.outcomes.get(key, 0) + 1
+        self.elapsed = time.perf_counter() - started
+        self.session_manager.logout()
+        return self.report()
+    
+    def report(self):
+        """Build a summary dictionary of throughput and latency percentiles"""
+        total_ops = sum(len(samples) for samples in self.latencies.values())
+        summary = {
+            'total_operations': total_ops,
+            'elapsed_seconds': round(self.elapsed, 4),
+            'throughput_ops_per_sec': round(total_ops / self.elapsed, 2) if self.elapsed else 0.0,
+            'operations': {}
+        }
+        for op, samples in sorted(self.latencies.items()):
+            ordered = sorted(samples)
+            summary['operations'][op] = {
+                'count': len(ordered),
+                'outcomes': {outcome: n for (name, outcome), n in self.outcomes.items() if name == op},
+                'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+                'p50_ms': round(self._percentile(ordered, 50) * 1000, 3),
+                'p95_ms': round(self._percentile(ordered, 95) * 1000, 3),
+                'p99_ms': round(self._percentile(ordered, 99) * 1000, 3),
+                'max_ms': round(ordered[-1] * 1000, 3)
+            }
+        return summary
+    
+    @staticmethod
+    def print_report(summary):
+        """Display a replay summary"""
+        print("\n📈 WORKLOAD REPLAY REPORT")
+        print("=" * 80)
+        print(f"Operations: {summary['total_operations']}")
+        print(f"Elapsed: {summary['elapsed_seconds']:.3f}s")
+        print(f"Throughput: {summary['throughput_ops_per_sec']:.2f} ops/sec")
+        print("-" * 80)
+        print(f"{'Operation':<12}{'Count':>8}{'Mean ms':>11}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'Max ms':>11}")
+        for op, stats in summary['operations'].items():
+            print(f"{op:<12}{stats['count']:>8}{stats['mean_ms']:>11.3f}{stats['p50_ms']:>11.3f}"
+                  f"{stats['p95_ms']:>11.3f}{stats['p99_ms']:>11.3f}{stats['max_ms']:>11.3f}")
+            outcomes = ", ".join(f"{name}={n}" for name, n in sorted(stats['outcomes'].items()))
+            print(f"{'':<12}{outcomes}")
+        print("=" * 80)
+    
+    @staticmethod
+    def _percentile(ordered, percent):
+        """Nearest-rank percentile of an already sorted list"""
+        if not ordered:
+            return 0.0
+        rank = max(1, int(round(percent / 100 * len(ordered))))
+        return ordered[min(rank, len(ordered)) - 1]
+    
+    def _login(self, entry):
+        """Authenticate a user the same way the login menu does"""
+        if self.login_manager._authenticate_user(entry['username'], entry['password']):
+            return 'ok'
+        return 'rejected'
+    
+    def _balance(self, entry):
+        """Read a fresh balance from storage"""
+        users_data = FileHandler.load_users()
+        if entry['username'] not in users_data:
+            return 'rejected'
+        return 'ok'
+    
+    def _deposit(self, entry):
+        """Deposit with the interactive menu's validation rules"""
+        amount = entry['amount']
+        if amount <= 0 or amount > AccountManager.MAX_DEPOSIT:
+            return 'rejected'
+        user_data = FileHandler.load_users().get(entry['username'])
+        if not user_data or not self.account_manager.limit_manager.check(user_data, 'deposit', amount)[0]:
+            return 'rejected'
+        return 'ok' if self.account_manager._process_deposit(entry['username'], amount) else 'failed'
+    
+    def _withdraw(self, entry):
+        """Withdraw with the interactive menu's validation rules"""
+        amount = entry['amount']
+        users_data = FileHandler.load_users()
+        user_data = users_data.get(entry['username'])
+        if not user_data or amount <= 0 or amount > user_data['balance'] or amount > AccountManager.MAX_WITHDRAWAL:
+            return 'rejected'
+        if not self.account_manager.limit_manager.check(user_data, 'withdrawal', amount)[0]:
+            return 'rejected'
+        return 'ok' if self.account_manager._process_withdrawal(entry['username'], amount) else 'failed'
+    
+    def _transfer(self, entry):
+        """Transfer with the interactive menu's validation rules"""
+        amount = entry['amount']
+        sender, recipient = entry['username'], entry['recipient']
+        users_data = FileHandler.load_users()
+        if sender == recipient or sender not in users_data or recipient not in users_data:
+            return 'rejected'
+        if users_data[recipient].get('account_status') != 'active':
+            return 'rejected'
+        if amount <= 0 or amount > users_data[sender]['balance'] or amount > TransferManager.MAX_TRANSFER:
+            return 'rejected'
+        if not self.transfer_manager.limit_manager.check(users_data[sender], 'transfer', amount)[0]:
+            return 'rejected'
+        description = f"Transfer to {users_data[recipient]['name']}"
+        if self.transfer_manager._process_transfer(sender, recipient, amount, description):
+            return 'ok'
+        return 'failed'
+    
+    def _statement(self, entry):
+        """Render a full account statement"""
+        users_data = FileHandler.load_users()
+        user_data = users_data.get(entry['username'])
+        if not user_data:
+            return 'rejected'
+        transactions = self.transaction_manager.archive.transactions(entry['username'], user_data)
+        self.transaction_manager._generate_statement_content(user_data, transactions)
+        return 'ok'
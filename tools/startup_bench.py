@@ -0,0 +1,93 @@
+"""
+Startup Benchmark - Wall-clock cost of launching main.py, with an import-time breakdown and a budget
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+class StartupBenchmark:
+    """Times fresh interpreter launches of main.py and checks them against a budget"""
+    
+    DEFAULT_BUDGET_MS = 150
+    # --help plus headless commands that do one small thing, so the launch itself dominates
+    DEFAULT_COMMANDS = (
+        ['--help'],
+        ['feed', '--from-seq', str(2 ** 62)],
+        ['holds', 'list', '--username', 'startup_probe']
+    )
+    
+    def __init__(self, data_dir, runs=7, budget_ms=None, top=15):
+        self.data_dir = data_dir
+        self.runs = runs
+        self.budget_ms = self.DEFAULT_BUDGET_MS if budget_ms is None else budget_ms
+        self.top = top
+        self.main_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+    
+    def run(self, commands=None):
+        """Benchmark each command; returns a report with per-command timings and the slowest imports"""
+        report = {'budget_ms': self.budget_ms, 'runs': self.runs, 'commands': []}
+        for command in commands or self.DEFAULT_COMMANDS:
+            argv = self._argv(command)
+            timings = [self._time(argv) for _ in range(self.runs)]
+            median = statistics.median(timings)
+            report['commands'].append({
+                'command': ' '.join(command),
+                'median_ms': round(median, 1),
+                'min_ms': round(min(timings), 1),
+                'max_ms': round(max(timings), 1),
+                'within_budget': median <= self.budget_ms
+            })
+        report['baseline_ms'] = round(statistics.median(
+            self._time([sys.executable, '-c', 'pass']) for _ in range(self.runs)), 1)
+        report['imports'] = self.import_breakdown(self._argv(['--help']))
+        report['ok'] = all(entry['within_budget'] for entry in report['commands'])
+        return report
+    
+    def _argv(self, command):
+        """Interpreter command line for one main.py invocation"""
+        return [sys.executable, self.main_path, '--data-dir', self.data_dir] + list(command)
+    
+    @staticmethod
+    def _time(argv):
+        """Milliseconds from launch to exit of one process"""
+        started = time.perf_counter()
+        subprocess.run(argv, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return (time.perf_counter() - started) * 1000
+    
+    def import_breakdown(self, argv):
+        """Slowest imports of one launch by cumulative time, as reported by -X importtime"""
+        result = subprocess.run([argv[0], '-X', 'importtime'] + argv[1:], stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+        imports = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            # "import time: <self us> | <cumulative us> | <two spaces per nesting level><module>"
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            name = name[1:]
+            depth = (len(name) - len(name.lstrip(' '))) // 2
+            imports.append({'module': name.strip(), 'depth': depth,
+                            'self_ms': int(self_us) / 1000, 'cumulative_ms': int(cumulative_us) / 1000})
+        imports.sort(key=lambda entry: entry['cumulative_ms'], reverse=True)
+        return imports[:self.top]
+    
+    @staticmethod
+    def print_report(report):
+        """Display a startup benchmark report"""
+        print("\n🚀 STARTUP BENCHMARK")
+        print("=" * 70)
+        print(f"Budget: {report['budget_ms']:.0f} ms (median of {report['runs']} runs)   "
+              f"Bare interpreter: {report['baseline_ms']:.1f} ms")
+        print("-" * 70)
+        for entry in report['commands']:
+            marker = "✅" if entry['within_budget'] else "❌"
+            print(f"{marker} {entry['median_ms']:>7.1f} ms  (min {entry['min_ms']:.1f}, max {entry['max_ms']:.1f})  "
+                  f"main.py {entry['command']}")
+        print("-" * 70)
+        print("Slowest imports for --help (cumulative ms):")
+        for entry in report['imports']:
+            print(f"   {entry['cumulative_ms']:>7.1f}  {'  ' * entry['depth']}{entry['module']}")
+        print("=" * 70)
@@ -0,0 +1,182 @@
+"""
+Audit Log - Buffered, asynchronous structured audit trail for financial events
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from utils.file_handler import FileHandler
+from utils.metrics import metrics
+
+AUDIT_EVENTS = metrics.counter(
+    'securebank_audit_events_total', "Audit events by how they were handled", ('result',))
+AUDIT_QUEUE_DEPTH = metrics.gauge(
+    'securebank_audit_queue_depth', "Audit events waiting for the background writer")
+
+class AuditLogger:
+    """Appends audit events to rotating JSONL files from a background writer thread"""
+    
+    AUDIT_DIR = "audit"
+    FILE_NAME = "audit.jsonl"
+    QUEUE_SIZE = 10000
+    MAX_BYTES = 10 * 1024 * 1024
+    BACKUP_COUNT = 10
+    BATCH_SIZE = 256
+    
+    # Back-pressure when the queue is full:
+    #   'block' - wait for the writer to make room (never loses events)
+    #   'sync'  - write the event inline on the caller's thread (never loses events)
+    #   'drop'  - discard the event and count it in securebank_audit_events_total{result="dropped"}
+    POLICIES = ('block', 'sync', 'drop')
+    
+    _instance = None
+    
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(AuditLogger, cls).__new__(cls)
+            cls._instance._setup()
+        return cls._instance
+    
+    def _setup(self):
+        """Initialise state; the writer thread starts on the first event"""
+        self.policy = 'block'
+        self.enabled = True
+        self.queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self.write_lock = threading.Lock()
+        self.writer = None
+        self.directory = None
+        self._stream = None
+    
+    def configure(self, policy=None, queue_size=None, max_bytes=None, backup_count=None, enabled=None):
+        """Adjust back-pressure policy and rotation before logging starts"""
+        if policy is not None:
+            if policy not in self.POLICIES:
+                raise ValueError(f"Unknown audit policy '{policy}'. Choose from {', '.join(self.POLICIES)}")
+            self.policy = policy
+        if queue_size is not None and self.writer is None:
+            self.queue = queue.Queue(maxsize=queue_size)
+        if max_bytes is not None:
+            self.MAX_BYTES = max_bytes
+        if backup_count is not None:
+            self.BACKUP_COUNT = backup_count
+        if enabled is not None:
+            self.enabled = enabled
+    
+    def log(self, event, actor, accounts=None, amount=None, balance_before=None,
+            balance_after=None, outcome='success', **details):
+        """Queue one audit event; never touches the disk on the caller's thread unless policy is 'sync'"""
+        if not self.enabled:
+            return
+        record = {
+            'ts': time.time(),
+            'event': event,
+            'actor': actor,
+            'accounts': accounts if accounts is not None else [actor],
+            'outcome': outcome
+        }
+        if amount is not None:
+            record['amount'] = amount
+        if balance_before is not None:
+            record['balance_before'] = balance_before
+        if balance_after is not None:
+            record['balance_after'] = balance_after
+        if details:
+            record['details'] = details
+        
+        if self.writer is None:
+            self._start()
+        
+        try:
+            self.queue.put_nowait(record)
+            AUDIT_EVENTS.labels('queued').inc()
+            return
+        except queue.Full:
+            pass
+        
+        if self.policy == 'block':
+            AUDIT_EVENTS.labels('blocked').inc()
+            self.queue.put(record)
+        elif self.policy == 'sync':
+            AUDIT_EVENTS.labels('inline').inc()
+            self._write_batch([record])
+        else:
+            AUDIT_EVENTS.labels('dropped').inc()
+    
+    def flush(self, timeout=5.0):
+        """Wait until every queued event has been written"""
+        if self.writer is None:
+            return True
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+    
+    def current_path(self):
+        """Path of the active audit file"""
+        directory = self.directory or os.path.join(FileHandler.DATA_DIR, self.AUDIT_DIR)
+        return os.path.join(directory, self.FILE_NAME)
+    
+    def _start(self):
+        """Start the background writer thread"""
+        with self.write_lock:
+            if self.writer is not None:
+                return
+            self.directory = os.path.join(FileHandler.DATA_DIR, self.AUDIT_DIR)
+            self.writer = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self.writer.start()
+            atexit.register(self.flush)
+    
+    def _run(self):
+        """Writer loop: drain the queue in batches and append them to disk"""
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            AUDIT_QUEUE_DEPTH.set(self.queue.qsize())
+            self._write_batch(batch)
+            for _ in batch:
+                self.queue.task_done()
+    
+    def _write_batch(self, batch):
+        """Append a batch of records, rotating the file when it grows too large"""
+        try:
+            lines = []
+            for record in batch:
+                record = dict(record)
+                record['ts'] = datetime.fromtimestamp(record['ts']).isoformat(timespec='microseconds')
+                lines.append(json.dumps(record, separators=(',', ':')) + "\n")
+            data = "".join(lines)
+            
+            with self.write_lock:
+                path = self.current_path()
+                if self._stream is None:
+                    if not os.path.exists(os.path.dirname(path)):
+                        os.makedirs(os.path.dirname(path))
+                    self._stream = open(path, 'a')
+                if self._stream.tell() + len(data) > self.MAX_BYTES and self._stream.tell() > 0:
+                    self._rotate(path)
+                self._stream.write(data)
+                self._stream.flush()
+            AUDIT_EVENTS.labels('written').inc(len(batch))
+        except Exception as e:
+            AUDIT_EVENTS.labels('failed').inc(len(batch))
+            print(f"❌ Error writing audit log: {e}")
+    
+    def _rotate(self, path):
+        """Shift audit.jsonl -> audit.jsonl.1 -> ... and start a fresh file"""
+        self._stream.close()
+        for index in range(self.BACKUP_COUNT - 1, 0, -1):
+            source = f"{path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{path}.{index + 1}")
+        os.replace(path, f"{path}.1")
+        self._stream = open(path, 'a')
@@ -0,0 +1,233 @@
+"""
+Change Feed - Ordered, sequence-numbered events for every committed mutation
+"""
+
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from utils.file_handler import FileHandler
+from utils.metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # No cross-process locking (e.g. Windows); a single writer process is assumed
+    fcntl = None
+
+FEED_EVENTS = metrics.counter(
+    'securebank_change_feed_events_total', "Change feed events published", ('type',))
+FEED_DROPPED = metrics.counter(
+    'securebank_change_feed_dropped_total', "Events dropped because an in-process subscriber's queue was full")
+
+class FeedSubscription:
+    """A bounded in-process queue of feed events"""
+    
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+    
+    def get(self, timeout=None):
+        """Next event, or None on timeout; a gap in 'seq' means events were dropped (re-read them from the file)"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class ChangeFeed:
+    """Appends events to segmented JSONL files and fans them out to in-process subscribers"""
+    
+    FEED_DIR = "changes"
+    SEGMENT_PREFIX = "feed-"
+    SEGMENT_SUFFIX = ".jsonl"
+    LOCK_FILE = ".lock"
+    MAX_BYTES = 64 * 1024 * 1024  # Segment size before a new file is started
+    
+    _instance = None
+    
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ChangeFeed, cls).__new__(cls)
+            cls._instance.lock = threading.Lock()
+            cls._instance.subscribers = []
+            cls._instance.enabled = True
+            cls._instance._tail = None  # (path, size, seq) after our last append
+        return cls._instance
+    
+    def publish(self, event_type, accounts, **fields):
+        """Append one committed change and deliver it to subscribers; returns its sequence number"""
+        if not self.enabled or FileHandler.read_only:
+            return None
+        event = {'seq': None, 'ts': time.time(), 'type': event_type, 'accounts': accounts}
+        event.update(fields)
+        try:
+            with self.lock:
+                directory = self.directory()
+                if not os.path.exists(directory):
+                    os.makedirs(directory)
+                with open(os.path.join(directory, self.LOCK_FILE), 'a') as lock_file:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        self._append(event)
+                    finally:
+                        if fcntl:
+                            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        except Exception as e:
+            print(f"❌ Error publishing change event: {e}")
+            return None
+        
+        FEED_EVENTS.labels(event_type).inc()
+        for subscription in list(self.subscribers):
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                subscription.dropped += 1
+                FEED_DROPPED.inc()
+        return event['seq']
+    
+    def _append(self, event):
+        """Assign the next sequence number and append the event (caller holds the file lock)"""
+        segments = self.segments()
+        path = segments[-1][1] if segments else None
+        size = os.path.getsize(path) if path else 0
+        if self._tail and self._tail[0] == path and self._tail[1] == size:
+            last_seq = self._tail[2]
+        else:
+            # Another process appended since our last write (or this is our first): read its last event
+            last_seq = self._last_seq(path) if path else 0
+        event['seq'] = last_seq + 1
+        
+        if path is None or size >= self.MAX_BYTES:
+            path = self._segment_path(event['seq'])
+        line = json.dumps(event, separators=(',', ':')) + "\n"
+        if size and not self._ends_with_newline(path):
+            line = "\n" + line  # Close off a line torn by a crash so this event stays parseable
+        with open(path, 'a') as f:
+            f.write(line)
+            f.flush()
+            size = f.tell()
+        self._tail = (path, size, event['seq'])
+    
+    def subscribe(self, maxsize=1000):
+        """Register an in-process subscriber with a bounded queue"""
+        subscription = FeedSubscription(maxsize)
+        self.subscribers.append(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        """Stop delivering to a subscriber"""
+        if subscription in self.subscribers:
+            self.subscribers.remove(subscription)
+    
+    def read(self, from_seq=1, data_dir=None):
+        """Yield stored events with seq >= from_seq, locating the start by bisection"""
+        segments = self.segments(data_dir)
+        start = 0
+        for index, (first_seq, _) in enumerate(segments):
+            if first_seq <= from_seq:
+                start = index
+        for index in range(start, len(segments)):
+            path = segments[index][1]
+            with open(path, 'rb') as f:
+                if index == start:
+                    f.seek(self._offset_of(f, os.path.getsize(path), from_seq))
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # Partially written; a later read will pick it up
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue  # Torn by a crash mid-write
+                    if event['seq'] >= from_seq:
+                        yield event
+    
+    def tail(self, from_seq=1, poll_interval=0.5):
+        """Yield events from from_seq onwards, then keep following new ones"""
+        next_seq = from_seq
+        while True:
+            for event in self.read(next_seq):
+                next_seq = event['seq'] + 1
+                yield event
+            time.sleep(poll_interval)
+    
+    def last_seq(self, data_dir=None):
+        """Sequence number of the newest event (0 if none)"""
+        segments = self.segments(data_dir)
+        return self._last_seq(segments[-1][1]) if segments else 0
+    
+    def segments(self, data_dir=None):
+        """(first_seq, path) for each segment, oldest first"""
+        pattern = os.path.join(self.directory(data_dir), f"{self.SEGMENT_PREFIX}*{self.SEGMENT_SUFFIX}")
+        found = []
+        for path in glob.glob(pattern):
+            name = os.path.basename(path)
+            found.append((int(name[len(self.SEGMENT_PREFIX):-len(self.SEGMENT_SUFFIX)]), path))
+        return sorted(found)
+    
+    def directory(self, data_dir=None):
+        """Feed directory inside the current data directory (or data_dir, to read another one's feed)"""
+        return os.path.join(data_dir or FileHandler.DATA_DIR, self.FEED_DIR)
+    
+    def _segment_path(self, first_seq):
+        """File name for a segment starting at first_seq (zero-padded so names sort numerically)"""
+        return os.path.join(self.directory(), f"{self.SEGMENT_PREFIX}{first_seq:020d}{self.SEGMENT_SUFFIX}")
+    
+    @staticmethod
+    def _parse_seq(line):
+        """Sequence number of one stored line, or None if it is not a complete event"""
+        try:
+            return json.loads(line)['seq']
+        except (ValueError, KeyError, TypeError):
+            return None
+    
+    @staticmethod
+    def _ends_with_newline(path):
+        """Whether a segment's last byte is a newline"""
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+    
+    @staticmethod
+    def _last_seq(path):
+        """Sequence number on the last complete line of a segment"""
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            block = 4096
+            while True:
+                start = max(0, end - block)
+                f.seek(start)
+                data = f.read(end - start)
+                lines = data.split(b"\n")[:-1]
+                if start:
+                    lines = lines[1:]  # The first piece may be the tail of a longer line
+                for line in reversed(lines):
+                    seq = ChangeFeed._parse_seq(line)
+                    if seq is not None:
+                        return seq
+                if start == 0:
+                    return 0
+                block *= 2
+    
+    @staticmethod
+    def _offset_of(f, size, seq):
+        """Byte offset of the first line whose seq is >= seq (lines are ordered by seq)"""
+        low, high = 0, size
+        while low < high:
+            middle = (low + high) // 2
+            # Move to the first line starting at or after middle
+            f.seek(max(middle - 1, 0))
+            if middle:
+                f.readline()
+            line = f.readline()
+            line_seq = ChangeFeed._parse_seq(line) if line.endswith(b"\n") else None
+            if not line.endswith(b"\n") or (line_seq is not None and line_seq >= seq):
+                high = middle
+            else:
+                low = f.tell()
+        f.seek(max(low - 1, 0))
+        if low:
+            f.readline()
+        return f.tell()
@@ -4,13 +4,57 @@ File Handler - Manages file operations for data storage
 
 import json
 import os
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from functools import wraps
+from utils.metrics import (STORAGE_ACCOUNTS, STORAGE_BYTES_READ, STORAGE_BYTES_WRITTEN,
+                           STORAGE_ERRORS, STORAGE_PARSE_SECONDS, STORAGE_SECONDS)
+
+try:
+    import fcntl
+except ImportError:  # No cross-process locking (e.g. Windows); a single writer process is assumed
+    fcntl = None
+
+def exclusive_write(method):
+    """Decorator: run a method that loads, changes and saves users.json under FileHandler.writer_lock()"""
+    @wraps(method)
+    def locked(*args, **kwargs):
+        with FileHandler.writer_lock():
+            return method(*args, **kwargs)
+    return locked
 
 class FileHandler:
     """Handles file operations for user data storage"""
     
     DATA_DIR = "data"
     USERS_FILE = os.path.join(DATA_DIR, "users.json")
+    REPLICA_FILE = "replica.json"
+    WRITER_LOCK_FILE = "users.lock"
+    save_listeners = []  # Called after each committed save to keep derived files in step
+    read_only = False    # True while DATA_DIR is a standby replica that has not been promoted
+    
+    # Writer lock state: one flock per process, re-entrant for the thread holding it
+    _writer_thread_lock = threading.RLock()
+    _writer_depth = 0
+    _writer_file = None
+    
+    @classmethod
+    def set_data_directory(cls, data_dir):
+        """Point storage at a different data directory"""
+        cls.DATA_DIR = data_dir
+        cls.USERS_FILE = os.path.join(data_dir, "users.json")
+        cls.read_only = cls.is_standby(data_dir)
+    
+    @classmethod
+    def is_standby(cls, data_dir):
+        """Whether data_dir is a replica still following its primary (see utils/replica.py)"""
+        try:
+            with open(os.path.join(data_dir, cls.REPLICA_FILE)) as f:
+                return json.load(f).get('role') == 'replica'
+        except (OSError, ValueError, AttributeError):
+            return False
     
     @classmethod
     def ensure_data_directory(cls):
@@ -21,6 +65,7 @@ class FileHandler:
     @classmethod
     def load_users(cls):
         """Load users data from JSON file"""
+        started = time.perf_counter()
         try:
             cls.ensure_data_directory()
             if os.path.exists(cls.USERS_FILE):
@@ -30,15 +75,25 @@ class FileHandler:
                     return {}
                 
                 with open(cls.USERS_FILE, 'r') as f:
-                    content = f.read().strip()
-                    if not content:
-                        return {}
-                    return json.loads(content)
+                    content = f.read()
+                STORAGE_BYTES_READ.inc(len(content))
+                content = content.strip()
+                if not content:
+                    return {}
+                
+                parse_started = time.perf_counter()
+                users_data = json.loads(content)
+                finished = time.perf_counter()
+                STORAGE_PARSE_SECONDS.labels('load').observe(finished - parse_started)
+                STORAGE_SECONDS.labels('load').observe(finished - started)
+                STORAGE_ACCOUNTS.set(len(users_data))
+                return users_data
             else:
                 # File doesn't exist, create it with empty dict
                 cls.save_users({})
                 return {}
         except json.JSONDecodeError as e:
+            STORAGE_ERRORS.labels('load').inc()
             print(f"❌ JSON parsing error: {e}")
             print("🔧 Attempting to fix corrupted data file...")
             # Backup corrupted file and create new one
@@ -53,35 +108,108 @@ class FileHandler:
                 print(f"❌ Error fixing data file: {backup_error}")
                 return {}
         except Exception as e:
+            STORAGE_ERRORS.labels('load').inc()
             print(f"❌ Error loading user data: {e}")
             return {}
     
     @classmethod
-    def save_users(cls, users_data):
-        """Save users data to JSON file"""
+    @contextmanager
+    def writer_lock(cls):
+        """Hold the exclusive writer lock, so a load -> mutate -> save cannot overwrite another writer's save
+
+        Every path that saves users.json loads, changes and saves it inside this lock.
+        It is re-entrant within a thread, so a locked method can call another one.
+        """
+        with cls._writer_thread_lock:
+            if cls._writer_depth == 0:
+                cls.ensure_data_directory()
+                cls._writer_file = open(os.path.join(cls.DATA_DIR, cls.WRITER_LOCK_FILE), 'a')
+                if fcntl:
+                    fcntl.flock(cls._writer_file, fcntl.LOCK_EX)
+            cls._writer_depth += 1
+            try:
+                yield
+            finally:
+                cls._writer_depth -= 1
+                if cls._writer_depth == 0:
+                    if fcntl:
+                        fcntl.flock(cls._writer_file, fcntl.LOCK_UN)
+                    cls._writer_file.close()
+                    cls._writer_file = None
+    
+    @classmethod
+    def locked_chunks(cls, usernames, chunk_size=None):
+        """Yield (users_data, chunk) for each chunk of usernames, freshly loaded under the writer lock
+
+        For long batch jobs: the caller applies and saves one chunk before taking the
+        next. Live writers get in between chunks, and each chunk starts from what they
+        committed. Without chunk_size everything is one chunk.
+        """
+        usernames = list(usernames)
+        size = chunk_size or len(usernames) or 1
+        for start in range(0, len(usernames), size):
+            with cls.writer_lock():
+                yield cls.load_users(), usernames[start:start + size]
+    
+    @classmethod
+    def add_save_listener(cls, listener):
+        """Register listener(users_data, replaced, committed, changed), called after every save"""
+        if listener not in cls.save_listeners:
+            cls.save_listeners.append(listener)
+    
+    @staticmethod
+    def file_identity(path):
+        """(inode, mtime ns, size) naming one committed version of a file"""
+        stat = os.stat(path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+    
+    @classmethod
+    def save_users(cls, users_data, changed=None):
+        """Save users data to JSON file (changed optionally names the only accounts touched)"""
+        if cls.read_only:
+            STORAGE_ERRORS.labels('save').inc()
+            print(f"❌ {cls.DATA_DIR} is a read-only replica; run 'replica promote' before writing to it.")
+            return False
+        started = time.perf_counter()
+        # One temporary file per writer, so concurrent saves can never interleave into a torn file
+        temp_file = f"{cls.USERS_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
         try:
             cls.ensure_data_directory()
             
-            # Validate that the data is JSON serializable
-            json.dumps(users_data)  # Test serialization
+            # Serialize up front so non-serializable data never touches the file
+            content = json.dumps(users_data, indent=2)
+            STORAGE_PARSE_SECONDS.labels('save').observe(time.perf_counter() - started)
             
             # Write to temporary file first, then rename (atomic operation)
-            temp_file = cls.USERS_FILE + '.tmp'
             with open(temp_file, 'w') as f:
-                json.dump(users_data, f, indent=2)
+                f.write(content)
+            STORAGE_BYTES_WRITTEN.inc(len(content))
             
             # Replace the original file
+            committed = cls.file_identity(temp_file)
             if os.path.exists(cls.USERS_FILE):
+                replaced = cls.file_identity(cls.USERS_FILE)
                 os.replace(temp_file, cls.USERS_FILE)
             else:
+                replaced = None
                 os.rename(temp_file, cls.USERS_FILE)
             
+            STORAGE_SECONDS.labels('save').observe(time.perf_counter() - started)
+            STORAGE_ACCOUNTS.set(len(users_data))
+            for listener in cls.save_listeners:
+                try:
+                    listener(users_data, replaced, committed, changed)
+                except Exception as e:
+                    # The save itself is committed; derived files fall back to users.json until refreshed
+                    print(f"⚠️  Post-save update failed: {e}")
             return True
         except TypeError as e:
+            STORAGE_ERRORS.labels('save').inc()
             print(f"❌ Data serialization error: {e}")
             print("❌ Cannot save data - contains non-serializable objects")
             return False
         except Exception as e:
+            STORAGE_ERRORS.labels('save').inc()
             print(f"❌ Error saving user data: {e}")
             # Clean up temp file if it exists
             if os.path.exists(temp_file):
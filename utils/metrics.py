@@ -0,0 +1,246 @@
+"""
+Metrics - Lightweight counters, gauges and latency histograms with a Prometheus text exporter
+"""
+
+import os
+import threading
+from bisect import bisect_left
+
+# Latency buckets in seconds, from 50us up to 5s
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class Counter:
+    """Monotonically increasing value"""
+    
+    __slots__ = ('value',)
+    
+    def __init__(self):
+        self.value = 0
+    
+    def inc(self, amount=1):
+        """Increase the counter"""
+        self.value += amount
+
+class Gauge:
+    """Value that can go up and down"""
+    
+    __slots__ = ('value',)
+    
+    def __init__(self):
+        self.value = 0
+    
+    def set(self, value):
+        """Set the gauge to an absolute value"""
+        self.value = value
+    
+    def inc(self, amount=1):
+        """Increase the gauge"""
+        self.value += amount
+    
+    def dec(self, amount=1):
+        """Decrease the gauge"""
+        self.value -= amount
+
+class Histogram:
+    """Fixed-bucket histogram (observations are O(log buckets))"""
+    
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+    
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value):
+        """Record one observation"""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class MetricFamily:
+    """A named metric with optional labels; children are cached per label tuple"""
+    
+    def __init__(self, kind, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.children = {}
+        if not self.labelnames:
+            self._default = self._new_child()
+            self.children[()] = self._default
+    
+    def _new_child(self):
+        """Create an empty child of this family's kind"""
+        if self.kind == 'counter':
+            return Counter()
+        if self.kind == 'gauge':
+            return Gauge()
+        return Histogram(self.buckets)
+    
+    def labels(self, *values):
+        """Get (or create) the child for the given label values"""
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self.children.setdefault(values, self._new_child())
+        return child
+    
+    # Unlabelled shortcuts
+    def inc(self, amount=1):
+        self._default.inc(amount)
+    
+    def dec(self, amount=1):
+        self._default.dec(amount)
+    
+    def set(self, value):
+        self._default.set(value)
+    
+    def observe(self, value):
+        self._default.observe(value)
+
+class MetricsRegistry:
+    """Process-wide registry of metric families"""
+    
+    _instance = None
+    
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(MetricsRegistry, cls).__new__(cls)
+            cls._instance.families = {}
+            cls._instance._lock = threading.Lock()
+        return cls._instance
+    
+    def _register(self, kind, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        """Register a family once; repeated registration returns the existing one"""
+        with self._lock:
+            family = self.families.get(name)
+            if family is None:
+                family = MetricFamily(kind, name, documentation, labelnames, buckets)
+                self.families[name] = family
+            return family
+    
+    def counter(self, name, documentation, labelnames=()):
+        """Register or fetch a counter family"""
+        return self._register('counter', name, documentation, labelnames)
+    
+    def gauge(self, name, documentation, labelnames=()):
+        """Register or fetch a gauge family"""
+        return self._register('gauge', name, documentation, labelnames)
+    
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Register or fetch a histogram family"""
+        return self._register('histogram', name, documentation, labelnames, buckets)
+    
+    def reset(self):
+        """Clear all recorded values (families stay registered)"""
+        for family in self.families.values():
+            for key in list(family.children):
+                family.children[key] = family._new_child()
+            if not family.labelnames:
+                family._default = family.children[()]
+    
+    def render(self):
+        """Render every family in the Prometheus text exposition format"""
+        lines = []
+        for name in sorted(self.families):
+            family = self.families[name]
+            lines.append(f"# HELP {name} {family.documentation}")
+            lines.append(f"# TYPE {name} {family.kind}")
+            for values, child in sorted(family.children.items()):
+                labels = self._format_labels(family.labelnames, values)
+                if family.kind == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(family.buckets, child.counts):
+                        cumulative += count
+                        bucket_labels = self._format_labels(family.labelnames + ('le',), values + (repr(float(bound)),))
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    bucket_labels = self._format_labels(family.labelnames + ('le',), values + ('+Inf',))
+                    lines.append(f"{name}_bucket{bucket_labels} {child.count}")
+                    lines.append(f"{name}_sum{labels} {child.sum}")
+                    lines.append(f"{name}_count{labels} {child.count}")
+                else:
+                    lines.append(f"{name}{labels} {child.value}")
+        return "\n".join(lines) + "\n"
+    
+    @staticmethod
+    def _format_labels(labelnames, values):
+        """Format a label set as {a="x",b="y"}"""
+        if not labelnames:
+            return ""
+        pairs = []
+        for label, value in zip(labelnames, values):
+            escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            pairs.append(f'{label}="{escaped}"')
+        return "{" + ",".join(pairs) + "}"
+    
+    def write_textfile(self, path):
+        """Atomically write the Prometheus text dump to path"""
+        try:
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            temp_file = path + '.tmp'
+            with open(temp_file, 'w') as f:
+                f.write(self.render())
+            os.replace(temp_file, path)
+            return True
+        except Exception as e:
+            print(f"❌ Error writing metrics file: {e}")
+            return False
+    
+    def serve(self, port, host='127.0.0.1'):
+        """Serve /metrics over HTTP from a daemon thread; returns the server"""
+        # Imported here: http.server costs more at startup than everything else in this module
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        registry = self
+        
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        server = HTTPServer((host, port), MetricsHandler)
+        thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+        thread.start()
+        return server
+
+# Shared instrumentation used across storage, auth and banking
+metrics = MetricsRegistry()
+
+STORAGE_BYTES_READ = metrics.counter(
+    'securebank_storage_bytes_read_total', "Bytes read from the users data file")
+STORAGE_BYTES_WRITTEN = metrics.counter(
+    'securebank_storage_bytes_written_total', "Bytes written to the users data file")
+STORAGE_SECONDS = metrics.histogram(
+    'securebank_storage_operation_seconds', "Storage operation latency", ('operation',))
+STORAGE_PARSE_SECONDS = metrics.histogram(
+    'securebank_storage_parse_seconds', "JSON parse/serialize time", ('operation',))
+STORAGE_ERRORS = metrics.counter(
+    'securebank_storage_errors_total', "Storage failures", ('operation',))
+STORAGE_ACCOUNTS = metrics.gauge(
+    'securebank_accounts', "Accounts in the last loaded or saved data file")
+KDF_SECONDS = metrics.histogram(
+    'securebank_kdf_seconds', "Password key-derivation time", ('operation',))
+AUTH_ATTEMPTS = metrics.counter(
+    'securebank_auth_attempts_total', "Authentication attempts by outcome", ('outcome',))
+BANKING_OPERATIONS = metrics.counter(
+    'securebank_banking_operations_total', "Banking operations by type and outcome", ('operation', 'outcome'))
+BANKING_SECONDS = metrics.histogram(
+    'securebank_banking_operation_seconds', "Banking operation latency", ('operation',))
+BANKING_AMOUNT = metrics.counter(
+    'securebank_banking_amount_total', "Money moved by operation type", ('operation',))
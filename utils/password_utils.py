@@ -3,47 +3,73 @@ Password Utilities - Handles password hashing and verification
 """
 
 import hashlib
+import hmac
 import os
 import base64
+import time
+from utils.metrics import KDF_SECONDS
 
 class PasswordUtils:
     """Utilities for password hashing and verification"""
     
+    ITERATIONS = 100000  # Production KDF cost
+    TEST_ITERATIONS = 1  # Cheap KDF profile for synthetic/test data only
+    SALT_SIZE = 32
+    HASH_PREFIX = "pbkdf2_sha256"
+    
     @staticmethod
-    def hash_password(password):
+    def hash_password(password, iterations=None, salt=None):
         """Hash password using SHA-256 with salt"""
+        if iterations is None:
+            iterations = PasswordUtils.ITERATIONS
+        
         # Generate a random salt
-        salt = os.urandom(32)
+        if salt is None:
+            salt = os.urandom(PasswordUtils.SALT_SIZE)
         
         # Hash the password with salt
-        password_hash = hashlib.pbkdf2_hmac('sha256', 
-                                          password.encode('utf-8'), 
-                                          salt, 
-                                          100000)  # 100,000 iterations
+        started = time.perf_counter()
+        password_hash = hashlib.pbkdf2_hmac('sha256',
+                                          password.encode('utf-8'),
+                                          salt,
+                                          iterations)
+        KDF_SECONDS.labels('hash').observe(time.perf_counter() - started)
         
         # Combine salt and hash, then encode as base64 string for JSON storage
         combined = salt + password_hash
-        return base64.b64encode(combined).decode('utf-8')
+        encoded = base64.b64encode(combined).decode('utf-8')
+        
+        # Non-default costs are stored with their iteration count so they can be verified
+        if iterations != PasswordUtils.ITERATIONS:
+            return f"{PasswordUtils.HASH_PREFIX}${iterations}${encoded}"
+        return encoded
     
     @staticmethod
     def verify_password(password, stored_hash_b64):
         """Verify password against stored hash"""
         try:
+            iterations = PasswordUtils.ITERATIONS
+            if stored_hash_b64.startswith(PasswordUtils.HASH_PREFIX + "$"):
+                _, iterations, stored_hash_b64 = stored_hash_b64.split("$", 2)
+                iterations = int(iterations)
+            
             # Decode the base64 string back to bytes
             stored_hash = base64.b64decode(stored_hash_b64.encode('utf-8'))
             
             # Extract salt (first 32 bytes) and hash (rest)
-            salt = stored_hash[:32]
-            stored_password_hash = stored_hash[32:]
+            salt = stored_hash[:PasswordUtils.SALT_SIZE]
+            stored_password_hash = stored_hash[PasswordUtils.SALT_SIZE:]
             
             # Hash the provided password with the same salt
+            started = time.perf_counter()
             password_hash = hashlib.pbkdf2_hmac('sha256',
                                               password.encode('utf-8'),
                                               salt,
-                                              100000)
+                                              iterations)
+            KDF_SECONDS.labels('verify').observe(time.perf_counter() - started)
             
             # Compare hashes
-            return password_hash == stored_password_hash
+            return hmac.compare_digest(password_hash, stored_password_hash)
             
         except Exception as e:
             print(f"❌ Password verification error: {e}")
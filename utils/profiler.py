@@ -0,0 +1,135 @@
+"""
+Action Profiler - Opt-in cProfile/tracemalloc profiling of individual menu actions
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import re
+import time
+import tracemalloc
+
+class ActionProfiler:
+    """Profiles each dispatched action and aggregates the results over the session"""
+    
+    def __init__(self, output_dir, trace_memory=False, top_n=20):
+        self.output_dir = output_dir
+        self.trace_memory = trace_memory
+        self.top_n = top_n
+        self.sequence = 0
+        self.action_calls = {}
+        self.action_seconds = {}
+        self.action_peak_bytes = {}
+        self.session_stats = None
+        self.allocations = {}
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+    
+    def run(self, action, func, *args, **kwargs):
+        """Call func under the profiler, attributing its cost to action"""
+        self.sequence += 1
+        profile = cProfile.Profile()
+        before = None
+        if self.trace_memory:
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+        
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - started
+            after = None
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                self.action_peak_bytes[action] = max(self.action_peak_bytes.get(action, 0), peak)
+                after = tracemalloc.take_snapshot()
+            self._record(action, profile, elapsed, before, after)
+    
+    def _record(self, action, profile, elapsed, before, after):
+        """Store per-action stats and fold them into the session aggregate"""
+        try:
+            safe_action = re.sub(r'[^A-Za-z0-9_-]', '_', action)
+            path = os.path.join(self.output_dir, f"{self.sequence:05d}_{safe_action}.pstats")
+            profile.dump_stats(path)
+            
+            self.action_calls[action] = self.action_calls.get(action, 0) + 1
+            self.action_seconds[action] = self.action_seconds.get(action, 0.0) + elapsed
+            
+            if self.session_stats is None:
+                self.session_stats = pstats.Stats(profile)
+            else:
+                self.session_stats.add(profile)
+            
+            if before is not None and after is not None:
+                # Ignore the profiler's own bookkeeping
+                ignore = (tracemalloc.Filter(False, tracemalloc.__file__),
+                          tracemalloc.Filter(False, __file__))
+                after = after.filter_traces(ignore)
+                before = before.filter_traces(ignore)
+                for diff in after.compare_to(before, 'lineno'):
+                    if diff.size_diff <= 0:
+                        continue
+                    frame = diff.traceback[0]
+                    key = (frame.filename, frame.lineno)
+                    size, count = self.allocations.get(key, (0, 0))
+                    self.allocations[key] = (size + diff.size_diff, count + diff.count_diff)
+        except Exception as e:
+            print(f"❌ Error recording profile for {action}: {e}")
+    
+    def summary(self):
+        """Build the session summary text"""
+        lines = []
+        lines.append("=" * 80)
+        lines.append("SECURE BANK - PROFILING SUMMARY")
+        lines.append("=" * 80)
+        lines.append("")
+        lines.append(f"{'Action':<30}{'Calls':>8}{'Total s':>12}{'Mean ms':>12}{'Peak KiB':>14}")
+        lines.append("-" * 76)
+        for action in sorted(self.action_seconds, key=self.action_seconds.get, reverse=True):
+            calls = self.action_calls[action]
+            total = self.action_seconds[action]
+            peak = self.action_peak_bytes.get(action)
+            peak_str = f"{peak / 1024:.1f}" if peak is not None else "-"
+            lines.append(f"{action:<30}{calls:>8}{total:>12.4f}{total / calls * 1000:>12.3f}{peak_str:>14}")
+        lines.append("")
+        
+        if self.session_stats is not None:
+            for sort_key, title in (('cumulative', 'CUMULATIVE TIME'), ('tottime', 'INTERNAL TIME')):
+                stream = io.StringIO()
+                self.session_stats.stream = stream
+                self.session_stats.sort_stats(sort_key).print_stats(self.top_n)
+                lines.append(f"TOP {self.top_n} FUNCTIONS BY {title}")
+                lines.append("-" * 80)
+                lines.append(stream.getvalue().strip())
+                lines.append("")
+        
+        if self.trace_memory:
+            lines.append(f"TOP {self.top_n} ALLOCATION SITES (net bytes retained across actions)")
+            lines.append("-" * 80)
+            ranked = sorted(self.allocations.items(), key=lambda item: item[1][0], reverse=True)
+            for (filename, lineno), (size, count) in ranked[:self.top_n]:
+                lines.append(f"{size / 1024:>12.1f} KiB {count:>9} blocks  {filename}:{lineno}")
+            lines.append("")
+        
+        return "\n".join(lines)
+    
+    def write_summary(self):
+        """Write the aggregated session profile and summary to the output directory"""
+        try:
+            if self.session_stats is None:
+                return None
+            self.session_stats.dump_stats(os.path.join(self.output_dir, "session.pstats"))
+            path = os.path.join(self.output_dir, "summary.txt")
+            with open(path, 'w') as f:
+                f.write(self.summary())
+            print(f"📊 Profile summary saved as {path}")
+            return path
+        except Exception as e:
+            print(f"❌ Error writing profile summary: {e}")
+            return None
@@ -0,0 +1,423 @@
+"""
+Replica - Warm standby that mirrors a primary data directory by shipping checksummed changes
+"""
+
+import json
+import os
+import time
+import zlib
+from contextlib import contextmanager
+from utils.file_handler import FileHandler
+from utils.change_feed import ChangeFeed
+from utils.metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # No cross-process locking (e.g. Windows); one follower per replica is assumed
+    fcntl = None
+
+REPLICA_SHIPPED = metrics.counter(
+    'securebank_replica_shipped_total', "Changes shipped from the primary to the replica", ('kind',))
+REPLICA_BYTES = metrics.counter(
+    'securebank_replica_shipped_bytes_total', "Bytes shipped from the primary to the replica")
+REPLICA_LAG_EVENTS = metrics.gauge(
+    'securebank_replica_lag_events', "Committed change feed events the replica has not applied yet")
+REPLICA_LAG_SECONDS = metrics.gauge(
+    'securebank_replica_lag_seconds', "Age of the oldest change feed event the replica has not applied yet")
+
+class StandbyReplica:
+    """Follows a primary data directory into the current one, ready to take over if the primary is lost
+
+    users.json is shipped record by record: each cycle reads the primary's
+    committed version once, checksums every account's text (crc32) and ships
+    only the accounts whose checksum differs from the replica's copy.
+    Comparing checksums instead of trusting the change feed alone also
+    catches writers that save without publishing. Every other file (archive
+    segments, vault runs, the feed itself, audit logs, hold buckets, rate and
+    config files) is mirrored by identity: a file that only grew is shipped as
+    its new tail, a rewritten one is copied, a removed one is removed.
+
+    replica.json records the role, the primary, the applied feed sequence number
+    and a checksummed manifest of what was shipped. While the role is 'replica'
+    FileHandler refuses to save into the directory; promote() ends that.
+    """
+    
+    STATE_FILE = FileHandler.REPLICA_FILE
+    LOCK_FILE = "replica.lock"
+    USERS_NAME = "users.json"
+    SKIPPED_FILES = {USERS_NAME, STATE_FILE, LOCK_FILE, "accounts.tbl"}  # Top level; the table is rebuilt locally
+    SKIPPED_DIRS = {"snapshots"}                                        # Pins of this process's own readers
+    APPEND_CHECK_BYTES = 64 * 1024  # Bytes before a file's old end compared to confirm it only grew
+    
+    def __init__(self, primary_dir=None):
+        self.state = self._load_state()
+        if primary_dir and self.state.get('primary') and \
+                os.path.abspath(primary_dir) != self.state['primary']:
+            raise ValueError(f"{FileHandler.DATA_DIR} already follows {self.state['primary']}")
+        self.primary_dir = os.path.abspath(primary_dir) if primary_dir else self.state.get('primary')
+        self.feed = ChangeFeed()
+        self.records = None    # The replica's accounts as users.json text, loaded on the first sync
+        self.checksums = {}    # crc32 of each account's text
+        self.shipped = {'records': 0, 'files': 0, 'bytes': 0}
+    
+    def _state_path(self):
+        """replica.json inside the replica directory"""
+        return os.path.join(FileHandler.DATA_DIR, self.STATE_FILE)
+    
+    def _load_state(self):
+        """The stored replica state, or {} for a directory that is not a replica yet"""
+        try:
+            with open(self._state_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+    
+    def _save_state(self):
+        """Write replica.json atomically"""
+        self._write_atomic(self._state_path(), json.dumps(self.state, indent=2).encode('utf-8'))
+    
+    @staticmethod
+    def _write_atomic(path, payload):
+        """Write a file under a temporary name and rename it into place"""
+        temp_file = f"{path}.{os.getpid()}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(payload)
+        os.replace(temp_file, path)
+    
+    @contextmanager
+    def _locked(self):
+        """Hold the replica lock; only one follower (or a promotion) may work on a replica at a time"""
+        FileHandler.ensure_data_directory()
+        with open(os.path.join(FileHandler.DATA_DIR, self.LOCK_FILE), 'a') as lock_file:
+            if fcntl:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise ValueError(f"Another process is following into {FileHandler.DATA_DIR}; stop it first")
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _start(self):
+        """Make the current directory a replica of primary_dir, refusing anything that is not safe to overwrite"""
+        if self.state.get('role') == 'primary':
+            raise ValueError(f"{FileHandler.DATA_DIR} was promoted on {self.state['promoted_at']} "
+                             f"and no longer follows {self.state['primary']}")
+        if not self.primary_dir:
+            raise ValueError("--primary is required the first time a replica follows")
+        if self.primary_dir == os.path.abspath(FileHandler.DATA_DIR):
+            raise ValueError("A replica cannot follow its own directory")
+        if not self.state:
+            if os.path.exists(FileHandler.USERS_FILE):
+                raise ValueError(f"{FileHandler.DATA_DIR} already holds users.json and is not a replica; "
+                                 f"refusing to overwrite it")
+            FileHandler.ensure_data_directory()
+            self.state = {'role': 'replica', 'primary': self.primary_dir, 'created_at': time.time(),
+                          'applied_seq': 0, 'applied_ts': None, 'synced_at': None,
+                          'source_identity': None, 'users_crc': None, 'files': {}}
+            self._save_state()
+        FileHandler.read_only = True
+        if self.records is None:
+            content = b""
+            if os.path.exists(FileHandler.USERS_FILE):
+                with open(FileHandler.USERS_FILE, 'rb') as f:
+                    content = f.read()
+            self.records = dict(self.split_records(content))
+            self.checksums = {username: zlib.crc32(text) for username, text in self.records.items()}
+    
+    @staticmethod
+    def split_records(content):
+        """(username, record text) for each account in a users.json, as save_users() laid it out
+
+        save_users() writes json.dumps(indent=2), where every account starts on a
+        line indented by exactly two spaces and JSON strings never contain a raw
+        newline, so the file splits into per-account spans without being parsed.
+        Files in any other layout are parsed and each account rendered that way.
+        """
+        if not content.strip() or content.strip() == b"{}":
+            return []
+        if content.startswith(b'{\n  "') and content.endswith(b"\n}"):
+            pieces = content[2:-2].split(b',\n  "')
+            pieces = [pieces[0][2:]] + [b'"' + piece for piece in pieces[1:]]
+            try:
+                return [(json.loads(piece[:piece.index(b'": ') + 1]), piece) for piece in pieces]
+            except ValueError:
+                pass
+        return [(username, json.dumps({username: record}, indent=2)[2:-2].lstrip().encode('utf-8'))
+                for username, record in json.loads(content).items()]
+    
+    def ship(self):
+        """Read the primary's committed users.json once and collect the accounts that differ from the replica"""
+        # Events are published after their save, so every event up to here is in the version read below
+        seq = self.feed.last_seq(self.primary_dir)
+        batch = {'seq': seq, 'records': {}, 'checksums': {}, 'removed': [], 'order': None}
+        with open(os.path.join(self.primary_dir, self.USERS_NAME), 'rb') as f:
+            stat = os.fstat(f.fileno())
+            batch['identity'] = [stat.st_ino, stat.st_mtime_ns, stat.st_size]
+            if batch['identity'] == self.state.get('source_identity'):
+                return batch
+            content = f.read()
+        primary = self.split_records(content)
+        names = set()
+        for username, text in primary:
+            names.add(username)
+            crc = zlib.crc32(text)
+            if self.checksums.get(username) != crc:
+                batch['records'][username] = text
+                batch['checksums'][username] = crc
+        batch['removed'] = [username for username in self.records if username not in names]
+        # Account order only travels when applying the batch would not reproduce it
+        expected = [username for username in self.records if username in names]
+        expected += [username for username, _ in primary if username not in self.records]
+        if expected != [username for username, _ in primary]:
+            batch['order'] = [username for username, _ in primary]
+        return batch
+    
+    def apply(self, batch):
+        """Verify every shipped account against its checksum, then merge the batch and commit users.json"""
+        for username, text in batch['records'].items():
+            if zlib.crc32(text) != batch['checksums'][username]:
+                raise ValueError(f"Account {username} failed its checksum in transit; batch rejected")
+        changed = bool(batch['records'] or batch['removed'] or batch['order']) or \
+            not os.path.exists(FileHandler.USERS_FILE)
+        for username in batch['removed']:
+            self.records.pop(username, None)
+            self.checksums.pop(username, None)
+        self.records.update(batch['records'])
+        self.checksums.update(batch['checksums'])
+        if batch['order']:
+            self.records = {username: self.records[username] for username in batch['order']}
+        if changed:
+            self._commit_users(batch)
+        nbytes = sum(len(text) for text in batch['records'].values())
+        REPLICA_SHIPPED.labels('record').inc(len(batch['records']) + len(batch['removed']))
+        REPLICA_BYTES.inc(nbytes)
+        self.shipped['records'] += len(batch['records']) + len(batch['removed'])
+        self.shipped['bytes'] += nbytes
+        
+        self.state['source_identity'] = batch['identity']
+        if batch['seq'] and batch['seq'] != self.state['applied_seq']:
+            event = next(self.feed.read(batch['seq'], self.primary_dir), None)
+            self.state['applied_ts'] = event['ts'] if event else None
+        self.state['applied_seq'] = batch['seq']
+        return changed
+    
+    def _commit_users(self, batch):
+        """Write the replica's users.json in the primary's layout and bring its account table up to date"""
+        from banking.account_table import AccountTable
+        from banking.sub_accounts import SubAccountManager
+        
+        content = b"{\n  " + b",\n  ".join(self.records.values()) + b"\n}" if self.records else b"{}"
+        temp_file = f"{FileHandler.USERS_FILE}.{os.getpid()}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(content)
+        committed = FileHandler.file_identity(temp_file)
+        replaced = FileHandler.file_identity(FileHandler.USERS_FILE) if os.path.exists(FileHandler.USERS_FILE) else None
+        os.replace(temp_file, FileHandler.USERS_FILE)
+        self.state['users_crc'] = zlib.crc32(content)
+        
+        # Only the shipped accounts are parsed; removals (and a stale table) rebuild from the whole file
+        changed_users = {username: json.loads(text[text.index(b'": ') + 3:]) for username, text in batch['records'].items()}
+        AccountTable.sync(changed_users, None if batch['removed'] else replaced, committed,
+                          [name for name, _ in SubAccountManager.ledgers(changed_users)],
+                          load_all=lambda: json.loads(content))
+    
+    def mirror_files(self):
+        """Ship every other file that changed on the primary; returns the number shipped or removed"""
+        manifest = self.state['files']
+        seen = set()
+        shipped = 0
+        for relative, path in self._primary_files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # Removed while walking; dropped below like any other removal
+            seen.add(relative)
+            entry = manifest.get(relative)
+            if entry and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+                continue
+            size, crc = self._ship_file(relative, path, entry, stat.st_size)
+            manifest[relative] = [size, stat.st_mtime_ns, crc]
+            shipped += 1
+        for relative in [relative for relative in manifest if relative not in seen]:
+            try:
+                os.remove(os.path.join(FileHandler.DATA_DIR, relative))
+            except FileNotFoundError:
+                pass
+            del manifest[relative]
+            REPLICA_SHIPPED.labels('file_removed').inc()
+            shipped += 1
+        self.shipped['files'] += shipped
+        return shipped
+    
+    def _primary_files(self):
+        """(path relative to the data directory, absolute path) of every file the replica mirrors"""
+        for root, dirs, files in os.walk(self.primary_dir):
+            top = root == self.primary_dir
+            if top:
+                dirs[:] = [name for name in dirs if name not in self.SKIPPED_DIRS]
+            for name in files:
+                if (top and name in self.SKIPPED_FILES) or name.endswith(('.tmp', '.lock')):
+                    continue
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, self.primary_dir), path
+    
+    def _ship_file(self, relative, path, entry, size):
+        """Copy one file's new tail, or the whole file if it was rewritten; returns (replica size, crc32)"""
+        target = os.path.join(FileHandler.DATA_DIR, relative)
+        if entry and size > entry[0] and os.path.exists(target) and os.path.getsize(target) == entry[0] \
+                and self._only_grew(path, target, entry[0]):
+            with open(path, 'rb') as f:
+                f.seek(entry[0])
+                tail = f.read(size - entry[0])
+            with open(target, 'ab') as f:
+                f.write(tail)
+            REPLICA_SHIPPED.labels('file_appended').inc()
+            REPLICA_BYTES.inc(len(tail))
+            self.shipped['bytes'] += len(tail)
+            return entry[0] + len(tail), zlib.crc32(tail, entry[2])
+        
+        with open(path, 'rb') as f:
+            content = f.read()
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        self._write_atomic(target, content)
+        REPLICA_SHIPPED.labels('file_copied').inc()
+        REPLICA_BYTES.inc(len(content))
+        self.shipped['bytes'] += len(content)
+        return len(content), zlib.crc32(content)
+    
+    def _only_grew(self, path, target, old_size):
+        """Whether the bytes just before the replica's end are unchanged on the primary (an append-only file)"""
+        start = max(0, old_size - self.APPEND_CHECK_BYTES)
+        with open(path, 'rb') as source, open(target, 'rb') as copy:
+            source.seek(start)
+            copy.seek(start)
+            return source.read(old_size - start) == copy.read(old_size - start)
+    
+    def sync_once(self):
+        """One shipping cycle; returns what was applied and the lag afterwards"""
+        self._start()
+        started = time.perf_counter()
+        bytes_before = self.shipped['bytes']
+        batch = self.ship()
+        # Files first: they are at least as new as the users.json just read, so no account can
+        # reference an archive segment or vault run the replica does not have yet
+        files = self.mirror_files()
+        self.apply(batch)
+        self.state['synced_at'] = time.time()
+        lag_events, lag_seconds = self.lag()
+        self.state['lag_events'], self.state['lag_seconds'] = lag_events, lag_seconds
+        self._save_state()
+        return {'applied_seq': self.state['applied_seq'], 'records': len(batch['records']),
+                'removed': len(batch['removed']), 'files': files,
+                'bytes': self.shipped['bytes'] - bytes_before,
+                'lag_events': lag_events, 'lag_seconds': lag_seconds,
+                'seconds': time.perf_counter() - started}
+    
+    def follow(self, poll_interval=1.0, on_cycle=None, once=False):
+        """Keep shipping until interrupted; a cycle that fails (primary unreachable) is retried next interval"""
+        with self._locked():
+            if once:
+                return self.sync_once()
+            while True:
+                try:
+                    summary = self.sync_once()
+                except (OSError, ValueError) as e:
+                    summary = {'error': str(e)}
+                if on_cycle:
+                    on_cycle(summary)
+                time.sleep(poll_interval)
+    
+    def lag(self):
+        """(events behind, seconds behind) against the primary's change feed
+
+        An upper bound: events whose save was already shipped count until the
+        next cycle reads the feed again.
+        """
+        if not os.path.exists(os.path.join(self.primary_dir, self.USERS_NAME)):
+            raise FileNotFoundError(f"Primary {self.primary_dir} is unreachable")
+        applied = self.state.get('applied_seq', 0)
+        behind = max(0, self.feed.last_seq(self.primary_dir) - applied)
+        seconds = 0.0
+        if behind:
+            event = next(self.feed.read(applied + 1, self.primary_dir), None)
+            seconds = max(0.0, time.time() - event['ts']) if event else 0.0
+        REPLICA_LAG_EVENTS.set(behind)
+        REPLICA_LAG_SECONDS.set(seconds)
+        return behind, seconds
+    
+    def status(self):
+        """Stored state plus the live lag when the primary can still be read"""
+        status = dict(self.state)
+        status.pop('files', None)
+        status['files_mirrored'] = len(self.state.get('files', {}))
+        if self.state.get('role') == 'replica':
+            try:
+                status['lag_events'], status['lag_seconds'] = self.lag()
+                status['primary_reachable'] = True
+            except OSError:
+                status['primary_reachable'] = False
+        return status
+    
+    def verify(self):
+        """Recompute the checksum of users.json and every mirrored file; returns the paths that differ"""
+        problems = []
+        try:
+            with open(FileHandler.USERS_FILE, 'rb') as f:
+                if zlib.crc32(f.read()) != self.state.get('users_crc'):
+                    problems.append(self.USERS_NAME)
+        except FileNotFoundError:
+            problems.append(self.USERS_NAME)
+        for relative, (size, _, crc) in self.state.get('files', {}).items():
+            try:
+                with open(os.path.join(FileHandler.DATA_DIR, relative), 'rb') as f:
+                    content = f.read()
+            except FileNotFoundError:
+                problems.append(relative)
+                continue
+            if len(content) != size or zlib.crc32(content) != crc:
+                problems.append(relative)
+        return problems
+    
+    def repair(self, problems):
+        """Forget what verify() flagged and run a cycle, so those files are shipped again in full"""
+        for relative in problems:
+            if relative == self.USERS_NAME:
+                self.records = None  # Reloaded and re-checksummed from disk by the next cycle
+                self.state['source_identity'] = None
+            else:
+                self.state['files'].pop(relative, None)
+        self.sync_once()
+        return len(problems)
+    
+    def promote(self, catch_up=True, force=False):
+        """Turn this replica into a primary: final catch-up if the primary is readable, verify, open for writes"""
+        if self.state.get('role') != 'replica':
+            raise ValueError(f"{FileHandler.DATA_DIR} is not a replica")
+        report = {'catch_up_error': None, 'lag_events': None, 'lag_seconds': None}
+        with self._locked():
+            if catch_up:
+                try:
+                    summary = self.sync_once()
+                    report['lag_events'], report['lag_seconds'] = summary['lag_events'], summary['lag_seconds']
+                except (OSError, ValueError) as e:
+                    report['catch_up_error'] = str(e)
+            report['problems'] = self.verify()
+            if report['problems'] and catch_up and not report['catch_up_error']:
+                # Damaged on this side (the primary is still readable): ship those files again
+                report['repaired'] = self.repair(report['problems'])
+                report['problems'] = self.verify()
+            if report['problems'] and not force:
+                raise ValueError(f"{len(report['problems'])} files failed verification "
+                                 f"({', '.join(report['problems'][:5])}); pass --force to promote anyway")
+            
+            from banking.account_table import AccountTable
+            users_data = AccountTable.load_users()  # Rebuilds the table if it is behind users.json
+            self.state.update(role='primary', promoted_at=FileHandler.get_current_timestamp())
+            self._save_state()
+            FileHandler.read_only = False
+        report.update(applied_seq=self.state['applied_seq'], accounts=len(users_data),
+                      promoted_at=self.state['promoted_at'])
+        return report
@@ -0,0 +1,186 @@
+"""
+Snapshots - Pinned, read-only versions of the users file for long-running readers
+"""
+
+import glob
+import json
+import os
+import shutil
+import threading
+import time
+from utils.file_handler import FileHandler
+from utils.metrics import metrics, STORAGE_BYTES_READ, STORAGE_SECONDS
+
+SNAPSHOTS_ACTIVE = metrics.gauge(
+    'securebank_snapshots_active', "Users-file versions currently pinned by readers in this process")
+SNAPSHOTS_OPENED = metrics.counter(
+    'securebank_snapshots_opened_total', "Snapshot reads started")
+
+class Snapshot:
+    """One reader's handle on a pinned version; the parsed data is shared and must not be modified"""
+    
+    def __init__(self, manager, version):
+        self.manager = manager
+        self.version = version
+        self.closed = False
+    
+    def users(self):
+        """All accounts as of this version"""
+        return self.manager._users(self.version)
+    
+    def close(self):
+        """Unpin; the version's file and memory go once no reader holds it"""
+        if not self.closed:
+            self.closed = True
+            self.manager._release(self.version)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class SnapshotManager:
+    """Multi-version reads on top of the writers' atomic rename
+
+    Every save_users() commits a new file and renames it over users.json, so each
+    committed version is a separate, never-modified file. A reader pins the current
+    version by hard-linking it into data/snapshots/ (no copy), after which writers
+    keep committing without waiting for it. Readers of the same version in one
+    process share a single parsed copy. When the last reader of a version closes,
+    its link is removed and the old version is gone; links left by crashed
+    processes are collected by gc().
+    """
+    
+    SNAPSHOT_DIR = "snapshots"
+    
+    _instance = None
+    
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SnapshotManager, cls).__new__(cls)
+            cls._instance.lock = threading.Lock()
+            cls._instance.pins = {}  # version -> {'path', 'readers', 'users'}
+        return cls._instance
+    
+    def open(self):
+        """Pin the current committed version and return a Snapshot for it"""
+        directory = self.directory()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        if not self.pins:
+            self.gc()
+        if not os.path.exists(FileHandler.USERS_FILE):
+            FileHandler.save_users({})
+        
+        # Link first and read the version from the link, so a rename in between cannot mismatch them
+        temp_path = os.path.join(directory, f".pin-{os.getpid()}-{threading.get_ident()}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        try:
+            os.link(FileHandler.USERS_FILE, temp_path)
+        except OSError:
+            shutil.copyfile(FileHandler.USERS_FILE, temp_path)  # No hard links on this filesystem
+        stat = os.stat(temp_path)
+        version = f"{stat.st_ino}-{stat.st_mtime_ns}"
+        
+        with self.lock:
+            pin = self.pins.get(version)
+            if pin:
+                os.remove(temp_path)
+            else:
+                path = os.path.join(directory, f"users-{version}.{os.getpid()}.json")
+                os.replace(temp_path, path)
+                pin = self.pins[version] = {'path': path, 'readers': 0, 'users': None}
+            pin['readers'] += 1
+            SNAPSHOTS_ACTIVE.set(len(self.pins))
+        SNAPSHOTS_OPENED.inc()
+        return Snapshot(self, version)
+    
+    def _users(self, version):
+        """Parse a pinned version once per process"""
+        with self.lock:
+            pin = self.pins[version]
+            if pin['users'] is None:
+                started = time.perf_counter()
+                with open(pin['path'], 'r') as f:
+                    content = f.read()
+                STORAGE_BYTES_READ.inc(len(content))
+                pin['users'] = json.loads(content) if content.strip() else {}
+                STORAGE_SECONDS.labels('snapshot').observe(time.perf_counter() - started)
+            return pin['users']
+    
+    def _release(self, version):
+        """Drop one reader; the last one removes the pin"""
+        with self.lock:
+            pin = self.pins[version]
+            pin['readers'] -= 1
+            if pin['readers'] <= 0:
+                del self.pins[version]
+                try:
+                    os.remove(pin['path'])
+                except OSError:
+                    pass
+            SNAPSHOTS_ACTIVE.set(len(self.pins))
+    
+    def gc(self):
+        """Remove pins left behind by processes that have exited; returns how many were removed"""
+        removed = 0
+        for path in glob.glob(os.path.join(self.directory(), "*")) + glob.glob(
+                os.path.join(self.directory(), ".pin-*")):
+            name = os.path.basename(path)
+            try:
+                pid = int(name.split('-')[1]) if name.startswith('.pin-') else int(name.split('.')[-2])
+            except (IndexError, ValueError):
+                continue
+            if pid == os.getpid() or self._alive(pid):
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+    
+    def active(self):
+        """Versions pinned in this process and their reader counts"""
+        with self.lock:
+            return {version: pin['readers'] for version, pin in self.pins.items()}
+    
+    def directory(self):
+        """Snapshot directory inside the current data directory"""
+        return os.path.join(FileHandler.DATA_DIR, self.SNAPSHOT_DIR)
+    
+    @staticmethod
+    def _alive(pid):
+        """Whether a process id is still running, without signalling it"""
+        if os.name == 'nt':
+            # os.kill on Windows calls TerminateProcess for any signal other than the console events
+            return SnapshotManager._alive_windows(pid)
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            return True  # Exists but belongs to someone else
+        return True
+    
+    @staticmethod
+    def _alive_windows(pid):
+        """Whether a process id is still running, asked through OpenProcess/GetExitCodeProcess"""
+        import ctypes
+        from ctypes import wintypes
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        ERROR_ACCESS_DENIED = 5
+        STILL_ACTIVE = 259
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return ctypes.get_last_error() == ERROR_ACCESS_DENIED  # Exists but belongs to someone else
+        try:
+            code = wintypes.DWORD()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return True
+            return code.value == STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)